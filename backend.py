@@ -1,17 +1,114 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
+from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
 import os
+import asyncio
+import functools
+import contextvars
 import json
-import random
+import base64
+import hashlib
+import time
 from pathlib import Path
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 from pydantic import BaseModel
 
-app = FastAPI()
+from catalog import LibraryCatalog, DEFAULT_SEED
+import library_db
+import comment_store
+import thumbnails
+import media_response
+import response_cache
+import request_metrics
+from media_response import MediaFileResponse
+from request_metrics import phase
+from response_cache import ResponseCache
 
 # Configuration
 VIDEOS_DIR = "videos"
+CATALOG_POLL_INTERVAL = 5.0  # Seconds between mtime polls when filesystem events aren't available
+COMMENTS_PAGE_SIZE = 20
+REPLIES_PAGE_SIZE = 20
+MAX_COMMENTS_PAGE_SIZE = 100
+COMMENTS_STREAM_CHUNK = 10  # Comments read per chunk when streaming JSON Lines
+
+MAX_THUMBNAILS_PER_REQUEST = 100
+
+# Blocking work runs on small dedicated pools so slow disk in one area can't
+# starve the others (or the event loop, which only ever does in-memory work)
+COMMENT_WORKERS = 4
+MEDIA_WORKERS = 8  # Thumbnail reads and video stats
+SEARCH_WORKERS = 4  # Each keeps its own SQLite connection
+THUMBNAIL_JOBS = 2  # ffmpeg processes for thumbnails that were never generated
+THUMBNAIL_CACHE_CONTROL = "public, max-age=86400"  # Revalidated with the ETag after a day
+
+# Rendered JSON for content, comments and video info; memory LRU in front of diskcache
+RESPONSE_CACHE_BYTES = 64 * 1024 * 1024
+RESPONSE_CACHE_DISK_BYTES = 512 * 1024 * 1024
+
+# Plays are kept in memory and written to the access log in library.db, which
+# yt.py's disk budget uses to keep recently watched videos
+PLAY_DEDUPE_SECONDS = 1800  # Requests for the same video within this of the last one are the same play
+PLAY_FLUSH_INTERVAL = 30.0
+
+# Set to a directory to let ?profile=1 on /api/content and /api/comments/{id} write a stack profile there
+PROFILE_DIR = os.environ.get("BACKEND_PROFILE_DIR")
+
+# Shown for videos whose thumbnail hasn't been generated yet
+PLACEHOLDER_THUMBNAIL = (
+    '<svg xmlns="http://www.w3.org/2000/svg" width="320" height="180" viewBox="0 0 320 180">'
+    '<rect width="320" height="180" fill="#272727"/>'
+    '<path d="M140 65v50l42-25z" fill="#717171"/></svg>'
+)
+
+# Built once at startup and kept current by the watcher; endpoints never rescan the tree
+catalog = LibraryCatalog(VIDEOS_DIR, poll_interval=CATALOG_POLL_INTERVAL)
+
+# Created for the lifetime of the app
+comments_executor = media_executor = search_executor = None
+responses = None
+
+# video_id -> (last_played, plays) not yet written, and when each video was last requested
+pending_plays = {}
+last_requested = {}
+
+# Thumbnails being generated in the background, and the limit on concurrent ffmpeg runs
+thumbnail_jobs = set()
+thumbnail_slots = None
+
+# video_id -> (mtime_ns, size) of media ffmpeg couldn't grab a frame from; not retried until the file changes
+failed_thumbnails = {}
+
+# Served at /metrics
+metrics = request_metrics.RequestMetrics()
+profiler = request_metrics.RequestProfiler(PROFILE_DIR)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global comments_executor, media_executor, search_executor, thumbnail_slots, responses
+    comments_executor = ThreadPoolExecutor(max_workers=COMMENT_WORKERS, thread_name_prefix="comments")
+    media_executor = ThreadPoolExecutor(max_workers=MEDIA_WORKERS, thread_name_prefix="media")
+    search_executor = ThreadPoolExecutor(max_workers=SEARCH_WORKERS, thread_name_prefix="search")
+    thumbnail_slots = asyncio.Semaphore(THUMBNAIL_JOBS)
+    
+    catalog.build()
+    catalog.start_watcher()
+    responses = ResponseCache(RESPONSE_CACHE_BYTES, os.path.join(VIDEOS_DIR, response_cache.CACHE_DIRNAME),
+                              RESPONSE_CACHE_DISK_BYTES)
+    responses.open(catalog.generation)
+    flusher = asyncio.create_task(flush_plays_periodically())
+    yield
+    flusher.cancel()
+    await flush_plays()
+    for executor in (comments_executor, media_executor, search_executor):
+        executor.shutdown(wait=True, cancel_futures=True)
+    catalog.stop_watcher()
+    responses.close()
+
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(request_metrics.MetricsMiddleware, metrics=metrics)
 
 class VideoItem(BaseModel):
     video_id: str
@@ -30,84 +127,6 @@ def get_video_thumbnail(video_path: str) -> str:
     # In a real scenario, we might extract actual thumbnails
     return "/static/placeholder.jpg"
 
-def get_all_videos() -> List[Dict[str, Any]]:
-    """Scan videos folder and return all videos with metadata"""
-    videos = []
-    
-    # Process channel directories
-    for channel_dir in os.listdir(VIDEOS_DIR):
-        channel_path = os.path.join(VIDEOS_DIR, channel_dir)
-        if not os.path.isdir(channel_path):
-            continue
-        
-        # Check videos folder
-        videos_folder = os.path.join(channel_path, "videos")
-        if os.path.exists(videos_folder):
-            for video_file in os.listdir(videos_folder):
-                if video_file.endswith(('.mp4', '.mkv', '.webm')):
-                    # Extract video_id from filename: "Title [video_id].ext"
-                    base_name = os.path.splitext(video_file)[0]
-                    
-                    # Try to extract video ID from brackets
-                    if '[' in base_name and ']' in base_name:
-                        video_id = base_name.split('[')[-1].rstrip(']').strip()
-                    else:
-                        video_id = base_name
-                    
-                    # Look for meta.json file
-                    meta_file = os.path.join(channel_path, "comments", video_id, "meta.json")
-                    
-                    if os.path.exists(meta_file):
-                        try:
-                            with open(meta_file, 'r', encoding='utf-8') as f:
-                                meta = json.load(f)
-                                videos.append({
-                                    "video_id": meta.get("video_id", video_id),
-                                    "title": meta.get("title", base_name),
-                                    "channel": meta.get("channel") or channel_dir,
-                                    "duration": meta.get("duration", 0),
-                                    "type": "video",
-                                    "file_path": os.path.join(channel_dir, "videos", video_file),
-                                    "comments_path": os.path.join(channel_dir, "comments", video_id)
-                                })
-                        except:
-                            pass
-        
-        # Check shorts folder
-        shorts_folder = os.path.join(channel_path, "shorts")
-        if os.path.exists(shorts_folder):
-            for video_file in os.listdir(shorts_folder):
-                if video_file.endswith(('.mp4', '.mkv', '.webm')):
-                    # Extract video_id from filename: "Title [video_id].ext"
-                    base_name = os.path.splitext(video_file)[0]
-                    
-                    # Try to extract video ID from brackets
-                    if '[' in base_name and ']' in base_name:
-                        video_id = base_name.split('[')[-1].rstrip(']').strip()
-                    else:
-                        video_id = base_name
-                    
-                    # Look for meta.json file
-                    meta_file = os.path.join(channel_path, "comments", video_id, "meta.json")
-                    
-                    if os.path.exists(meta_file):
-                        try:
-                            with open(meta_file, 'r', encoding='utf-8') as f:
-                                meta = json.load(f)
-                                videos.append({
-                                    "video_id": meta.get("video_id", video_id),
-                                    "title": meta.get("title", base_name),
-                                    "channel": meta.get("channel") or channel_dir,
-                                    "duration": meta.get("duration", 0),
-                                    "type": "shorts",
-                                    "file_path": os.path.join(channel_dir, "shorts", video_file),
-                                    "comments_path": os.path.join(channel_dir, "comments", video_id)
-                                })
-                        except:
-                            pass
-    
-    return videos
-
 class ContentResponse(BaseModel):
     videos: List[VideoItem]
     shorts: List[VideoItem]
@@ -116,242 +135,454 @@ class ContentResponse(BaseModel):
     has_more_videos: bool
     has_more_shorts: bool
 
-@app.get("/api/content")
-def get_content(videos_skip: int = 0, videos_limit: int = 20, shorts_skip: int = 0, shorts_limit: int = 10):
-    """Get all content (videos + shorts) with pagination in a single request"""
-    all_content = get_all_videos()
-    
-    # Separate videos and shorts
-    all_videos_list = [v for v in all_content if v['type'] == 'video']
-    all_shorts_list = [v for v in all_content if v['type'] == 'shorts']
-    
-    # Randomize with consistent seed
-    random.seed(42)
-    random.shuffle(all_videos_list)
-    random.seed(42)
-    random.shuffle(all_shorts_list)
-    
-    # Paginate videos
-    paginated_videos = all_videos_list[videos_skip:videos_skip + videos_limit]
-    # Paginate shorts
-    paginated_shorts = all_shorts_list[shorts_skip:shorts_skip + shorts_limit]
-    
+async def run_in(executor: ThreadPoolExecutor, fn, *args):
+    # In the request's context, so the work's phase time counts against the request
+    context = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(executor, functools.partial(context.run, fn, *args))
+
+def find_video(video_id: str) -> Optional[Dict[str, Any]]:
+    """Catalog lookup, counted as a hit or a miss"""
+    video = catalog.get(video_id)
+    metrics.count("catalog", "hit" if video else "miss")
+    return video
+
+def record_play(video_id: str):
+    """Count a request for a video as a play unless it continues a recent one (seeks are Range requests)"""
+    now = int(time.time())
+    previous = last_requested.get(video_id)
+    last_requested[video_id] = now
+    count = 1 if previous is None or now - previous > PLAY_DEDUPE_SECONDS else 0
+    _, plays = pending_plays.get(video_id, (now, 0))
+    pending_plays[video_id] = (now, plays + count)
+
+def write_plays(plays: Dict[str, Any]):
+    """Add plays to the access log; runs on the media executor"""
+    if not plays:
+        return
+    conn = library_db.connect(VIDEOS_DIR)
+    try:
+        library_db.record_plays(conn, plays)
+    except Exception as e:
+        print(f"Could not record {len(plays)} plays: {e}")
+    finally:
+        conn.close()
+
+async def flush_plays():
+    global pending_plays
+    # Swapped on the loop, where record_play runs, so no play is lost or counted twice
+    plays, pending_plays = pending_plays, {}
+    await run_in(media_executor, write_plays, plays)
+
+async def flush_plays_periodically():
+    while True:
+        await asyncio.sleep(PLAY_FLUSH_INTERVAL)
+        await flush_plays()
+
+async def shuffled(content_type: Optional[str], seed: Optional[int]) -> List[Dict[str, Any]]:
+    """Catalog order for seed; only the first request per library version pays for the shuffle, off the loop"""
+    seed = DEFAULT_SEED if seed is None else seed
+    order = catalog.cached_shuffle(content_type, seed)
+    metrics.count("shuffle", "hit" if order is not None else "miss")
+    if order is None:
+        order = await run_in(media_executor, catalog.shuffled, content_type, seed)
+    return order
+
+def video_item(v: Dict[str, Any]) -> Dict[str, Any]:
+    """A VideoItem as a plain dict, so pages serialize without model validation"""
     return {
-        "videos": [VideoItem(
-            video_id=v['video_id'],
-            title=v['title'],
-            channel=v['channel'],
-            duration=v['duration'],
-            thumbnail_path="/static/placeholder.jpg",
-            type=v['type']
-        ) for v in paginated_videos],
-        "shorts": [VideoItem(
-            video_id=v['video_id'],
-            title=v['title'],
-            channel=v['channel'],
-            duration=v['duration'],
-            thumbnail_path="/static/placeholder.jpg",
-            type=v['type']
-        ) for v in paginated_shorts],
-        "total_videos": len(all_videos_list),
-        "total_shorts": len(all_shorts_list),
-        "has_more_videos": videos_skip + videos_limit < len(all_videos_list),
-        "has_more_shorts": shorts_skip + shorts_limit < len(all_shorts_list)
+        "video_id": v['video_id'],
+        "title": v['title'],
+        "channel": v['channel'],
+        "duration": v['duration'],
+        "thumbnail_path": "/static/placeholder.jpg",
+        "type": v['type']
     }
 
+async def cached_json(request: Request, build) -> Response:
+    """Serve the JSON from build() through the response cache, with ETag revalidation
+    
+    Keys include the catalog generation, so anything the downloader writes to
+    the library (a finished channel, cleanup) makes the next request rebuild.
+    """
+    key = response_cache.make_key(catalog.generation, request.url.path, request.query_params.multi_items())
+    # A profile should show the work behind the response, not a cache hit
+    fresh = profiler.requested(request)
+    entry = None if fresh else responses.get(key)
+    result = "memory"
+    if entry is None and responses.disk is not None and not fresh:
+        entry = await run_in(media_executor, responses.load, key)
+        result = "disk"
+    if entry is None:
+        payload = await build()
+        with phase("serialize"):
+            entry = response_cache.encode(payload)
+        responses.put(key, entry)
+        if responses.disk is not None:
+            media_executor.submit(responses.store, key, entry)
+        result = "miss"
+    metrics.count("response", result)
+
+    body, etag = entry
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if media_response.etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type="application/json", headers=headers)
+
+@app.get("/api/content")
+@profiler.profile
+async def get_content(request: Request, videos_skip: int = 0, videos_limit: int = 20, shorts_skip: int = 0,
+                      shorts_limit: int = 10, seed: Optional[int] = None):
+    """Get all content (videos + shorts) with pagination in a single request"""
+    async def build():
+        # Shuffled once per library version and seed bucket; a page is just a slice
+        all_videos_list = await shuffled('video', seed)
+        all_shorts_list = await shuffled('shorts', seed)
+        
+        # Paginate videos
+        paginated_videos = all_videos_list[videos_skip:videos_skip + videos_limit]
+        # Paginate shorts
+        paginated_shorts = all_shorts_list[shorts_skip:shorts_skip + shorts_limit]
+        
+        return {
+            "videos": [video_item(v) for v in paginated_videos],
+            "shorts": [video_item(v) for v in paginated_shorts],
+            "total_videos": len(all_videos_list),
+            "total_shorts": len(all_shorts_list),
+            "has_more_videos": videos_skip + videos_limit < len(all_videos_list),
+            "has_more_shorts": shorts_skip + shorts_limit < len(all_shorts_list)
+        }
+    return await cached_json(request, build)
+
 @app.get("/api/videos", response_model=List[VideoItem])
-def get_videos(skip: int = 0, limit: int = 20):
+async def get_videos(request: Request, skip: int = 0, limit: int = 20, seed: Optional[int] = None):
     """Get videos with pagination (randomized)"""
-    all_videos = get_all_videos()
-    all_videos = [v for v in all_videos if v['type'] == 'video']
-    
-    # Randomize once and cache could be done, but for simplicity:
-    random.seed(42)  # Consistent randomization across requests
-    random.shuffle(all_videos)
-    
-    paginated = all_videos[skip:skip + limit]
-    return [VideoItem(
-        video_id=v['video_id'],
-        title=v['title'],
-        channel=v['channel'],
-        duration=v['duration'],
-        thumbnail_path="/static/placeholder.jpg",
-        type=v['type']
-    ) for v in paginated]
+    async def build():
+        all_videos = await shuffled('video', seed)
+        return [video_item(v) for v in all_videos[skip:skip + limit]]
+    return await cached_json(request, build)
 
 @app.get("/api/shorts", response_model=List[VideoItem])
-def get_shorts(skip: int = 0, limit: int = 10):
+async def get_shorts(request: Request, skip: int = 0, limit: int = 10, seed: Optional[int] = None):
     """Get shorts with pagination (randomized, lazy loading)"""
-    all_videos = get_all_videos()
-    all_videos = [v for v in all_videos if v['type'] == 'shorts']
-    
-    # Randomize once and cache could be done, but for simplicity:
-    random.seed(42)
-    random.shuffle(all_videos)
-    
-    paginated = all_videos[skip:skip + limit]
-    return [VideoItem(
-        video_id=v['video_id'],
-        title=v['title'],
-        channel=v['channel'],
-        duration=v['duration'],
-        thumbnail_path="/static/placeholder.jpg",
-        type=v['type']
-    ) for v in paginated]
+    async def build():
+        all_videos = await shuffled('shorts', seed)
+        return [video_item(v) for v in all_videos[skip:skip + limit]]
+    return await cached_json(request, build)
 
 @app.get("/api/videos/search", response_model=List[VideoItem])
-def search_videos(query: str = "", skip: int = 0, limit: int = 20):
+async def search_videos(request: Request, query: str = "", skip: int = 0, limit: int = 20, seed: Optional[int] = None):
     """Search videos, shorts, and channels with pagination"""
-    all_videos = get_all_videos()
-    
-    # Filter by query (case-insensitive)
-    query_lower = query.lower()
-    results = [
-        v for v in all_videos
-        if query_lower in v['title'].lower() or query_lower in (v.get('channel') or '').lower()
-    ]
+    async def build():
+        if query.strip():
+            # Ranked full-text matches, prefix matching the words typed so far
+            paginated = await run_in(search_executor, catalog.search, query, limit, skip)
+        else:
+            # No query browses everything in the same stable order as the feed
+            all_videos = await shuffled(None, seed)
+            paginated = all_videos[skip:skip + limit]
+        return [video_item(v) for v in paginated]
+    return await cached_json(request, build)
+
+def stat_thumbnail(video_id: str, width: int):
+    """(path, stat) of the stored thumbnail closest to width, or None"""
+    with phase("scan"):
+        thumb_path = thumbnails.find_thumbnail(VIDEOS_DIR, video_id, width)
+        if thumb_path:
+            try:
+                return thumb_path, os.stat(thumb_path)
+            except OSError:
+                pass
+    return None
+
+def media_signature(video_file: str):
+    """(mtime_ns, size) of a media file, or None if it's gone"""
+    try:
+        st = os.stat(video_file)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+async def generate_missing_thumbnail(video: Dict[str, Any]):
+    """Grab a frame for a video that arrived without a thumbnail (e.g. copied in by hand)"""
+    video_id = video['video_id']
+    try:
+        video_file = os.path.join(VIDEOS_DIR, video['file_path'])
+        signature = await run_in(media_executor, media_signature, video_file)
+        # A corrupt or unreadable file would otherwise cost an ffmpeg run (up to its timeout) per request
+        if signature is None or failed_thumbnails.get(video_id) == signature:
+            return
+        async with thumbnail_slots:
+            if await thumbnails.generate_thumbnail_async(VIDEOS_DIR, video_id, video_file):
+                failed_thumbnails.pop(video_id, None)
+                media_executor.submit(write_thumbnail_sizes, video)
+            else:
+                failed_thumbnails[video_id] = signature
+                print(f"Could not generate thumbnail for {video_id}; not trying again until the file changes")
+    finally:
+        thumbnail_jobs.discard(video_id)
+
+def write_thumbnail_sizes(video: Dict[str, Any]):
+    """Count a generated thumbnail in the library's disk usage; runs on the media executor"""
+    conn = library_db.connect(VIDEOS_DIR)
+    try:
+        library_db.track_files(conn, video['channel_dir'], video['video_id'], "thumbnails",
+                               thumbnails.thumbnail_sizes(VIDEOS_DIR, video['video_id']))
+    except Exception as e:
+        print(f"Could not record thumbnail sizes for {video['video_id']}: {e}")
+    finally:
+        conn.close()
+
+def schedule_thumbnail(video: Dict[str, Any]):
+    if video['video_id'] in thumbnail_jobs or thumbnail_slots is None:
+        return
+    thumbnail_jobs.add(video['video_id'])
+    asyncio.get_running_loop().create_task(generate_missing_thumbnail(video))
+
+@app.get("/api/thumbnail/{video_id}")
+async def get_video_thumbnail(video_id: str, width: int = thumbnails.THUMBNAIL_WIDTH):
+    """Serve a stored thumbnail at the closest width, or a placeholder"""
+    video = find_video(video_id)
+    if not video:
+        raise HTTPException(status_code=404, detail="Video not found")
     
-    # Randomize for variety
-    random.seed(42)
-    random.shuffle(results)
+    found = await run_in(media_executor, stat_thumbnail, video_id, width)
+    if found:
+        thumb_path, st = found
+        return MediaFileResponse(thumb_path, stat_result=st, media_type="image/jpeg",
+                                 headers={"Cache-Control": THUMBNAIL_CACHE_CONTROL})
     
-    # Paginate
-    paginated = results[skip:skip + limit]
-    return [VideoItem(
-        video_id=v['video_id'],
-        title=v['title'],
-        channel=v['channel'],
-        duration=v['duration'],
-        thumbnail_path="/static/placeholder.jpg",
-        type=v['type']
-    ) for v in paginated]
+    # Never decode video on the request path; the real thumbnail shows up on a later request
+    schedule_thumbnail(video)
+    return Response(PLACEHOLDER_THUMBNAIL, media_type="image/svg+xml", headers={"Cache-Control": "no-cache"})
 
-@app.get("/api/thumbnail/{video_id}")
-def get_video_thumbnail(video_id: str):
-    """Get video thumbnail - extract frame from video"""
-    import subprocess
-    import tempfile
+def load_thumbnails(video_ids: List[str], width: int, if_none_match: Optional[str]):
+    """Build the /api/thumbnails response; runs on the media executor"""
+    # The ETag covers every file's validator, so a page is revalidated with stats alone
+    found = {}
+    digest = hashlib.sha1(str(thumbnails.closest_width(width)).encode())
+    for video_id in video_ids:
+        thumb = stat_thumbnail(video_id, width) if find_video(video_id) else None
+        validator = "-"
+        if thumb:
+            found[video_id] = thumb[0]
+            validator = media_response.file_etag(thumb[1])
+        digest.update(f"{video_id}={validator};".encode())
+    etag = f'"{digest.hexdigest()}"'
     
-    all_videos = get_all_videos()
+    # Pages that still have placeholders must be refetched once thumbnails appear
+    cache_control = THUMBNAIL_CACHE_CONTROL if len(found) == len(video_ids) else "no-cache"
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if media_response.etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
     
-    for video in all_videos:
-        if video['video_id'] == video_id:
-            file_path = os.path.join(VIDEOS_DIR, video['file_path'])
-            if os.path.exists(file_path):
-                # Create thumbnails directory if it doesn't exist
-                thumbnails_dir = os.path.join(VIDEOS_DIR, "thumbnails")
-                os.makedirs(thumbnails_dir, exist_ok=True)
-                
-                # Check if thumbnail already exists
-                thumbnail_path = os.path.join(thumbnails_dir, f"{video_id}.jpg")
-                
-                if not os.path.exists(thumbnail_path):
-                    # Generate thumbnail using ffmpeg at 1 second mark
-                    try:
-                        subprocess.run([
-                            'ffmpeg',
-                            '-ss', '1',  # Seek to 1 second
-                            '-i', file_path,
-                            '-vframes', '1',  # Extract 1 frame
-                            '-vf', 'scale=320:-1',  # Scale to width 320, keep aspect ratio
-                            '-y',  # Overwrite if exists
-                            thumbnail_path
-                        ], check=True, capture_output=True, timeout=10)
-                    except (subprocess.CalledProcessError, subprocess.TimeoutExpired, FileNotFoundError):
-                        # If ffmpeg fails or doesn't exist, return a placeholder
-                        # Create a simple placeholder image
-                        raise HTTPException(status_code=404, detail="Could not generate thumbnail")
-                
-                return FileResponse(thumbnail_path, media_type="image/jpeg")
+    images = {}
+    for video_id in video_ids:
+        images[video_id] = None
+        if video_id in found:
+            try:
+                with phase("scan"):
+                    with open(found[video_id], 'rb') as f:
+                        data = f.read()
+                with phase("serialize"):
+                    images[video_id] = "data:image/jpeg;base64," + base64.b64encode(data).decode('ascii')
+            except OSError:
+                pass
     
-    raise HTTPException(status_code=404, detail="Video not found")
+    with phase("serialize"):
+        return JSONResponse({"width": thumbnails.closest_width(width), "thumbnails": images}, headers=headers)
 
-@app.get("/api/video/{video_id}")
-def get_video_file(video_id: str):
-    """Get video file stream"""
-    all_videos = get_all_videos()
-    
-    for video in all_videos:
-        if video['video_id'] == video_id:
-            file_path = os.path.join(VIDEOS_DIR, video['file_path'])
-            if os.path.exists(file_path):
-                return FileResponse(file_path, media_type="video/mp4")
+@app.get("/api/thumbnails")
+async def get_thumbnails(ids: str, request: Request, width: int = thumbnails.THUMBNAIL_WIDTH):
+    """Thumbnails for a page of cards in one response, as data URIs (null where there is none yet)"""
+    video_ids = [video_id for video_id in ids.split(",") if video_id][:MAX_THUMBNAILS_PER_REQUEST]
+    return await run_in(media_executor, load_thumbnails, video_ids, width, request.headers.get("if-none-match"))
+
+@app.api_route("/api/video/{video_id}", methods=["GET", "HEAD"])
+async def get_video_file(video_id: str, request: Request):
+    """Stream a video with Range/If-Range, conditional 304s and its container's MIME type"""
+    video = find_video(video_id)
+    if video:
+        if request.method == "GET":
+            record_play(video_id)
+        file_path = os.path.join(VIDEOS_DIR, video['file_path'])
+        try:
+            with phase("scan"):
+                st = await run_in(media_executor, os.stat, file_path)
+            return MediaFileResponse(file_path, stat_result=st)
+        except FileNotFoundError:
+            pass
     
     raise HTTPException(status_code=404, detail="Video not found")
 
-@app.get("/api/comments/{video_id}")
-def get_comments(video_id: str) -> Dict[str, Any]:
-    """Get comments for a video"""
-    all_videos = get_all_videos()
-    
+def normalize_comment(comment: Dict[str, Any]) -> Dict[str, Any]:
+    """Normalize field names"""
+    if 'likes' in comment and 'like_count' not in comment:
+        comment['like_count'] = comment['likes']
+    return comment
+
+def parse_cursor(cursor: Optional[str]) -> int:
+    """Cursors are the position of the next item, as returned in next_cursor"""
+    if not cursor:
+        return 0
+    try:
+        position = int(cursor)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if position < 0:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return position
+
+def find_comments_path(video_id: str) -> str:
     comments_path = None
-    for video in all_videos:
-        if video['video_id'] == video_id:
-            # comments_path is already the full path from get_all_videos
-            comments_path = os.path.join(VIDEOS_DIR, video['comments_path'])
-            break
+    video = find_video(video_id)
+    if video:
+        comments_path = os.path.join(VIDEOS_DIR, video['comments_path'])
     
-    if not comments_path or not os.path.exists(comments_path):
+    with phase("scan"):
+        exists = comments_path is not None and os.path.exists(comments_path)
+    if not exists:
         print(f"Comments not found for {video_id}, path was: {comments_path}")
         raise HTTPException(status_code=404, detail="Comments not found")
-    
-    # Load comments from top/ directory
+    return comments_path
+
+def read_comment_page(store, start: int, limit: int) -> List[Dict[str, Any]]:
+    """Top-level comments [start, start + limit) with their reply counts"""
     comments = []
-    top_dir = os.path.join(comments_path, "top")
-    replies_dir = os.path.join(comments_path, "replies")
+    with phase("parse"):
+        for i, comment in enumerate(store.comments(start, limit)):
+            comment = normalize_comment(comment)
+            comment['reply_count'] = store.reply_count(start + i)
+            comments.append(comment)
+    return comments
+
+async def stream_comment_lines(comments_path: str, start: int, end: int):
+    """Yield top-level comments as JSON Lines, one page read at a time on the comments executor"""
+    store = await run_in(comments_executor, open_comments, comments_path)
+    try:
+        for page_start in range(start, end, COMMENTS_STREAM_CHUNK):
+            page_limit = min(COMMENTS_STREAM_CHUNK, end - page_start)
+            page = await run_in(comments_executor, read_comment_page, store, page_start, page_limit)
+            with phase("serialize"):
+                lines = "".join(json.dumps(comment, ensure_ascii=False) + "\n" for comment in page)
+            yield lines
+    finally:
+        store.close()
+
+def open_comments(comments_path: str):
+    """comment_store.open_comments, which reads the file's index, counted as a scan"""
+    with phase("scan"):
+        return comment_store.open_comments(comments_path)
+
+def load_comments(video_id: str, start: int, limit: int, stream: bool):
+    """Page of top-level comments, or just the totals when streaming; runs on the comments executor"""
+    comments_path = find_comments_path(video_id)
+    with open_comments(comments_path) as store:
+        total = store.top_count
+        end = min(total, start + limit)
+        comments = [] if stream else read_comment_page(store, start, end - start)
+    return comments_path, comments, total, end
+
+@app.get("/api/comments/{video_id}")
+@profiler.profile
+async def get_comments(request: Request, video_id: str, cursor: Optional[str] = None, limit: int = COMMENTS_PAGE_SIZE,
+                       format: str = "json"):
+    """Get a page of top-level comments for a video; replies are fetched separately
     
-    if os.path.exists(top_dir):
-        comment_files = sorted(os.listdir(top_dir))
-        for comment_file in comment_files:
-            if comment_file.endswith('.json'):
-                try:
-                    with open(os.path.join(top_dir, comment_file), 'r', encoding='utf-8') as f:
-                        comment = json.load(f)
-                        comment_id = comment.get('id')
-                        
-                        # Normalize field names
-                        if 'likes' in comment and 'like_count' not in comment:
-                            comment['like_count'] = comment['likes']
-                        
-                        # Load replies if they exist
-                        replies = []
-                        if os.path.exists(replies_dir):
-                            comment_replies_dir = os.path.join(replies_dir, f"c_{comment_file.split('_')[1].split('.')[0]}")
-                            if os.path.exists(comment_replies_dir):
-                                reply_files = sorted(os.listdir(comment_replies_dir))
-                                for reply_file in reply_files:
-                                    if reply_file.endswith('.json'):
-                                        try:
-                                            with open(os.path.join(comment_replies_dir, reply_file), 'r', encoding='utf-8') as rf:
-                                                reply = json.load(rf)
-                                                # Normalize field names for replies too
-                                                if 'likes' in reply and 'like_count' not in reply:
-                                                    reply['like_count'] = reply['likes']
-                                                replies.append(reply)
-                                        except:
-                                            pass
-                        
-                        comment['replies'] = replies
-                        comments.append(comment)
-                except:
-                    pass
+    format=jsonl streams the page as JSON Lines with the next cursor in the X-Next-Cursor header.
+    """
+    start = parse_cursor(cursor)
+    limit = max(0, min(limit, MAX_COMMENTS_PAGE_SIZE))
     
-    return {
-        "video_id": video_id,
-        "comments": comments
-    }
+    if format == "jsonl":
+        comments_path, _, total, end = await run_in(comments_executor, load_comments, video_id, start, limit, True)
+        headers = {"X-Total-Count": str(total)}
+        if end < total:
+            headers["X-Next-Cursor"] = str(end)
+        return StreamingResponse(stream_comment_lines(comments_path, start, end),
+                                 media_type="application/x-ndjson", headers=headers)
+    
+    async def build():
+        _, comments, total, end = await run_in(comments_executor, load_comments, video_id, start, limit, False)
+        return {
+            "video_id": video_id,
+            "comments": comments,
+            "total": total,
+            "next_cursor": str(end) if end < total else None
+        }
+    return await cached_json(request, build)
+
+def load_replies(video_id: str, comment_id: str, start: int, limit: int):
+    comments_path = find_comments_path(video_id)
+    with open_comments(comments_path) as store:
+        index = store.index_of(comment_id)
+        if index is None:
+            raise HTTPException(status_code=404, detail="Comment not found")
+        total = store.reply_count(index)
+        with phase("parse"):
+            replies = [normalize_comment(reply) for reply in store.replies(index, start, limit)]
+    return replies, total
+
+@app.get("/api/comments/{video_id}/{comment_id}/replies")
+async def get_comment_replies(request: Request, video_id: str, comment_id: str, cursor: Optional[str] = None,
+                              limit: int = REPLIES_PAGE_SIZE):
+    """Get a page of replies to one top-level comment"""
+    start = parse_cursor(cursor)
+    limit = max(0, min(limit, MAX_COMMENTS_PAGE_SIZE))
+    
+    async def build():
+        replies, total = await run_in(comments_executor, load_replies, video_id, comment_id, start, limit)
+        end = start + len(replies)
+        return {
+            "video_id": video_id,
+            "comment_id": comment_id,
+            "replies": replies,
+            "total": total,
+            "next_cursor": str(end) if end < total else None
+        }
+    return await cached_json(request, build)
 
 @app.get("/api/video-info/{video_id}")
-def get_video_info(video_id: str) -> Dict[str, Any]:
+async def get_video_info(request: Request, video_id: str) -> Dict[str, Any]:
     """Get video metadata"""
-    all_videos = get_all_videos()
-    
-    for video in all_videos:
-        if video['video_id'] == video_id:
+    video = find_video(video_id)
+    if video:
+        async def build():
             return video
+        return await cached_json(request, build)
     
     raise HTTPException(status_code=404, detail="Video not found")
 
+def load_stats() -> Dict[str, Any]:
+    """Disk usage per channel and in total; runs on the search executor"""
+    channels = []
+    total = {f"{kind}_bytes": 0 for kind in library_db.STORAGE_KINDS}
+    for channel_dir, kinds in catalog.storage().items():
+        channel = {"channel": channel_dir, "videos": kinds.get("media", {}).get("files", 0)}
+        for kind in library_db.STORAGE_KINDS:
+            channel[f"{kind}_bytes"] = kinds.get(kind, {}).get("bytes", 0)
+            total[f"{kind}_bytes"] += channel[f"{kind}_bytes"]
+        channel["total_bytes"] = sum(channel[f"{kind}_bytes"] for kind in library_db.STORAGE_KINDS)
+        channels.append(channel)
+    total["videos"] = sum(channel["videos"] for channel in channels)
+    total["total_bytes"] = sum(total[f"{kind}_bytes"] for kind in library_db.STORAGE_KINDS)
+    return {"channels": channels, "total": total}
+
+@app.get("/api/stats")
+async def get_stats():
+    """Disk usage per channel (media, comments, thumbnails), kept up to date as files are written"""
+    return JSONResponse(await run_in(search_executor, load_stats), headers={"Cache-Control": "no-cache"})
+
+@app.get("/metrics")
+async def get_metrics():
+    """Latency, bytes and phase time per route and cache hit rates, in Prometheus text format"""
+    gauges = [
+        ("catalog_items", "Videos and shorts in the catalog", len(catalog)),
+        ("catalog_generation", "Library generation the catalog has applied", catalog.generation),
+        ("response_cache_entries", "Responses in the memory cache", len(responses)),
+        ("response_cache_bytes", "Bytes of responses in the memory cache", responses.size),
+    ]
+    return Response(metrics.render(gauges), media_type="text/plain; version=0.0.4; charset=utf-8")
+
 # Serve static files
 if not os.path.exists("static"):
     os.makedirs("static")
@@ -0,0 +1,219 @@
+"""Throughput, p50/p99 latency and RSS of backend.py's API, in process, on a synthetic library
+
+Imports the working tree's backend and drives it through httpx's ASGI
+transport, so the numbers are the app's own work with no sockets, server or
+client processes in the way. Each scenario is a session a browser would run:
+paging through /api/content, paging search results, paging a video's
+comments by cursor and Range reads of /api/video. Every content walk uses a
+seed of its own, so the response cache only answers what it would for real
+clients: searches and comment pages someone else already asked for.
+
+    python -m benchmarks.bench_api --channels 50 --videos 200 --shorts-ratio 0.3 --comments 100 --replies 5
+    python -m benchmarks.bench_api --library /tmp/lib --requests 5000 --concurrency 32
+
+--library keeps the generated tree in that directory and reuses it on the
+next run with the same directory, so large libraries are only written once
+(its response cache is cleared first, so no run starts warm).
+"""
+import os
+import sys
+import time
+import random
+import asyncio
+import argparse
+import shutil
+import resource
+import tempfile
+
+import httpx
+
+from benchmarks.synthetic_library import WORDS, make_library
+from benchmarks.bench_backend_load import percentile
+
+sys.path.insert(0, ".")
+import response_cache
+
+REPO_DIR = os.path.abspath(".")
+
+SCENARIOS = ("content", "search", "comments", "video")
+
+# Page sizes the frontend asks for
+VIDEOS_PAGE = 20
+SHORTS_PAGE = 10
+SEARCH_PAGE = 20
+COMMENTS_PAGE = 20
+RANGE_BYTES = 64 * 1024
+
+
+def rss_mb():
+    """(current, peak) resident set size of this process in MiB"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # KiB on Linux
+    try:
+        with open("/proc/self/statm") as f:
+            current = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except (OSError, ValueError):
+        current = peak
+    return current, peak
+
+
+def content_session(rng):
+    """Scroll the home feed to the end, both rails, with a seed of its own"""
+    seed = rng.randrange(1 << 30)
+    videos_skip = shorts_skip = 0
+    more = True
+    while more:
+        response = yield (f"/api/content?videos_skip={videos_skip}&videos_limit={VIDEOS_PAGE}"
+                          f"&shorts_skip={shorts_skip}&shorts_limit={SHORTS_PAGE}&seed={seed}"), {}
+        page = response.json()
+        more = page["has_more_videos"] or page["has_more_shorts"]
+        videos_skip += VIDEOS_PAGE
+        shorts_skip += SHORTS_PAGE
+
+
+def search_session(rng, pages=5):
+    """Type a query a word at a time, then page through its results"""
+    words = [rng.choice(WORDS) for _ in range(rng.randint(1, 2))]
+    for i, word in enumerate(words):
+        # Prefixes of the last word, the way search-as-you-type sends them
+        for end in range(2, len(word) + 1, 2):
+            response = yield f"/api/videos/search?query={' '.join(words[:i] + [word[:end]])}&limit={SEARCH_PAGE}", {}
+    for page in range(1, pages):
+        if len(response.json()) < SEARCH_PAGE:
+            return
+        response = yield (f"/api/videos/search?query={' '.join(words)}&skip={page * SEARCH_PAGE}"
+                          f"&limit={SEARCH_PAGE}"), {}
+
+
+def comments_session(rng, video_ids):
+    """Open a video's comments and follow the cursor to the last page"""
+    video_id = rng.choice(video_ids)
+    cursor = ""
+    while cursor is not None:
+        response = yield f"/api/comments/{video_id}?limit={COMMENTS_PAGE}" + (f"&cursor={cursor}" if cursor else ""), {}
+        cursor = response.json()["next_cursor"]
+
+
+def video_session(rng, video_ids, media_bytes, seeks=8):
+    """Play a video: the first range, then a few seeks"""
+    video_id = rng.choice(video_ids)
+    for i in range(seeks):
+        start = 0 if i == 0 else rng.randrange(0, max(1, media_bytes - RANGE_BYTES))
+        yield f"/api/video/{video_id}", {"Range": f"bytes={start}-{start + RANGE_BYTES - 1}"}
+
+
+def make_session(scenario, rng, video_ids, media_bytes):
+    if scenario == "content":
+        return content_session(rng)
+    if scenario == "search":
+        return search_session(rng)
+    if scenario == "comments":
+        return comments_session(rng, video_ids)
+    return video_session(rng, video_ids, media_bytes)
+
+
+async def user(http, scenario, rng, video_ids, media_bytes, budget, latencies, errors):
+    """Run sessions back to back until the scenario's request budget is spent"""
+    while budget[0] > 0:
+        session = make_session(scenario, rng, video_ids, media_bytes)
+        response = None
+        try:
+            while budget[0] > 0:
+                path, headers = session.send(response)
+                budget[0] -= 1
+                start = time.perf_counter()
+                response = await http.get(path, headers=headers)
+                latencies.append(time.perf_counter() - start)
+                if response.status_code >= 400:
+                    errors.append(f"{response.status_code} {path}")
+                    break
+        except StopIteration:
+            pass
+
+
+async def run_scenario(http, scenario, video_ids, media_bytes, requests, concurrency, seed):
+    latencies, errors = [], []
+    budget = [requests]
+    start = time.perf_counter()
+    await asyncio.gather(*(user(http, scenario, random.Random(seed * 1000 + i), video_ids, media_bytes,
+                                budget, latencies, errors) for i in range(concurrency)))
+    return time.perf_counter() - start, latencies, errors
+
+
+def cache_lookups(backend):
+    """Response cache lookups so far by result, from the backend's own metrics"""
+    return {result: count for (cache, result), count in backend.metrics._lookups.items() if cache == "response"}
+
+
+async def bench(backend, scenarios, requests, concurrency, seed):
+    async with backend.app.router.lifespan_context(backend.app):
+        video_ids = [v["video_id"] for v in backend.catalog.all()]
+        if not video_ids:
+            sys.exit(f"No videos in {os.path.abspath(backend.VIDEOS_DIR)}")
+        first = backend.catalog.get(video_ids[0])
+        media_bytes = os.path.getsize(os.path.join(backend.VIDEOS_DIR, first["file_path"]))
+        current, peak = rss_mb()
+        print(f"\n{len(video_ids)} videos ({len(backend.catalog.shorts)} shorts) in the catalog, "
+              f"RSS {current:.0f} MiB after startup")
+
+        print(f"{'scenario':<10} {'requests':>9} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'cached':>7} "
+              f"{'RSS MiB':>8} {'peak MiB':>9}")
+        transport = httpx.ASGITransport(app=backend.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as http:
+            for scenario in scenarios:
+                before = cache_lookups(backend)
+                elapsed, latencies, errors = await run_scenario(http, scenario, video_ids, media_bytes, requests,
+                                                                concurrency, seed)
+                after = cache_lookups(backend)
+                lookups = {result: after.get(result, 0) - before.get(result, 0) for result in after}
+                total = sum(lookups.values())
+                cached = f"{100 * (total - lookups.get('miss', 0)) / total:.0f}%" if total else "-"
+                current, peak = rss_mb()
+                latencies = [seconds * 1000 for seconds in latencies]
+                print(f"{scenario:<10} {len(latencies):>9} {len(latencies) / elapsed:>8.0f} "
+                      f"{percentile(latencies, 0.5):>8.2f} {percentile(latencies, 0.99):>8.2f} {cached:>7} "
+                      f"{current:>8.0f} {peak:>9.0f}")
+                for error in errors[:5]:
+                    print(f"  {error}")
+                if len(errors) > 5:
+                    print(f"  ... {len(errors) - 5} more errors")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--library", help="Directory to keep the library in (and reuse) instead of a temporary one")
+    parser.add_argument("--channels", type=int, default=20)
+    parser.add_argument("--videos", type=int, default=100, help="Videos per channel")
+    parser.add_argument("--shorts-ratio", type=float, default=0.25, help="Share of each channel's videos that are shorts")
+    parser.add_argument("--comments", type=int, default=50, help="Top-level comments per video")
+    parser.add_argument("--replies", type=int, default=3, help="Replies per comment")
+    parser.add_argument("--media-kb", type=int, default=256)
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--requests", type=int, default=2000, help="Requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=16, help="Sessions running at once")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        library_dir = os.path.abspath(args.library or tmp)
+        videos_dir = os.path.join(library_dir, "videos")
+        if os.path.exists(os.path.join(videos_dir, "library.db")):
+            print(f"Reusing the library in {videos_dir}")
+            shutil.rmtree(os.path.join(videos_dir, response_cache.CACHE_DIRNAME), ignore_errors=True)
+        else:
+            start = time.perf_counter()
+            video_ids = make_library(videos_dir, args.channels, args.videos, args.comments, args.replies,
+                                     args.media_kb, seed=args.seed, shorts_ratio=args.shorts_ratio)
+            print(f"Wrote {len(video_ids)} videos to {videos_dir} in {time.perf_counter() - start:.1f}s")
+
+        # backend.py finds videos/ and static/ relative to where it runs
+        sys.path.insert(0, REPO_DIR)
+        os.chdir(library_dir)
+        try:
+            import backend
+            asyncio.run(bench(backend, args.scenarios, args.requests, args.concurrency, args.seed))
+        finally:
+            os.chdir(REPO_DIR)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""Mixed-traffic load test for backend.py: per-endpoint p50/p99 under concurrent clients
+
+Runs the working tree's backend (and optionally an older git revision, for
+before/after numbers) under uvicorn against the same synthetic library.
+With --no-thumbnails every thumbnail still has to be made, by a stub ffmpeg
+on PATH that takes --ffmpeg-delay seconds.
+
+    python -m benchmarks.bench_backend_load --clients 64 --duration 10 --ref HEAD~1
+    python -m benchmarks.bench_backend_load --no-thumbnails --ref $(git rev-list --max-parents=0 HEAD)
+"""
+import os
+import sys
+import time
+import random
+import asyncio
+import argparse
+import tarfile
+import tempfile
+import subprocess
+from io import BytesIO
+
+import httpx
+
+from benchmarks.stub_ffmpeg import __file__ as STUB_FFMPEG
+from benchmarks.synthetic_library import make_library
+from benchmarks.bench_video_seek import wait_for_server
+
+REPO_DIR = os.path.abspath(".")
+
+# (name, weight); roughly what a browsing session sends
+TRAFFIC = (
+    ("content", 25),
+    ("search", 15),
+    ("comments", 15),
+    ("replies", 5),
+    ("thumbnails", 10),
+    ("thumbnail", 15),
+    ("video", 15),
+)
+
+
+def checkout(ref, dest):
+    """Extract a git revision of the repo into dest"""
+    archive = subprocess.run(["git", "archive", ref], cwd=REPO_DIR, check=True, capture_output=True).stdout
+    with tarfile.open(fileobj=BytesIO(archive)) as tar:
+        tar.extractall(dest)
+    return dest
+
+
+def request_for(kind, rng, video_ids):
+    video_id = rng.choice(video_ids)
+    if kind == "content":
+        return f"/api/content?videos_skip={rng.randrange(0, 200, 20)}&videos_limit=20&shorts_skip=0&shorts_limit=10", {}
+    if kind == "search":
+        return f"/api/videos/search?query={rng.choice(['gui', 'live concert', 'rocket', 'py'])}&limit=20", {}
+    if kind == "comments":
+        return f"/api/comments/{video_id}?limit=20", {}
+    if kind == "replies":
+        return f"/api/comments/{video_id}/{video_id}c0/replies", {}
+    if kind == "thumbnails":
+        return "/api/thumbnails?ids=" + ",".join(rng.sample(video_ids, 20)), {}
+    if kind == "thumbnail":
+        return f"/api/thumbnail/{video_id}", {}
+    start = rng.randrange(0, 128 * 1024)
+    return f"/api/video/{video_id}", {"Range": f"bytes={start}-{start + 64 * 1024 - 1}"}
+
+
+async def client(base, http, video_ids, deadline, results, seed):
+    rng = random.Random(seed)
+    kinds = [kind for kind, weight in TRAFFIC for _ in range(weight)]
+    while time.perf_counter() < deadline:
+        kind = rng.choice(kinds)
+        path, headers = request_for(kind, rng, video_ids)
+        start = time.perf_counter()
+        response = await http.get(base + path, headers=headers)
+        elapsed = (time.perf_counter() - start) * 1000
+        results.setdefault(kind, []).append(elapsed if response.status_code < 500 else float("inf"))
+
+
+async def run_load(base, video_ids, clients, duration):
+    results = {}
+    limits = httpx.Limits(max_connections=clients, max_keepalive_connections=clients)
+    async with httpx.AsyncClient(limits=limits, timeout=60) as http:
+        deadline = time.perf_counter() + duration
+        await asyncio.gather(*(client(base, http, video_ids, deadline, results, i) for i in range(clients)))
+    return results
+
+
+def percentile(samples, q):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * q))]
+
+
+def ffmpeg_shim(bin_dir):
+    """Directory with an `ffmpeg` on it that runs the stub, for code that calls ffmpeg by name"""
+    os.makedirs(bin_dir, exist_ok=True)
+    shim = os.path.join(bin_dir, "ffmpeg")
+    with open(shim, "w") as f:
+        f.write(f"#!/bin/sh\nexec {sys.executable} {os.path.abspath(STUB_FFMPEG)} \"$@\"\n")
+    os.chmod(shim, 0o755)
+    return bin_dir
+
+
+def bench(label, code_dir, library_dir, video_ids, args):
+    base = f"http://127.0.0.1:{args.port}"
+    env = dict(os.environ, PYTHONPATH=code_dir, STUB_FFMPEG_DELAY=str(args.ffmpeg_delay),
+               PATH=ffmpeg_shim(os.path.join(library_dir, "bin")) + os.pathsep + os.environ.get("PATH", ""))
+    env.pop("FFMPEG", None)
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "backend:app", "--port", str(args.port), "--log-level", "warning"],
+        cwd=library_dir, env=env, stdout=subprocess.DEVNULL
+    )
+    try:
+        wait_for_server(base, server)
+        results = asyncio.run(run_load(base, video_ids, args.clients, args.duration))
+    finally:
+        server.terminate()
+        server.wait()
+
+    total = sum(len(samples) for samples in results.values())
+    print(f"\n{label}: {total / args.duration:.0f} req/s with {args.clients} clients")
+    print(f"{'endpoint':<12} {'requests':>9} {'p50 ms':>8} {'p99 ms':>8}")
+    for kind, _ in TRAFFIC:
+        samples = results.get(kind, [])
+        if samples:
+            print(f"{kind:<12} {len(samples):>9} {percentile(samples, 0.5):>8.1f} {percentile(samples, 0.99):>8.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=64)
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds of load per run")
+    parser.add_argument("--channels", type=int, default=20)
+    parser.add_argument("--videos", type=int, default=50, help="Videos per channel")
+    parser.add_argument("--ref", help="Also benchmark this git revision, e.g. HEAD~1")
+    parser.add_argument("--no-thumbnails", action="store_true", help="Start without any generated thumbnails")
+    parser.add_argument("--ffmpeg-delay", type=float, default=0.2, help="Seconds the stub ffmpeg takes")
+    parser.add_argument("--port", type=int, default=16989)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        runs = [(args.ref, checkout(args.ref, os.path.join(tmp, "ref")))] if args.ref else []
+        runs.append(("working tree", REPO_DIR))
+        for i, (label, code_dir) in enumerate(runs):
+            # A fresh library per run, since runs may generate thumbnails
+            library_dir = os.path.join(tmp, f"library{i}")
+            video_ids = make_library(os.path.join(library_dir, "videos"), args.channels, args.videos,
+                                     with_thumbnails=not args.no_thumbnails)
+            bench(label, code_dir, library_dir, video_ids, args)
+
+
+if __name__ == "__main__":
+    main()
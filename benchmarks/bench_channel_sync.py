@@ -0,0 +1,89 @@
+"""Requests per yt.py run as a library goes from empty to up to date, against replayed playlists
+
+One channel replays the recorded videos and shorts tabs in
+benchmarks/fixtures/; the rest are synthesized, --legacy of them only
+listing under their /c/ URL. Runs: a first sync, a second one (which records
+each channel's feed signature), an unchanged re-run, and a re-run after
+--new-uploads videos appear at the top of every channel. "missed" counts
+requests to a URL form that doesn't list the channel.
+
+    python -m benchmarks.bench_channel_sync --channels 8 --videos 10
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+
+from benchmarks.stub_ytdl import StubYoutubeDL, import_yt
+
+FIXTURES = [os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", f"fixturechannel_{tab}.json")
+            for tab in ("videos", "shorts")]
+FIXTURE_CHANNEL = "fixturechannel"
+
+
+def run_once(yt, workers):
+    StubYoutubeDL.reset()
+    start = time.monotonic()
+    yt.download_videos(workers)
+    elapsed = time.monotonic() - start
+    return elapsed, {kind: len(calls) for kind, calls in StubYoutubeDL.calls.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--channels", type=int, default=8, help="Channels, including the fixture one")
+    parser.add_argument("--videos", type=int, default=10, help="video_count per channel")
+    parser.add_argument("--playlist", type=int, default=120, help="Uploads per synthesized channel")
+    parser.add_argument("--new-uploads", type=int, default=1)
+    parser.add_argument("--legacy", type=int, default=1, help="Synthesized channels listed only under /c/")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--latency", type=float, default=0.01, help="Simulated seconds per request")
+    args = parser.parse_args()
+
+    cwd = os.getcwd()
+    yt = import_yt()
+    yt.YoutubeDL = StubYoutubeDL
+    yt.fetch_feed = StubYoutubeDL.fetch_feed
+    yt.REQUESTS_PER_SECOND = 1000.0
+    yt.RATE_BURST = 100
+    yt.DOWNLOAD_COMMENTS = False
+    StubYoutubeDL.latency = args.latency
+
+    channels = [FIXTURE_CHANNEL] + [f"chan{i}" for i in range(args.channels - 1)]
+    StubYoutubeDL.playlists = {}
+    StubYoutubeDL.load_playlist(FIXTURE_CHANNEL, *FIXTURES)
+    for channel in channels[1:]:
+        StubYoutubeDL.playlists[channel] = [StubYoutubeDL.synthetic_entry(channel, i) for i in range(args.playlist)]
+    StubYoutubeDL.legacy_channels = set(channels[1:1 + args.legacy])
+
+    runs = ("first sync", "second sync", "unchanged", f"+{args.new_uploads} uploads")
+    devnull = open(os.devnull, "w")
+    print(f"{'run':<14} {'seconds':>8} {'pages':>6} {'missed':>7} {'feeds':>6} {'info':>5} {'downloads':>10}")
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            with open("channels.json", "w") as f:
+                json.dump([{"channel_name": channel, "video_count": args.videos} for channel in channels], f)
+            for label in runs:
+                if label == runs[-1]:
+                    for channel in channels:
+                        entries = StubYoutubeDL.playlists[channel]
+                        for i in range(args.new_uploads):
+                            entries.insert(0, StubYoutubeDL.synthetic_entry(channel, 100000 + i))
+                stdout, sys.stdout = sys.stdout, devnull
+                try:
+                    elapsed, calls = run_once(yt, args.workers)
+                finally:
+                    sys.stdout = stdout
+                print(f"{label:<14} {elapsed:>8.2f} {calls.get('playlist', 0):>6} {calls.get('missing', 0):>7} "
+                      f"{calls.get('feed', 0):>6} "
+                      f"{calls.get('info', 0):>5} {calls.get('download', 0):>10}")
+        finally:
+            os.chdir(cwd)
+            devnull.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""Files, bytes and read latency per video: per-comment JSON files vs comments.jsonl
+
+    python -m benchmarks.bench_comment_store --comments 50 --replies 120
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+
+sys.path.insert(0, ".")
+import comment_store
+
+
+def make_legacy_dir(comments_dir, comments, replies):
+    """Write comments the way older yt.py did: one indented JSON file each"""
+    os.makedirs(os.path.join(comments_dir, "top"))
+    for c in range(1, comments + 1):
+        with open(os.path.join(comments_dir, "top", f"c_{c:05d}.json"), "w", encoding="utf-8") as f:
+            json.dump({"id": f"c{c}", "author": f"@user{c}", "timestamp": 1700000000,
+                       "text": "A fairly typical comment about the video " * 3, "likes": 1000 - c},
+                      f, indent=2, ensure_ascii=False)
+        reply_dir = os.path.join(comments_dir, "replies", f"c_{c:05d}")
+        os.makedirs(reply_dir)
+        for r in range(1, replies + 1):
+            with open(os.path.join(reply_dir, f"r_{r:05d}.json"), "w", encoding="utf-8") as f:
+                json.dump({"id": f"c{c}.r{r}", "author": f"@reply{r}", "timestamp": 1700000100,
+                           "text": "Agreed!", "likes": r % 7}, f, indent=2, ensure_ascii=False)
+
+
+def disk_usage(path):
+    """(files, apparent bytes, allocated bytes) under path"""
+    files = apparent = allocated = 0
+    for dirpath, _, filenames in os.walk(path):
+        for name in filenames:
+            st = os.stat(os.path.join(dirpath, name))
+            files += 1
+            apparent += st.st_size
+            allocated += st.st_blocks * 512
+    return files, apparent, allocated
+
+
+def timed(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--comments", type=int, default=50)
+    parser.add_argument("--replies", type=int, default=120, help="Replies per comment")
+    parser.add_argument("--page", type=int, default=20, help="Top-level comments per page")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        comments_dir = os.path.join(tmp, "video")
+        make_legacy_dir(comments_dir, args.comments, args.replies)
+
+        legacy_usage = disk_usage(comments_dir)
+        legacy_full = timed(lambda: comment_store.read_legacy_comments(comments_dir), args.repeat)
+
+        comment_store.migrate_comment_dir(comments_dir)
+        packed_usage = disk_usage(comments_dir)
+
+        def read_page():
+            with comment_store.PackedComments(comments_dir) as packed:
+                packed.comments(0, args.page)
+
+        def read_replies():
+            with comment_store.PackedComments(comments_dir) as packed:
+                packed.replies(0)
+
+        packed_full = timed(lambda: comment_store.read_threads(comments_dir), args.repeat)
+        packed_page = timed(read_page, args.repeat)
+        packed_replies = timed(read_replies, args.repeat)
+
+    print(f"{args.comments} comments x {args.replies} replies per video")
+    print(f"{'layout':<22} {'files':>6} {'bytes':>10} {'on disk':>10} {'full read ms':>13}")
+    print(f"{'per-comment JSON':<22} {legacy_usage[0]:>6} {legacy_usage[1]:>10} {legacy_usage[2]:>10} {legacy_full:>13.2f}")
+    print(f"{'comments.jsonl':<22} {packed_usage[0]:>6} {packed_usage[1]:>10} {packed_usage[2]:>10} {packed_full:>13.2f}")
+    print(f"packed page of {args.page} comments: {packed_page:.3f} ms, replies of one comment: {packed_replies:.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""Offline throughput/rate-limit benchmark for the yt.py scheduler
+
+    python -m benchmarks.bench_downloader --channels 8 --videos 10 --workers 1 4 8
+
+Comments have their own workers and request budget in yt.py. Unless
+--comment-workers is given they scale with --workers, so the comment queue
+doesn't hide the scaling of downloads.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+
+from benchmarks.stub_ytdl import StubYoutubeDL, max_requests_in_window, import_yt
+
+
+def run_once(yt, channels, videos, workers, comment_workers, latency):
+    StubYoutubeDL.reset()
+    StubYoutubeDL.latency = latency
+    StubYoutubeDL.videos_per_channel = videos * 2
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        with open("channels.json", "w") as f:
+            json.dump([{"channel_name": f"chan{i}", "video_count": videos} for i in range(channels)], f)
+
+        start = time.monotonic()
+        yt.download_videos(workers, comment_workers=comment_workers)
+        elapsed = time.monotonic() - start
+
+    timestamps = [t for kind in StubYoutubeDL.calls.values() for t, _ in kind]
+    return elapsed, len(timestamps), timestamps
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--channels", type=int, default=8)
+    parser.add_argument("--videos", type=int, default=10, help="video_count per channel")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--latency", type=float, default=0.05, help="Simulated seconds per request")
+    parser.add_argument("--rate", type=float, default=200.0, help="Requests per second allowed per host")
+    parser.add_argument("--burst", type=int, default=5)
+    parser.add_argument("--comment-rate", type=float, default=200.0, help="Comment requests per second allowed per host")
+    parser.add_argument("--comment-burst", type=int, default=5)
+    parser.add_argument("--comment-workers", type=int, help="Comment workers (default: the same as --workers)")
+    args = parser.parse_args()
+
+    cwd = os.getcwd()
+    yt = import_yt()
+    yt.YoutubeDL = StubYoutubeDL
+    yt.REQUESTS_PER_SECOND = args.rate
+    yt.RATE_BURST = args.burst
+    yt.COMMENT_REQUESTS_PER_SECOND = args.comment_rate
+    yt.COMMENT_RATE_BURST = args.comment_burst
+
+    devnull = open(os.devnull, "w")
+    print(f"{'workers':>8} {'seconds':>8} {'videos/s':>9} {'requests':>9} {'peak 1s':>8} {'limit 1s':>9}")
+    try:
+        for workers in args.workers:
+            stdout, sys.stdout = sys.stdout, devnull
+            try:
+                elapsed, requests, timestamps = run_once(yt, args.channels, args.videos, workers,
+                                                         args.comment_workers or workers, args.latency)
+            finally:
+                sys.stdout = stdout
+                os.chdir(cwd)
+            peak = max_requests_in_window(timestamps, 1.0)
+            # Both budgets draw on the same host
+            limit = int(args.rate + args.burst + args.comment_rate + args.comment_burst)
+            total_videos = args.channels * args.videos
+            print(f"{workers:>8} {elapsed:>8.2f} {total_videos / elapsed:>9.1f} {requests:>9} {peak:>8} {limit:>9}"
+                  + ("" if peak <= limit else "  RATE LIMIT EXCEEDED"))
+    finally:
+        devnull.close()
+
+
+if __name__ == "__main__":
+    main()
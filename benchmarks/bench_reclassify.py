@@ -0,0 +1,67 @@
+"""reclassify throughput across processes, with the stub ffprobe, on a library where every 4th video is a misfiled short
+
+    python -m benchmarks.bench_reclassify --videos 200 --delay 0.05 --processes 1 2 4
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+from benchmarks.stub_ffprobe import __file__ as STUB_FFPROBE, PORTRAIT
+
+sys.path.insert(0, ".")
+os.environ.setdefault("FFPROBE", os.path.abspath(STUB_FFPROBE))
+import library_db
+import classify
+
+
+def make_library(videos_dir, count):
+    """count videos all indexed as landscape videos without dimensions; every 4th file is really portrait"""
+    conn = library_db.connect(videos_dir)
+    records = []
+    for i in range(count):
+        channel_dir = f"chan{i % 4}"
+        video_file = f"Video {i} [vid{i:05d}].mp4"
+        folder = os.path.join(videos_dir, channel_dir, "videos")
+        os.makedirs(folder, exist_ok=True)
+        with open(os.path.join(folder, video_file), "wb") as f:
+            f.write((PORTRAIT if i % 4 == 0 else b"") + b"\0" * 1024)
+        records.append(library_db.video_record(channel_dir, "video", video_file, {"title": f"Video {i}"},
+                                               type_source="folder"))
+    for record in records:
+        library_db.upsert_video(conn, record)
+    conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--videos", type=int, default=200)
+    parser.add_argument("--delay", type=float, default=0.05, help="Simulated ffprobe seconds per file")
+    parser.add_argument("--processes", type=int, nargs="+", default=[1, 2, 4])
+    args = parser.parse_args()
+    os.environ["STUB_FFPROBE_DELAY"] = str(args.delay)
+
+    devnull = open(os.devnull, "w")
+    print(f"{'processes':>9} {'reclassify s':>13} {'misfiled':>9} {'rerun s':>8} {'rerun changes':>14}")
+    for processes in args.processes:
+        with tempfile.TemporaryDirectory() as tmp:
+            make_library(tmp, args.videos)
+            stdout, sys.stdout = sys.stdout, devnull
+            try:
+                start = time.perf_counter()
+                changes = classify.reclassify_library(tmp, processes)
+                elapsed = time.perf_counter() - start
+                # The second run decides from the dimensions the first one stored: no probes
+                start = time.perf_counter()
+                rerun = classify.reclassify_library(tmp, processes)
+                rerun_elapsed = time.perf_counter() - start
+            finally:
+                sys.stdout = stdout
+        misfiled = sum(1 for change in changes if change["type"] == "shorts")
+        print(f"{processes:>9} {elapsed:>13.2f} {misfiled:>9} {rerun_elapsed:>8.3f} {len(rerun):>14}")
+    devnull.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""Search latency: linear substring scan vs the FTS5 index, at growing library sizes
+
+    python -m benchmarks.bench_search --sizes 10000 100000 1000000
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+import statistics
+
+sys.path.insert(0, ".")
+import library_db
+
+WORDS = (
+    "guitar lesson live concert review unboxing tutorial python music vlog travel "
+    "cooking recipe pasta bread camera drone build setup budget gaming speedrun "
+    "minecraft history science space rocket launch interview podcast episode "
+    "highlights reaction trailer official remix acoustic cover piano drums"
+).split()
+
+# Long tail of rarer words, like real titles have
+RARE_WORDS = [f"{a}{b}{c}{d}" for a in "bdfgk" for b in "aeiou" for c in "lmnrst" for d in ("a", "er", "o", "y")]
+
+QUERIES = ("gu", "guitar", "guitar less", "guitar bamer", "kuser", "space rocket laun", "zzznomatch")
+
+
+def make_library(conn, size, seed=1):
+    """Insert size synthetic rows, then fill the index the way an upgraded database is"""
+    rng = random.Random(seed)
+    rows = []
+    for i in range(size):
+        words = [rng.choice(WORDS) for _ in range(rng.randint(1, 3))]
+        words += [rng.choice(RARE_WORDS) for _ in range(rng.randint(2, 5))]
+        rng.shuffle(words)
+        title = " ".join(words).title()
+        channel = f"Channel {rng.choice(WORDS).title()} {i % 500}"
+        rows.append((f"vid{i:08d}", f"ch{i % 500}", channel, title, "video", f"ch{i % 500}/videos/{i}.mp4", i))
+    with conn:
+        conn.executemany(
+            "INSERT INTO videos (video_id, channel_dir, channel, title, type, file_path, seq) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)", rows
+        )
+        conn.execute("DELETE FROM meta WHERE key = 'fts'")
+    start = time.perf_counter()
+    library_db._ensure_search_index(conn)
+    return [{"video_id": r[0], "channel": r[2], "title": r[3]} for r in rows], time.perf_counter() - start
+
+
+def linear_scan(items, query, limit):
+    """What /api/videos/search used to do for every request"""
+    query_lower = query.lower()
+    results = [v for v in items if query_lower in v['title'].lower() or query_lower in v['channel'].lower()]
+    return results[:limit]
+
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    if not library_db.HAS_FTS5:
+        sys.exit("This SQLite build has no FTS5")
+
+    print(f"{'entries':>9} {'query':<20} {'scan ms':>9} {'fts ms':>9} {'hits':>5}")
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            conn = library_db.connect(tmp)
+            items, index_seconds = make_library(conn, size)
+
+            for query in QUERIES:
+                scan_ms = timed(lambda: linear_scan(items, query, args.limit), args.repeat)
+                fts_ms = timed(lambda: library_db.search(conn, query, args.limit), args.repeat)
+                hits = len(library_db.search(conn, query, args.limit))
+                print(f"{size:>9} {query:<20} {scan_ms:>9.2f} {fts_ms:>9.2f} {hits:>5}")
+
+            record = library_db.video_record("ch0", "video", "Fresh Upload [fresh].mp4",
+                                             {"title": "Fresh acoustic upload", "channel": "Channel New"})
+            upsert_ms = timed(lambda: library_db.upsert_video(conn, record), args.repeat)
+            print(f"{size:>9} index built in {index_seconds:.2f}s, incremental upsert {upsert_ms:.2f} ms, "
+                  f"db {os.path.getsize(library_db.db_path(tmp)) / 1e6:.1f} MB")
+            conn.close()
+
+
+if __name__ == "__main__":
+    main()
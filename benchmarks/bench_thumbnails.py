@@ -0,0 +1,77 @@
+"""Thumbnail pre-generation throughput and first-page thumbnail latency, using the stub ffmpeg
+
+    python -m benchmarks.bench_thumbnails --videos 64 --delay 0.1 --processes 1 4 8
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+from benchmarks.stub_ytdl import STUB_FFMPEG
+
+sys.path.insert(0, ".")
+os.environ.setdefault("FFMPEG", STUB_FFMPEG)
+import library_db
+import thumbnails
+
+
+def make_library(videos_dir, count):
+    conn = library_db.connect(videos_dir)
+    for i in range(count):
+        channel_dir = f"chan{i % 4}"
+        video_file = f"Video {i} [vid{i:05d}].mp4"
+        folder = os.path.join(videos_dir, channel_dir, "videos")
+        os.makedirs(folder, exist_ok=True)
+        with open(os.path.join(folder, video_file), "wb") as f:
+            f.write(b"\0" * 1024)
+        library_db.upsert_video(conn, library_db.video_record(channel_dir, "video", video_file, {"title": f"Video {i}"}))
+    conn.close()
+
+
+def first_page(videos_dir, cards):
+    """Time the thumbnail requests of one grid page against the real app"""
+    from fastapi.testclient import TestClient
+    import backend
+
+    backend.VIDEOS_DIR = videos_dir
+    backend.catalog = backend.LibraryCatalog(videos_dir)
+    with TestClient(backend.app) as client:
+        page = client.get(f"/api/content?videos_limit={cards}&shorts_limit=0").json()["videos"]
+        start = time.perf_counter()
+        types = [client.get(f"/api/thumbnail/{v['video_id']}").headers["content-type"] for v in page]
+        return (time.perf_counter() - start) * 1000, types
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--videos", type=int, default=64)
+    parser.add_argument("--delay", type=float, default=0.1, help="Simulated ffmpeg seconds per thumbnail")
+    parser.add_argument("--processes", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--cards", type=int, default=20, help="Thumbnails on one grid page")
+    args = parser.parse_args()
+    os.environ["STUB_FFMPEG_DELAY"] = str(args.delay)
+
+    print(f"{'processes':>9} {'generate s':>11} {'up-to-date rerun s':>19}")
+    for processes in args.processes:
+        with tempfile.TemporaryDirectory() as tmp:
+            make_library(tmp, args.videos)
+            start = time.perf_counter()
+            thumbnails.generate_thumbnails(tmp, processes)
+            generated = time.perf_counter() - start
+            start = time.perf_counter()
+            thumbnails.generate_thumbnails(tmp, processes)
+            rerun = time.perf_counter() - start
+        print(f"{processes:>9} {generated:>11.2f} {rerun:>19.3f}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        make_library(tmp, args.videos)
+        placeholder_ms, _ = first_page(tmp, args.cards)
+        thumbnails.generate_thumbnails(tmp, max(args.processes))
+        ready_ms, types = first_page(tmp, args.cards)
+    print(f"first page of {args.cards} thumbnails: {placeholder_ms:.1f} ms before generation (placeholders), "
+          f"{ready_ms:.1f} ms after ({types.count('image/jpeg')} JPEGs)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""Seek latency and server CPU for /api/video with many concurrent players
+
+Starts backend.py under uvicorn on a synthetic library, then has each player
+issue random Range requests the way <video> does after a seek.
+
+    python -m benchmarks.bench_video_seek --players 1 8 32 --seeks 20
+"""
+import os
+import sys
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+import subprocess
+import statistics
+
+import httpx
+
+sys.path.insert(0, ".")
+import library_db
+
+REPO_DIR = os.path.abspath(".")
+
+
+def make_library(videos_dir, count, size_mb):
+    conn = library_db.connect(videos_dir)
+    block = os.urandom(1024 * 1024)
+    for i in range(count):
+        folder = os.path.join(videos_dir, "chan", "videos")
+        os.makedirs(folder, exist_ok=True)
+        video_file = f"Video {i} [vid{i:03d}].mp4"
+        with open(os.path.join(folder, video_file), "wb") as f:
+            for _ in range(size_mb):
+                f.write(block)
+        library_db.upsert_video(conn, library_db.video_record("chan", "video", video_file, {"title": f"Video {i}"}))
+    conn.close()
+    return [f"vid{i:03d}" for i in range(count)]
+
+
+def cpu_seconds(pid):
+    """utime + stime of a process, from /proc (Linux)"""
+    with open(f"/proc/{pid}/stat") as f:
+        fields = f.read().rsplit(")", 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+async def player(client, base, video_ids, size, seeks, read_bytes, latencies):
+    rng = random.Random()
+    video_id = rng.choice(video_ids)
+    for _ in range(seeks):
+        start = rng.randrange(0, size - read_bytes)
+        t = time.perf_counter()
+        response = await client.get(f"{base}/api/video/{video_id}",
+                                    headers={"Range": f"bytes={start}-{start + read_bytes - 1}"})
+        assert response.status_code == 206 and len(response.content) == read_bytes
+        latencies.append((time.perf_counter() - t) * 1000)
+
+
+async def run_players(base, video_ids, size, players, seeks, read_bytes):
+    latencies = []
+    limits = httpx.Limits(max_connections=players, max_keepalive_connections=players)
+    async with httpx.AsyncClient(limits=limits, timeout=60) as client:
+        await asyncio.gather(*(
+            player(client, base, video_ids, size, seeks, read_bytes, latencies) for _ in range(players)
+        ))
+    return latencies
+
+
+def wait_for_server(base, server, timeout=20):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError("server exited")
+        try:
+            if httpx.get(f"{base}/api/content?videos_limit=1&shorts_limit=0").status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError("server did not start")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--players", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--seeks", type=int, default=20, help="Range requests per player")
+    parser.add_argument("--read-kb", type=int, default=512, help="Bytes fetched per seek")
+    parser.add_argument("--videos", type=int, default=8)
+    parser.add_argument("--size-mb", type=int, default=64)
+    parser.add_argument("--port", type=int, default=16979)
+    args = parser.parse_args()
+
+    base = f"http://127.0.0.1:{args.port}"
+    read_bytes = args.read_kb * 1024
+    with tempfile.TemporaryDirectory() as tmp:
+        video_ids = make_library(os.path.join(tmp, "videos"), args.videos, args.size_mb)
+        env = dict(os.environ, PYTHONPATH=REPO_DIR)
+        server = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "backend:app", "--port", str(args.port), "--log-level", "warning"],
+            cwd=tmp, env=env, stdout=subprocess.DEVNULL
+        )
+        try:
+            wait_for_server(base, server)
+            print(f"{'players':>7} {'seeks':>6} {'p50 ms':>8} {'p99 ms':>8} {'MB/s':>8} {'cpu s':>7} {'cpu ms/stream':>14}")
+            for players in args.players:
+                cpu_before = cpu_seconds(server.pid)
+                start = time.perf_counter()
+                latencies = asyncio.run(run_players(base, video_ids, args.size_mb * 1024 * 1024,
+                                                    players, args.seeks, read_bytes))
+                elapsed = time.perf_counter() - start
+                cpu = cpu_seconds(server.pid) - cpu_before
+                latencies.sort()
+                p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+                mb_per_s = len(latencies) * read_bytes / 1e6 / elapsed
+                print(f"{players:>7} {len(latencies):>6} {statistics.median(latencies):>8.2f} {p99:>8.2f} "
+                      f"{mb_per_s:>8.1f} {cpu:>7.2f} {cpu * 1000 / players:>14.1f}")
+        finally:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""Per-video YoutubeDL overhead: a fresh instance per call vs the pool
+
+Uses the real YoutubeDL class so construction (extractor list, cookie jar,
+request director) is measured, with extract_info stubbed out so nothing
+touches the network.
+
+    python -m benchmarks.bench_ydl_pool --videos 50
+"""
+import sys
+import time
+import argparse
+
+from yt_dlp import YoutubeDL
+
+sys.path.insert(0, ".")
+from ydl_pool import YoutubeDLPool
+from benchmarks.stub_ytdl import StubYoutubeDL, import_yt
+
+
+class StubExtractorYoutubeDL(YoutubeDL):
+    """Real YoutubeDL whose extraction answers from the offline stub"""
+
+    def extract_info(self, url, download=True, *args, **kwargs):
+        return StubYoutubeDL.video_info(url.split("v=")[-1])
+
+
+# One download (which extracts the info it needs) and one comment fetch per video, like yt.py
+CALLS_PER_VIDEO = ("download", "comments")
+
+
+def per_call_instances(profiles, video_ids):
+    for video_id in video_ids:
+        for profile in CALLS_PER_VIDEO:
+            with StubExtractorYoutubeDL(dict(profiles[profile])) as ydl:
+                ydl.extract_info(f"https://www.youtube.com/watch?v={video_id}", download=False)
+
+
+def pooled_instances(profiles, video_ids):
+    pool = YoutubeDLPool(profiles, StubExtractorYoutubeDL)
+    try:
+        for video_id in video_ids:
+            for profile in CALLS_PER_VIDEO:
+                params = {"paths": {"home": "videos"}} if profile == "download" else {}
+                with pool.use(profile, **params) as ydl:
+                    ydl.extract_info(f"https://www.youtube.com/watch?v={video_id}", download=False)
+    finally:
+        pool.close()
+    return pool.created
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--videos", type=int, default=50)
+    args = parser.parse_args()
+
+    yt = import_yt()
+    profiles = {name: dict(opts, quiet=True, no_warnings=True) for name, opts in yt.YDL_PROFILES.items()}
+    video_ids = [f"bench_{i}" for i in range(args.videos)]
+
+    start = time.perf_counter()
+    per_call_instances(profiles, video_ids)
+    before = (time.perf_counter() - start) / args.videos
+
+    start = time.perf_counter()
+    created = pooled_instances(profiles, video_ids)
+    after = (time.perf_counter() - start) / args.videos
+
+    print(f"videos: {args.videos}")
+    print(f"fresh YoutubeDL per call: {before * 1000:8.2f} ms/video ({args.videos * len(CALLS_PER_VIDEO)} instances)")
+    print(f"pooled YoutubeDL:         {after * 1000:8.2f} ms/video ({created} instances)")
+    print(f"speedup: {before / after:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+"""Offline stand-in for ffmpeg: writes a tiny JPEG to every output path (each argument after -y)
+
+Set STUB_FFMPEG_DELAY to simulate decode time, and point thumbnails.py at it with
+FFMPEG=benchmarks/stub_ffmpeg.py.
+"""
+import os
+import sys
+import time
+
+# Smallest valid baseline JPEG (1x1 grey pixel)
+JPEG = bytes.fromhex(
+    "ffd8ffe000104a46494600010100000100010000ffdb004300080606070605080707070909080a0c140d0c0b0b0c1912130f"
+    "141d1a1f1e1d1a1c1c20242e2720222c231c1c2837292c30313434341f27393d38323c2e333432ffc0000b08000100010101"
+    "1100ffc4001f0000010501010101010100000000000000000102030405060708090a0bffc400b5100002010303020403050504"
+    "040000017d01020300041105122131410613516107227114328191a1082342b1c11552d1f02433627282090a161718191a2526"
+    "2728292a3435363738393a434445464748494a535455565758595a636465666768696a737475767778797a83848586878889"
+    "8a92939495969798999aa2a3a4a5a6a7a8a9aab2b3b4b5b6b7b8b9bac2c3c4c5c6c7c8c9cad2d3d4d5d6d7d8d9dae1e2e3e4"
+    "e5e6e7e8e9eaf1f2f3f4f5f6f7f8f9faffda0008010100003f00fbd3ffd9"
+)
+
+
+def main():
+    args = sys.argv[1:]
+    if "-i" not in args or not os.path.exists(args[args.index("-i") + 1]):
+        print("stub_ffmpeg: missing input", file=sys.stderr)
+        return 1
+    time.sleep(float(os.environ.get("STUB_FFMPEG_DELAY", "0")))
+    for i, arg in enumerate(args[:-1]):
+        if arg == "-y":
+            with open(args[i + 1], "wb") as f:
+                f.write(JPEG)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,30 @@
+#!/usr/bin/env python3
+"""Offline stand-in for ffprobe: reports 1080x1920 for files starting with b"PORTRAIT", 1280x720 otherwise
+
+Set STUB_FFPROBE_DELAY to simulate probe time, and point classify.py at it with
+FFPROBE=benchmarks/stub_ffprobe.py.
+"""
+import os
+import sys
+import json
+import time
+
+PORTRAIT = b"PORTRAIT"
+
+
+def main():
+    path = sys.argv[-1]
+    try:
+        with open(path, "rb") as f:
+            head = f.read(len(PORTRAIT))
+    except OSError:
+        print(f"stub_ffprobe: cannot open {path}", file=sys.stderr)
+        return 1
+    time.sleep(float(os.environ.get("STUB_FFPROBE_DELAY", "0")))
+    width, height = (1080, 1920) if head == PORTRAIT else (1280, 720)
+    print(json.dumps({"streams": [{"width": width, "height": height}]}))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,227 @@
+import os
+import sys
+import json
+import time
+import tempfile
+import importlib
+import threading
+from collections import defaultdict
+from urllib.parse import urlparse
+
+
+class StubYoutubeDL:
+    """Offline stand-in for yt_dlp.YoutubeDL
+
+    Answers playlist, info, download and comment calls for fake channels
+    after a fixed latency and records when each request was made, so runs can
+    be checked against the configured rate limit without touching the network.
+    Channels in `playlists` replay those flat entries (e.g. recorded fixtures)
+    instead of synthesized ones, split into a videos and a shorts tab by their
+    /shorts/ URLs; unprocessed playlists are generators that record one
+    request per page, like YouTube's continuation pages. Channels in
+    `legacy_channels` only list under their /c/ URL.
+    """
+
+    latency = 0.01
+    videos_per_channel = 20
+    comments_per_video = 5
+    shorts_every = 4  # Every nth video is vertical
+    page_size = 30  # Flat entries per playlist page
+    feed_size = 15  # Uploads listed in a channel feed
+
+    playlists = {}  # channel -> flat entries of both tabs, newest first
+    legacy_channels = set()
+
+    calls = defaultdict(list)
+    instances = 0
+    _lock = threading.Lock()
+
+    def __init__(self, opts=None):
+        self.params = dict(opts or {})
+        with StubYoutubeDL._lock:
+            StubYoutubeDL.instances += 1
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    @classmethod
+    def reset(cls):
+        cls.calls = defaultdict(list)
+        cls.instances = 0
+
+    @classmethod
+    def load_playlist(cls, channel, *paths):
+        """Replay recorded flat tabs (yt-dlp's extract_flat output) for channel"""
+        cls.playlists[channel] = []
+        for path in paths:
+            with open(path, encoding="utf-8") as f:
+                cls.playlists[channel].extend(json.load(f)["entries"])
+
+    @classmethod
+    def synthetic_entry(cls, channel, index):
+        video_id = f"{channel}_{index}"
+        if index % cls.shorts_every == 0:
+            return {"_type": "url", "ie_key": "Youtube", "id": video_id,
+                    "url": f"https://www.youtube.com/shorts/{video_id}"}
+        return {"_type": "url", "ie_key": "Youtube", "id": video_id, "url": f"https://www.youtube.com/watch?v={video_id}"}
+
+    @classmethod
+    def _entries(cls, channel, tab=None):
+        if channel in cls.playlists:
+            entries = cls.playlists[channel]
+        else:
+            entries = [cls.synthetic_entry(channel, i) for i in range(cls.videos_per_channel)]
+        if tab is None:
+            return entries
+        return [entry for entry in entries if ("/shorts/" in entry["url"]) == (tab == "shorts")]
+
+    @classmethod
+    def _find_entry(cls, video_id):
+        for channel, entries in cls.playlists.items():
+            for entry in entries:
+                if entry["id"] == video_id:
+                    return channel, entry
+        return None, None
+
+    @classmethod
+    def fetch_feed(cls, channel_id):
+        """Stand-in for yt.fetch_feed: the channel's latest uploads as an Atom feed"""
+        channel = channel_id[2:]
+        with cls._lock:
+            cls.calls["feed"].append((time.monotonic(), "www.youtube.com"))
+        time.sleep(cls.latency)
+        items = "".join(f"<entry><yt:videoId>{entry['id']}</yt:videoId><title>{entry.get('title', '')}</title></entry>"
+                        for entry in cls._entries(channel)[:cls.feed_size])
+        return (f'<feed xmlns:yt="http://www.youtube.com/xml/schemas/2015"><yt:channelId>{channel_id}'
+                f'</yt:channelId>{items}</feed>')
+
+    def _record(self, kind, url):
+        with StubYoutubeDL._lock:
+            StubYoutubeDL.calls[kind].append((time.monotonic(), urlparse(url).netloc))
+        time.sleep(self.latency)
+
+    @staticmethod
+    def _video_id(url):
+        return url.split("v=")[-1]
+
+    @classmethod
+    def video_info(cls, video_id):
+        channel, entry = cls._find_entry(video_id)
+        if entry is not None:
+            is_short = "/shorts/" in entry["url"]
+            title = entry.get("title") or f"Video {video_id}"
+        else:
+            channel, index = video_id.rsplit("_", 1)[0], int(video_id.rsplit("_", 1)[-1])
+            is_short = index % cls.shorts_every == 0
+            title = f"Video {video_id}"
+        return {
+            "id": video_id,
+            "title": title,
+            "channel": channel,
+            "duration": 30 if is_short else 600,
+            "width": 1080 if is_short else 1280,
+            "height": 1920 if is_short else 720,
+            "upload_date": "20250101",
+            "webpage_url": f"https://www.youtube.com/watch?v={video_id}",
+        }
+
+    def extract_info(self, url, download=False, process=True):
+        if "watch?v=" not in url:
+            tab = url.rstrip("/").split("/")[-1]
+            channel = url.rstrip("/").split("/")[-2]
+            if channel.lstrip("@") in self.legacy_channels and channel.startswith("@"):
+                # What yt-dlp returns with ignoreerrors for a channel URL that doesn't exist
+                self._record("missing", url)
+                return None
+            channel = channel.lstrip("@")
+            entries = self._entries(channel, tab)
+            if process:
+                self._record("playlist", url)
+                limit = self.params.get("playlistend") or len(entries)
+                return {"_type": "playlist", "channel_id": f"UC{channel}", "entries": entries[:limit]}
+            return {"_type": "playlist", "channel_id": f"UC{channel}", "entries": self._pages(url, entries)}
+
+        video_id = self._video_id(url)
+        if self.params.get("getcomments"):
+            self._record("comments", url)
+            comments = []
+            for i in range(self.comments_per_video):
+                comments.append({"id": f"{video_id}_c{i}", "parent": "root", "author": "a",
+                                 "text": f"comment {i}", "like_count": i, "timestamp": 0})
+                comments.append({"id": f"{video_id}_c{i}_r", "parent": f"{video_id}_c{i}",
+                                 "author": "b", "text": "reply", "like_count": 0, "timestamp": 0})
+            return dict(self.video_info(video_id), comments=comments)
+
+        if download:
+            return self._download(url)
+
+        self._record("info", url)
+        return self.video_info(video_id)
+
+    def _pages(self, url, entries):
+        for start in range(0, len(entries), self.page_size):
+            self._record("playlist", url)
+            yield from entries[start:start + self.page_size]
+
+    def _download(self, url):
+        self._record("download", url)
+        info = self.video_info(self._video_id(url))
+        home = self.params.get("paths", {}).get("home", "")
+        path = os.path.join(home, self.params["outtmpl"] % dict(info, ext="mp4"))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(b"\0" * 1024)
+        if self.params.get("writethumbnail"):
+            thumb_path = os.path.splitext(path)[0] + ".webp"
+            with open(thumb_path, "wb") as f:
+                f.write(b"RIFF")
+            info["thumbnails"] = [{"url": "https://i.ytimg.com/stub.webp", "filepath": thumb_path}]
+        return info
+
+    def download(self, urls):
+        for url in urls:
+            self._download(url)
+        return 0
+
+    def close(self):
+        pass
+
+    @staticmethod
+    def sanitize_info(info):
+        return dict(info)
+
+
+def max_requests_in_window(timestamps, window):
+    """Largest number of requests seen in any sliding window of the given length"""
+    timestamps = sorted(timestamps)
+    best = 0
+    start = 0
+    for end, t in enumerate(timestamps):
+        while t - timestamps[start] > window:
+            start += 1
+        best = max(best, end - start + 1)
+    return best
+
+
+STUB_FFMPEG = os.path.join(os.path.dirname(os.path.abspath(__file__)), "stub_ffmpeg.py")
+
+
+def import_yt():
+    """Import yt.py from the working directory without leaving a yt.log behind
+
+    yt.py opens yt.log in the current directory on import. Thumbnails are
+    made with the stub ffmpeg so runs don't need ffmpeg installed.
+    """
+    os.environ.setdefault("FFMPEG", STUB_FFMPEG)
+    cwd = os.getcwd()
+    if cwd not in sys.path:
+        sys.path.insert(0, cwd)
+    with tempfile.TemporaryDirectory() as log_dir:
+        os.chdir(log_dir)
+        try:
+            return importlib.import_module("yt")
+        finally:
+            os.chdir(cwd)
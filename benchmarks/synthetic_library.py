@@ -0,0 +1,100 @@
+"""Synthetic videos/ tree for benchmarks: media files, meta.json, packed comments, thumbnails and library.db
+
+    python -m benchmarks.synthetic_library /tmp/lib/videos --channels 20 --videos 100 --shorts-ratio 0.25
+"""
+import os
+import sys
+import json
+import random
+import argparse
+
+sys.path.insert(0, ".")
+import library_db
+import comment_store
+import thumbnails
+from benchmarks.stub_ffmpeg import JPEG
+
+WORDS = ("guitar lesson live concert review unboxing tutorial python music vlog travel cooking recipe "
+         "camera drone build setup gaming speedrun history science space rocket launch podcast").split()
+
+
+def is_short_at(index, shorts_ratio):
+    """Spread shorts evenly through a channel: every 1/shorts_ratio-th video is one"""
+    return int((index + 1) * shorts_ratio) > int(index * shorts_ratio)
+
+
+def make_video(videos_dir, channel_dir, index, rng, comments, replies, media_bytes, with_thumbnails=True,
+               shorts_ratio=0.25):
+    """Write one video's files and return its video_id"""
+    video_id = f"{channel_dir}v{index:05d}"
+    is_short = is_short_at(index, shorts_ratio)
+    title = " ".join(rng.choice(WORDS) for _ in range(rng.randint(3, 7))).title()
+    folder = os.path.join(videos_dir, channel_dir, "shorts" if is_short else "videos")
+    os.makedirs(folder, exist_ok=True)
+    with open(os.path.join(folder, f"{title} [{video_id}].mp4"), "wb") as f:
+        f.write(media_bytes)
+
+    comments_dir = os.path.join(videos_dir, channel_dir, "comments", video_id)
+    os.makedirs(comments_dir, exist_ok=True)
+    with open(os.path.join(comments_dir, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump({"video_id": video_id, "title": title, "channel": channel_dir, "upload_date": "20250101",
+                   "duration": 40 if is_short else rng.randint(120, 3600),
+                   "width": 1080 if is_short else 1280, "height": 1920 if is_short else 720,
+                   "downloaded_at": 1735689600 + index}, f)
+
+    threads = []
+    for c in range(comments):
+        comment = {"id": f"{video_id}c{c}", "author": f"@user{c}", "text": "Nice video " * rng.randint(1, 20),
+                   "likes": rng.randint(0, 5000), "timestamp": 1735689600}
+        threads.append((comment, [{"id": f"{video_id}c{c}r{r}", "author": f"@reply{r}", "text": "Agreed",
+                                   "likes": 0, "timestamp": 1735689700} for r in range(replies)]))
+    comment_store.write_comments(comments_dir, threads)
+    with open(os.path.join(comments_dir, "index.json"), "w", encoding="utf-8") as f:
+        json.dump({"video_id": video_id, "top_comments_downloaded": comments,
+                   "replies_downloaded": comments * replies}, f)
+
+    for width in thumbnails.THUMBNAIL_WIDTHS if with_thumbnails else ():
+        with open(thumbnails.thumbnail_path(videos_dir, video_id, width), "wb") as f:
+            f.write(JPEG)
+    return video_id
+
+
+def make_library(videos_dir, channels=10, videos=50, comments=20, replies=3, media_kb=256,
+                 with_thumbnails=True, seed=1, shorts_ratio=0.25):
+    """Build a library of channels x videos entries and index it; returns the video_ids"""
+    rng = random.Random(seed)
+    media_bytes = os.urandom(media_kb * 1024)
+    os.makedirs(thumbnails.thumbnails_dir(videos_dir), exist_ok=True)
+
+    video_ids = []
+    conn = library_db.connect(videos_dir)
+    try:
+        for c in range(channels):
+            channel_dir = f"chan{c:03d}"
+            for i in range(videos):
+                video_ids.append(make_video(videos_dir, channel_dir, i, rng, comments, replies, media_bytes,
+                                            with_thumbnails, shorts_ratio))
+            library_db.index_channel(conn, videos_dir, channel_dir)
+    finally:
+        conn.close()
+    return video_ids
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("videos_dir")
+    parser.add_argument("--channels", type=int, default=10)
+    parser.add_argument("--videos", type=int, default=50, help="Videos per channel")
+    parser.add_argument("--shorts-ratio", type=float, default=0.25, help="Share of each channel's videos that are shorts")
+    parser.add_argument("--comments", type=int, default=20, help="Top-level comments per video")
+    parser.add_argument("--replies", type=int, default=3, help="Replies per comment")
+    parser.add_argument("--media-kb", type=int, default=256)
+    parser.add_argument("--no-thumbnails", action="store_true", help="Leave thumbnails to be generated")
+    args = parser.parse_args()
+    video_ids = make_library(args.videos_dir, args.channels, args.videos, args.comments, args.replies, args.media_kb,
+                             not args.no_thumbnails, shorts_ratio=args.shorts_ratio)
+    print(f"Wrote {len(video_ids)} videos to {args.videos_dir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,355 @@
+import os
+import time
+import random
+import logging
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional
+
+import library_db
+
+# watchdog gives us inotify/FSEvents/ReadDirectoryChangesW events when it is
+# installed; otherwise the catalog falls back to mtime polling
+try:
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+except ImportError:
+    Observer = None
+    FileSystemEventHandler = object
+
+# Row columns that aren't part of the API's view of a video
+INTERNAL_COLUMNS = ("seq",)
+
+# Feed order for clients that don't send their own seed
+DEFAULT_SEED = 42
+# Distinct feed orders: a client's seed picks one, so however many sessions
+# are active, each order is shuffled once per catalog generation. Each kept
+# order is a list of references, 8 bytes per item
+SEED_BUCKETS = 16
+CONTENT_TYPES = ('video', 'shorts', None)
+# Shuffled orders kept per catalog generation: every bucket of every content type
+MAX_CACHED_ORDERS = SEED_BUCKETS * len(CONTENT_TYPES)
+
+
+class _ChannelEventHandler(FileSystemEventHandler):
+    """Forward filesystem events to the catalog as dirty channel names"""
+
+    def __init__(self, catalog):
+        self.catalog = catalog
+
+    def on_any_event(self, event):
+        for path in (getattr(event, 'src_path', None), getattr(event, 'dest_path', None)):
+            if path:
+                self.catalog.mark_dirty(path)
+
+
+class LibraryCatalog:
+    """In-memory mirror of the library database
+
+    Loaded once at startup with a single query, then kept current by applying
+    the rows written since the last seen generation. Channel directories are
+    watched (watchdog events or mtime polling) so files added or removed
+    outside the downloader get reconciled into the database too. Readers never
+    touch the disk: lookups by video_id are a dict hit and the video/shorts
+    lists are kept pre-split.
+    """
+
+    def __init__(self, videos_dir: str, poll_interval: float = 5.0):
+        self.videos_dir = videos_dir
+        self.poll_interval = poll_interval
+
+        self._lock = threading.Lock()
+        self._conn = None
+        self._generation = 0
+        self._items: Dict[str, Dict[str, Any]] = {}
+        self._pending: Dict[str, List[str]] = {}
+        self._signatures: Dict[str, str] = {}
+        self._by_id: Dict[str, Dict[str, Any]] = {}
+        self._all: List[Dict[str, Any]] = []
+        self._videos: List[Dict[str, Any]] = []
+        self._shorts: List[Dict[str, Any]] = []
+        self._orders = OrderedDict()
+        self._orders_lock = threading.Lock()
+
+        # Search runs on request threads, each with its own read connection
+        self._local = threading.local()
+        self._search_conns = []
+        self._search_lock = threading.Lock()
+
+        self._dirty = set()
+        self._dirty_event = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._observer = None
+
+    # -- reads -----------------------------------------------------------
+
+    def get(self, video_id: str) -> Optional[Dict[str, Any]]:
+        return self._by_id.get(video_id)
+
+    def all(self) -> List[Dict[str, Any]]:
+        return self._all
+
+    @property
+    def videos(self) -> List[Dict[str, Any]]:
+        return self._videos
+
+    @property
+    def shorts(self) -> List[Dict[str, Any]]:
+        return self._shorts
+
+    @property
+    def generation(self) -> int:
+        return self._generation
+
+    def cached_shuffle(self, content_type: Optional[str] = None, seed: int = DEFAULT_SEED) -> Optional[List[Dict[str, Any]]]:
+        """The shuffled order if it has already been computed for this generation, else None"""
+        with self._orders_lock:
+            return self._orders.get((content_type, seed % SEED_BUCKETS))
+
+    def shuffled(self, content_type: Optional[str] = None, seed: int = DEFAULT_SEED) -> List[Dict[str, Any]]:
+        """Items in a stable random order for seed
+
+        Seeds share SEED_BUCKETS permutations, each computed once per catalog
+        generation with a private RNG (never the global one), so pages are
+        plain slices of it.
+        """
+        if content_type == 'video':
+            items = self._videos
+        elif content_type == 'shorts':
+            items = self._shorts
+        else:
+            items = self._all
+
+        bucket = seed % SEED_BUCKETS
+        key = (content_type, bucket)
+        orders = self._orders
+        with self._orders_lock:
+            order = orders.get(key)
+            if order is not None:
+                orders.move_to_end(key)
+                return order
+
+        order = list(items)
+        random.Random(bucket).shuffle(order)
+
+        with self._orders_lock:
+            # If the views were rebuilt meanwhile this lands in the discarded cache, which is harmless
+            orders[key] = order
+            while len(orders) > MAX_CACHED_ORDERS:
+                orders.popitem(last=False)
+        return order
+
+    def _search_conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = library_db.connect(self.videos_dir, check_same_thread=False)
+            with self._search_lock:
+                self._search_conns.append(conn)
+        return conn
+
+    def search(self, query: str, limit: int = 20, offset: int = 0) -> List[Dict[str, Any]]:
+        """Videos matching every word of query, best match first"""
+        if not library_db.HAS_FTS5:
+            terms = library_db.search_terms(query)
+            matches = [
+                v for v in self._all
+                if all(t in v['title'].lower() or t in (v.get('channel') or '').lower() for t in terms)
+            ]
+            return matches[offset:offset + limit]
+
+        # Rows the downloader wrote since our last refresh aren't in _by_id yet. They
+        # are skipped before the page is cut, so offsets count only videos we return
+        # and a page is short only when the results run out.
+        conn = self._search_conn()
+        by_id = self._by_id
+        wanted = offset + limit
+        matches = []
+        fetched = 0
+        while len(matches) < wanted:
+            batch = wanted - len(matches)
+            video_ids = library_db.search(conn, query, batch, fetched)
+            fetched += len(video_ids)
+            matches.extend(by_id[video_id] for video_id in video_ids if video_id in by_id)
+            if len(video_ids) < batch:
+                break
+        return matches[offset:offset + limit]
+
+    def storage(self) -> Dict[str, Dict[str, Dict[str, int]]]:
+        """Disk usage per channel and kind, from the running totals in library.db"""
+        return library_db.get_storage(self._search_conn())
+
+    def __len__(self):
+        return len(self._all)
+
+    # -- building --------------------------------------------------------
+
+    def _channel_signature(self, channel_dir: str) -> str:
+        """mtimes of the directories whose entries change when content is added or removed"""
+        channel_path = os.path.join(self.videos_dir, channel_dir)
+        signature = []
+        for sub in ("", "videos", "shorts", "comments"):
+            try:
+                signature.append(str(os.stat(os.path.join(channel_path, sub)).st_mtime_ns))
+            except OSError:
+                signature.append("-")
+        return ":".join(signature)
+
+    def build(self):
+        """Load the catalog from the database, reconciling channels changed since the last run"""
+        start = time.time()
+        self._conn = library_db.connect(self.videos_dir, check_same_thread=False)
+
+        with self._lock:
+            # Only channels whose directories changed while we weren't watching need a rescan;
+            # on a fresh database that is every channel, which migrates an existing library
+            stored = library_db.get_channel_signatures(self._conn)
+            for channel_dir in library_db.list_channel_dirs(self.videos_dir):
+                signature = self._channel_signature(channel_dir)
+                self._signatures[channel_dir] = signature
+                if stored.get(channel_dir) != signature:
+                    self._pending[channel_dir] = library_db.index_channel(
+                        self._conn, self.videos_dir, channel_dir, signature)
+            for channel_dir in set(stored) - set(self._signatures):
+                library_db.remove_channel(self._conn, channel_dir)
+
+            self._apply_changes()
+
+        print(f"Catalog built: {len(self._videos)} videos, {len(self._shorts)} shorts "
+              f"in {time.time() - start:.2f}s")
+
+    def _apply_changes(self):
+        """Pull rows written since our generation and swap in new views; caller holds the lock"""
+        updated, deleted, generation = library_db.changes_since(self._conn, self._generation)
+        if generation == self._generation:
+            return
+
+        for video_id in deleted:
+            self._items.pop(video_id, None)
+        for row in updated:
+            for column in INTERNAL_COLUMNS:
+                row.pop(column, None)
+            self._items[row['video_id']] = row
+        self._generation = generation
+        self._rebuild_views()
+
+    def _rebuild_views(self):
+        # Build new objects and swap references so readers never see a half-updated view
+        all_items = sorted(self._items.values(), key=lambda v: (v['channel_dir'], v['file_path']))
+
+        self._by_id = dict(self._items)
+        self._videos = [v for v in all_items if v['type'] == 'video']
+        self._shorts = [v for v in all_items if v['type'] == 'shorts']
+        self._all = all_items
+        self._orders = OrderedDict()
+
+    def refresh(self):
+        """Pick up rows written by other processes (the downloader)"""
+        with self._lock:
+            self._apply_changes()
+
+    def refresh_channel(self, channel_dir: str):
+        """Reconcile a single channel directory into the database and apply the result"""
+        with self._lock:
+            if os.path.isdir(os.path.join(self.videos_dir, channel_dir)):
+                signature = self._channel_signature(channel_dir)
+                self._pending[channel_dir] = library_db.index_channel(
+                    self._conn, self.videos_dir, channel_dir, signature)
+                self._signatures[channel_dir] = signature
+            else:
+                library_db.remove_channel(self._conn, channel_dir)
+                self._pending.pop(channel_dir, None)
+                self._signatures.pop(channel_dir, None)
+            self._apply_changes()
+
+    # -- watching --------------------------------------------------------
+
+    def mark_dirty(self, path: str):
+        """Queue the channel containing path for a rescan"""
+        rel = os.path.relpath(path, self.videos_dir)
+        channel_dir = rel.split(os.sep, 1)[0]
+        if channel_dir in ('.', '..') or channel_dir.startswith('..'):
+            return
+        # The database and generated thumbnails live next to the channel directories
+        if channel_dir.startswith(library_db.DB_FILENAME) or channel_dir in library_db.NON_CHANNEL_DIRS:
+            return
+        self._dirty.add(channel_dir)
+        self._dirty_event.set()
+
+    def _poll_changes(self):
+        """Find changed channels by comparing directory mtimes"""
+        channels = set(library_db.list_channel_dirs(self.videos_dir))
+        for channel_dir in channels | set(self._signatures):
+            if channel_dir not in channels:
+                self._dirty.add(channel_dir)
+            elif self._channel_signature(channel_dir) != self._signatures.get(channel_dir):
+                self._dirty.add(channel_dir)
+
+    def _watch_loop(self):
+        while not self._stop.is_set():
+            self._dirty_event.wait(self.poll_interval)
+            self._dirty_event.clear()
+            if self._stop.is_set():
+                break
+
+            # Events arrive in bursts while a file is being written; let them settle
+            if self._observer is not None and self._dirty:
+                time.sleep(0.5)
+
+            try:
+                if self._observer is None:
+                    self._poll_changes()
+
+                # meta.json is written after the media file lands, inside a
+                # directory whose mtime we don't track; a stat per pending file covers it
+                for channel_dir, pending in list(self._pending.items()):
+                    if any(os.path.exists(p) for p in pending):
+                        self._dirty.add(channel_dir)
+
+                while self._dirty:
+                    self.refresh_channel(self._dirty.pop())
+
+                self.refresh()
+            except Exception as e:
+                logging.error(f"Catalog refresh failed: {e}")
+
+    def start_watcher(self):
+        """Start keeping the catalog current in a background thread"""
+        if self._thread is not None:
+            return
+
+        if Observer is not None and os.path.isdir(self.videos_dir):
+            try:
+                self._observer = Observer()
+                self._observer.schedule(_ChannelEventHandler(self), self.videos_dir, recursive=True)
+                self._observer.start()
+                print("Catalog watching for filesystem events")
+            except Exception as e:
+                logging.error(f"Filesystem events unavailable, polling instead: {e}")
+                self._observer = None
+
+        if self._observer is None:
+            print(f"Catalog polling for changes every {self.poll_interval}s")
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._watch_loop, name="catalog-watcher", daemon=True)
+        self._thread.start()
+
+    def stop_watcher(self):
+        self._stop.set()
+        self._dirty_event.set()
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer.join()
+            self._observer = None
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+        with self._search_lock:
+            conns, self._search_conns = self._search_conns, []
+        for conn in conns:
+            conn.close()
+        self._local = threading.local()
@@ -0,0 +1,176 @@
+import os
+import json
+import time
+import subprocess
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Any, Dict, List, Optional, Tuple
+
+import library_db
+
+FFPROBE = os.environ.get("FFPROBE", "ffprobe")  # Point at a stub binary to run without ffmpeg
+FFPROBE_TIMEOUT = 30
+WORKERS = os.cpu_count() or 2
+
+# (is_short, how it was decided); is_short is None when nothing could tell
+Classification = Tuple[Optional[bool], Optional[str]]
+
+
+def from_dimensions(width: Optional[int], height: Optional[int]) -> Optional[bool]:
+    """Vertical is a short; None if either dimension is unknown"""
+    if width and height:
+        return height > width
+    return None
+
+
+def from_entry(entry: Any) -> Optional[bool]:
+    """Decide short vs video from a flat playlist entry alone: a /shorts/ URL or known dimensions"""
+    if not isinstance(entry, dict):
+        return None
+    for key in ("url", "webpage_url"):
+        if "/shorts/" in (entry.get(key) or ""):
+            return True
+    return from_dimensions(entry.get("width"), entry.get("height"))
+
+
+def probe_dimensions(video_file: str, ffprobe: Optional[str] = None,
+                     timeout: float = FFPROBE_TIMEOUT) -> Optional[Tuple[int, int]]:
+    """Displayed (width, height) of the first video stream, with rotation applied; None if ffprobe can't tell"""
+    command = [ffprobe or FFPROBE, "-v", "error", "-select_streams", "v:0",
+               "-show_entries", "stream=width,height:stream_tags=rotate:stream_side_data=rotation",
+               "-of", "json", video_file]
+    try:
+        result = subprocess.run(command, check=True, capture_output=True, timeout=timeout)
+        streams = json.loads(result.stdout).get("streams") or []
+    except (subprocess.CalledProcessError, subprocess.TimeoutExpired, OSError, ValueError):
+        return None
+    if not streams or not streams[0].get("width") or not streams[0].get("height"):
+        return None
+    stream = streams[0]
+    width, height = int(stream["width"]), int(stream["height"])
+
+    # Phones store portrait video as landscape frames plus a rotation
+    rotation = (stream.get("tags") or {}).get("rotate")
+    for side_data in stream.get("side_data_list") or []:
+        rotation = side_data.get("rotation", rotation)
+    try:
+        if int(float(rotation or 0)) % 180:
+            width, height = height, width
+    except ValueError:
+        pass
+    return width, height
+
+
+def classify(entry: Any = None, short_ids: Optional[set] = None, info: Optional[Dict[str, Any]] = None,
+             video_file: Optional[str] = None, ffprobe: Optional[str] = None) -> Classification:
+    """Short or video from whatever is at hand, cheapest first; nothing here makes a request
+
+    entry is a flat playlist entry or the listing's record of one (whose tab
+    says where it was listed), short_ids the IDs listed on the channel's shorts
+    tab, info what yt-dlp returned with the download and video_file the media
+    on disk (probed only when nothing else could tell).
+    """
+    is_short = from_entry(entry)
+    if is_short is not None:
+        return is_short, "flat"
+    if isinstance(entry, dict) and (entry.get("tab") == "shorts" or entry.get("id") in (short_ids or ())):
+        return True, "tab"
+    if isinstance(entry, dict) and entry.get("tab") == "videos":
+        # YouTube lists shorts on their own tab only
+        return False, "tab"
+    if info:
+        is_short = from_dimensions(info.get("width"), info.get("height"))
+        if is_short is not None:
+            return is_short, "info"
+    if video_file:
+        dimensions = probe_dimensions(video_file, ffprobe)
+        if dimensions:
+            return from_dimensions(*dimensions), "probe"
+    return None, None
+
+
+def probe_video(video_id: str, video_file: str, ffprobe: Optional[str] = None):
+    """(video_id, dimensions) for the process pool"""
+    return video_id, probe_dimensions(video_file, ffprobe)
+
+
+def move_to_type(videos_dir: str, video: Dict[str, Any], content_type: str) -> str:
+    """Move a video's media into the folder of content_type; returns its new file_path"""
+    folder = "shorts" if content_type == "shorts" else "videos"
+    file_path = os.path.join(video["channel_dir"], folder, os.path.basename(video["file_path"]))
+    if file_path != video["file_path"]:
+        os.makedirs(os.path.join(videos_dir, video["channel_dir"], folder), exist_ok=True)
+        os.replace(os.path.join(videos_dir, video["file_path"]), os.path.join(videos_dir, file_path))
+    return file_path
+
+
+def reclassify_library(videos_dir: str = "videos", workers: Optional[int] = None, probe: bool = False,
+                       dry_run: bool = False) -> List[Dict[str, Any]]:
+    """Fix the type and folder of every indexed video, offline; returns the changes
+
+    Videos whose dimensions are in the index are decided from those; the rest
+    (or all, with probe) are ffprobed on a process pool.
+    """
+    start = time.time()
+    conn = library_db.connect(videos_dir)
+    try:
+        videos = [dict(row) for row in conn.execute(
+            "SELECT video_id, channel_dir, type, file_path, width, height, type_source FROM videos")]
+        decided = {}
+        to_probe = []
+        for video in videos:
+            is_short = None if probe else from_dimensions(video["width"], video["height"])
+            if is_short is not None:
+                # The index's dimensions came from yt-dlp, via the download or meta.json
+                source = video["type_source"] if video["type_source"] not in (None, "folder") else "meta"
+                decided[video["video_id"]] = (is_short, source, None)
+            elif os.path.exists(os.path.join(videos_dir, video["file_path"])):
+                to_probe.append(video)
+
+        if to_probe:
+            workers = workers or WORKERS
+            print(f"Probing {len(to_probe)} videos with {workers} processes")
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                futures = [executor.submit(probe_video, video["video_id"], os.path.join(videos_dir, video["file_path"]))
+                           for video in to_probe]
+                for future in as_completed(futures):
+                    video_id, dimensions = future.result()
+                    if dimensions:
+                        decided[video_id] = (from_dimensions(*dimensions), "probe", dimensions)
+                    else:
+                        print(f"Could not probe {video_id}")
+
+        changes = []
+        retyped = 0
+        for video in videos:
+            if video["video_id"] not in decided:
+                continue
+            is_short, type_source, dimensions = decided[video["video_id"]]
+            content_type = "shorts" if is_short else "video"
+            folder = "shorts" if is_short else "videos"
+            in_place = os.path.basename(os.path.dirname(video["file_path"])) == folder
+            misfiled = content_type != video["type"] or not in_place
+            # Probed dimensions are kept even when the type was right
+            if not misfiled and (dimensions is None or type_source == video["type_source"]):
+                continue
+            change = {"video_id": video["video_id"], "type": content_type, "type_source": type_source,
+                      "file_path": video["file_path"], "width": dimensions and dimensions[0],
+                      "height": dimensions and dimensions[1]}
+            if not dry_run:
+                try:
+                    change["file_path"] = move_to_type(videos_dir, video, content_type)
+                except OSError as e:
+                    print(f"Could not move {video['file_path']}: {e}")
+                    continue
+            if misfiled:
+                print(f"{video['file_path']}: {video['type']} -> {content_type} ({type_source})")
+                retyped += 1
+            changes.append(change)
+
+        if not dry_run:
+            library_db.reclassify_videos(conn, changes)
+    finally:
+        conn.close()
+
+    print(f"Checked {len(videos)} videos in {time.time() - start:.2f}s: {retyped} misfiled"
+          + (" (dry run, nothing moved)" if dry_run else ""))
+    return changes
@@ -0,0 +1,274 @@
+import os
+import json
+import shutil
+from typing import List, Dict, Any, Optional, Tuple
+
+import library_db
+
+# One file per video:
+#   line 1   header: {"format": 1, "top_count": N, "reply_count": M, "top": [...]}
+#   then     every top-level comment, one JSON object per line, in rank order
+#   then     every reply, grouped by parent in the same order
+#
+# header["top"][i] is [comment_id, offset, length, replies_offset, replies_length, reply_count]
+# with offsets relative to the first byte after the header line. A page of
+# top-level comments is one contiguous read, as are the replies of one comment.
+COMMENTS_FILE = "comments.jsonl"
+FORMAT_VERSION = 1
+
+TOP_ID, TOP_OFFSET, TOP_LENGTH, REPLIES_OFFSET, REPLIES_LENGTH, REPLY_COUNT = range(6)
+
+# Layout written by older versions of yt.py: top/c_00001.json, replies/c_00001/r_00001.json
+LEGACY_DIRS = ("top", "replies")
+
+
+def _encode(record: Dict[str, Any]) -> bytes:
+    return (json.dumps(record, ensure_ascii=False, separators=(',', ':')) + "\n").encode('utf-8')
+
+
+def comments_file(comments_dir: str) -> str:
+    return os.path.join(comments_dir, COMMENTS_FILE)
+
+
+def write_comments(comments_dir: str, threads: List[Tuple[Dict[str, Any], List[Dict[str, Any]]]]) -> int:
+    """Write (comment, replies) threads in one buffered pass; returns bytes written
+
+    The file is written to a temp name and renamed so readers never see a partial file.
+    """
+    top_lines = [_encode(comment) for comment, _ in threads]
+    reply_blocks = [b"".join(_encode(reply) for reply in replies) for _, replies in threads]
+
+    entries = []
+    offset = 0
+    for (comment, _), line in zip(threads, top_lines):
+        entries.append([comment.get('id'), offset, len(line), 0, 0, 0])
+        offset += len(line)
+    for entry, (_, replies), block in zip(entries, threads, reply_blocks):
+        entry[REPLIES_OFFSET] = offset
+        entry[REPLIES_LENGTH] = len(block)
+        entry[REPLY_COUNT] = len(replies)
+        offset += len(block)
+
+    header = _encode({
+        "format": FORMAT_VERSION,
+        "top_count": len(threads),
+        "reply_count": sum(len(replies) for _, replies in threads),
+        "top": entries
+    })
+
+    os.makedirs(comments_dir, exist_ok=True)
+    path = comments_file(comments_dir)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(header)
+        f.writelines(top_lines)
+        f.writelines(reply_blocks)
+    os.replace(tmp_path, path)
+    return len(header) + offset
+
+
+def has_comments(comments_dir: str) -> bool:
+    """True if comments were saved for this video, in either layout"""
+    if os.path.exists(comments_file(comments_dir)):
+        return True
+    top_dir = os.path.join(comments_dir, "top")
+    return os.path.isdir(top_dir) and len(os.listdir(top_dir)) > 0
+
+
+def _read_lines(f, body_start: int, offset: int, length: int) -> List[bytes]:
+    if length <= 0:
+        return []
+    f.seek(body_start + offset)
+    return [line for line in f.read(length).splitlines() if line]
+
+
+def _slice(items: list, start: int, limit: Optional[int]) -> list:
+    return items[start:] if limit is None else items[start:start + limit]
+
+
+class PackedComments:
+    """Open handle on a packed comments file; only the header is parsed up front"""
+
+    def __init__(self, comments_dir: str):
+        self.path = comments_file(comments_dir)
+        self._f = open(self.path, 'rb')
+        header_line = self._f.readline()
+        self.header = json.loads(header_line)
+        self.body_start = len(header_line)
+        self.top = self.header["top"]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._f.close()
+
+    @property
+    def top_count(self) -> int:
+        return len(self.top)
+
+    def index_of(self, comment_id: str) -> Optional[int]:
+        for i, entry in enumerate(self.top):
+            if entry[TOP_ID] == comment_id:
+                return i
+        return None
+
+    def comment_lines(self, start: int = 0, limit: Optional[int] = None) -> List[bytes]:
+        """Raw JSON lines of top-level comments [start, start + limit) in one read"""
+        end = self.top_count if limit is None else min(self.top_count, start + limit)
+        if start >= end:
+            return []
+        first, last = self.top[start], self.top[end - 1]
+        length = last[TOP_OFFSET] + last[TOP_LENGTH] - first[TOP_OFFSET]
+        return _read_lines(self._f, self.body_start, first[TOP_OFFSET], length)
+
+    def comments(self, start: int = 0, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        return [json.loads(line) for line in self.comment_lines(start, limit)]
+
+    def replies(self, index: int, start: int = 0, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Replies of one top-level comment; only the requested slice is parsed"""
+        entry = self.top[index]
+        lines = _read_lines(self._f, self.body_start, entry[REPLIES_OFFSET], entry[REPLIES_LENGTH])
+        return [json.loads(line) for line in _slice(lines, start, limit)]
+
+    def reply_count(self, index: int) -> int:
+        return self.top[index][REPLY_COUNT]
+
+
+def read_legacy_comments(comments_dir: str) -> List[Tuple[Dict[str, Any], List[Dict[str, Any]]]]:
+    """Read the one-file-per-comment layout into (comment, replies) threads"""
+    threads = []
+    top_dir = os.path.join(comments_dir, "top")
+    replies_dir = os.path.join(comments_dir, "replies")
+    if not os.path.exists(top_dir):
+        return threads
+
+    for comment_file in sorted(os.listdir(top_dir)):
+        if not comment_file.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(top_dir, comment_file), 'r', encoding='utf-8') as f:
+                comment = json.load(f)
+        except (OSError, ValueError):
+            continue
+
+        replies = []
+        comment_replies_dir = os.path.join(replies_dir, f"c_{comment_file.split('_')[1].split('.')[0]}")
+        if os.path.exists(comment_replies_dir):
+            for reply_file in sorted(os.listdir(comment_replies_dir)):
+                if not reply_file.endswith('.json'):
+                    continue
+                try:
+                    with open(os.path.join(comment_replies_dir, reply_file), 'r', encoding='utf-8') as rf:
+                        replies.append(json.load(rf))
+                except (OSError, ValueError):
+                    pass
+        threads.append((comment, replies))
+    return threads
+
+
+class LegacyComments:
+    """Same interface as PackedComments over the one-file-per-comment layout
+
+    Everything is loaded up front; run migrate-comments to get paged reads.
+    """
+
+    def __init__(self, comments_dir: str):
+        self.threads = read_legacy_comments(comments_dir)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        pass
+
+    @property
+    def top_count(self) -> int:
+        return len(self.threads)
+
+    def index_of(self, comment_id: str) -> Optional[int]:
+        for i, (comment, _) in enumerate(self.threads):
+            if comment.get('id') == comment_id:
+                return i
+        return None
+
+    def comment_lines(self, start: int = 0, limit: Optional[int] = None) -> List[bytes]:
+        return [_encode(comment).rstrip(b"\n") for comment in self.comments(start, limit)]
+
+    def comments(self, start: int = 0, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        return [dict(comment) for comment, _ in _slice(self.threads, start, limit)]
+
+    def replies(self, index: int, start: int = 0, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        return [dict(reply) for reply in _slice(self.threads[index][1], start, limit)]
+
+    def reply_count(self, index: int) -> int:
+        return len(self.threads[index][1])
+
+
+def open_comments(comments_dir: str):
+    """Open a video's comments for paged reads, whichever layout is on disk"""
+    if os.path.exists(comments_file(comments_dir)):
+        return PackedComments(comments_dir)
+    return LegacyComments(comments_dir)
+
+
+def read_threads(comments_dir: str) -> List[Tuple[Dict[str, Any], List[Dict[str, Any]]]]:
+    """All (comment, replies) threads of a video, from whichever layout is on disk"""
+    with open_comments(comments_dir) as store:
+        return [(comment, store.replies(i)) for i, comment in enumerate(store.comments())]
+
+
+def remove_legacy_dirs(comments_dir: str) -> List[str]:
+    """Delete the legacy top/ and replies/ folders of a comment directory; returns the files they held
+
+    Names are relative to comments_dir, as the library index's size accounting keys them.
+    """
+    legacy = [name for name in library_db.folder_file_sizes(comments_dir) if name.split(os.sep)[0] in LEGACY_DIRS]
+    for name in LEGACY_DIRS:
+        shutil.rmtree(os.path.join(comments_dir, name), ignore_errors=True)
+    return legacy
+
+
+def migrate_comment_dir(comments_dir: str, conn=None) -> Optional[int]:
+    """Pack a legacy comment directory in place; returns bytes written or None if nothing to do
+
+    With conn, the library index's size accounting swaps the legacy files for the packed one.
+    """
+    if not os.path.isdir(os.path.join(comments_dir, "top")):
+        return None
+    size = write_comments(comments_dir, read_legacy_comments(comments_dir))
+    legacy = remove_legacy_dirs(comments_dir)
+    if conn is not None:
+        # videos/<channel>/comments/<video_id>
+        video_id = os.path.basename(comments_dir)
+        channel_dir = os.path.basename(os.path.dirname(os.path.dirname(comments_dir)))
+        sizes = dict.fromkeys(legacy)
+        sizes[COMMENTS_FILE] = size
+        library_db.track_files(conn, channel_dir, video_id, "comments", sizes)
+    return size
+
+
+def migrate_library(videos_dir: str = "videos"):
+    """Pack every legacy comment directory under videos/<channel>/comments/"""
+    migrated = 0
+    conn = library_db.connect(videos_dir)
+    try:
+        for channel_dir in library_db.list_channel_dirs(videos_dir):
+            channel_comments = os.path.join(videos_dir, channel_dir, "comments")
+            if not os.path.isdir(channel_comments):
+                continue
+            for video_id in sorted(os.listdir(channel_comments)):
+                try:
+                    if migrate_comment_dir(os.path.join(channel_comments, video_id), conn) is not None:
+                        migrated += 1
+                except Exception as e:
+                    print(f"Failed to migrate comments for {channel_dir}/{video_id}: {e}")
+    finally:
+        conn.close()
+    print(f"Migrated {migrated} comment directories to {COMMENTS_FILE}")
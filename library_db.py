@@ -0,0 +1,723 @@
+import os
+import re
+import json
+import time
+import sqlite3
+from typing import List, Dict, Any, Iterable, Optional, Tuple
+
+DB_FILENAME = "library.db"
+
+VIDEO_EXTENSIONS = ('.mp4', '.mkv', '.webm')
+
+# Folder name inside a channel directory -> content type reported by the API
+CONTENT_FOLDERS = (("videos", "video"), ("shorts", "shorts"))
+
+# Directories under videos/ that aren't channels (thumbnails.py and response_cache.py write here)
+NON_CHANNEL_DIRS = ("thumbnails", ".response_cache")
+
+# Stages of a video's job in yt.py's journal, in order. A job is recorded
+# before each stage starts, so a killed run resumes at the stage it was in;
+# finish_job removes it once it's done
+JOB_STAGES = ("queued", "media", "thumbnail", "comments")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+
+CREATE TABLE IF NOT EXISTS channels (
+    channel_dir TEXT PRIMARY KEY,
+    url TEXT,
+    dir_signature TEXT,
+    last_indexed INTEGER
+);
+
+-- Where yt.py got to on each channel's uploads, so a re-run only walks what's new
+CREATE TABLE IF NOT EXISTS channel_sync (
+    channel_dir TEXT PRIMARY KEY,
+    channel_id TEXT,
+    newest_video_id TEXT,
+    newest_upload_date TEXT,
+    feed_signature TEXT,
+    last_synced INTEGER,
+    newest_short_id TEXT,
+    base_url TEXT
+);
+
+-- Plays recorded by the backend, one row per video, for retention; not part of
+-- the catalog, so writing them doesn't bump the generation
+CREATE TABLE IF NOT EXISTS video_access (
+    video_id TEXT PRIMARY KEY,
+    last_played INTEGER NOT NULL,
+    plays INTEGER NOT NULL DEFAULT 0
+);
+
+-- Write-ahead journal of yt.py's per-video work: the stage each unfinished
+-- video is at, so a killed run resumes where it stopped; rows go when done
+CREATE TABLE IF NOT EXISTS jobs (
+    video_id TEXT PRIMARY KEY,
+    channel_dir TEXT NOT NULL,
+    stage TEXT NOT NULL,
+    entry TEXT,
+    media_file TEXT,
+    updated_at INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_channel ON jobs(channel_dir);
+
+-- Bytes on disk of every file belonging to a video (its media, the files in its
+-- comments folder, its thumbnails), recorded as they are written, with running
+-- totals per channel and kind so disk usage is read without walking the tree.
+-- Not part of the catalog, so writing them doesn't bump the generation
+CREATE TABLE IF NOT EXISTS video_files (
+    video_id TEXT NOT NULL,
+    name TEXT NOT NULL,
+    channel_dir TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    PRIMARY KEY (video_id, name)
+);
+CREATE TABLE IF NOT EXISTS channel_storage (
+    channel_dir TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    bytes INTEGER NOT NULL DEFAULT 0,
+    files INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (channel_dir, kind)
+);
+
+CREATE TABLE IF NOT EXISTS videos (
+    video_id TEXT PRIMARY KEY,
+    channel_dir TEXT NOT NULL,
+    channel TEXT,
+    title TEXT,
+    type TEXT NOT NULL,
+    file_path TEXT NOT NULL,
+    comments_path TEXT,
+    duration INTEGER,
+    width INTEGER,
+    height INTEGER,
+    file_size INTEGER,
+    upload_date TEXT,
+    comment_count INTEGER DEFAULT 0,
+    reply_count INTEGER DEFAULT 0,
+    downloaded_at INTEGER,
+    type_source TEXT,
+    seq INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_videos_channel ON videos(channel_dir);
+CREATE INDEX IF NOT EXISTS idx_videos_type ON videos(type);
+CREATE INDEX IF NOT EXISTS idx_videos_seq ON videos(seq);
+
+-- Tombstones so readers can apply deletions incrementally
+CREATE TABLE IF NOT EXISTS deleted_videos (
+    video_id TEXT PRIMARY KEY,
+    seq INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_deleted_seq ON deleted_videos(seq);
+"""
+
+# Full-text index over titles and channel names. Each row shares the rowid of
+# its videos row and is kept in step by _write_video/_remove_video; prefix
+# indexes make type-ahead queries cheap
+FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS videos_fts USING fts5(
+    video_id UNINDEXED,
+    title,
+    channel,
+    tokenize = 'unicode61 remove_diacritics 2',
+    prefix = '2 3'
+);
+"""
+
+# Columns added after databases were already out there; connect() adds them to older ones
+ADDED_COLUMNS = (
+    ("videos", "type_source", "TEXT"),
+    ("channel_sync", "newest_short_id", "TEXT"),
+    ("channel_sync", "base_url", "TEXT"),
+)
+
+# How a video's type (video or shorts) was decided, most to least direct:
+#   flat   - the flat playlist entry (a /shorts/ URL or its dimensions)
+#   tab    - the channel tab that listed it (videos or shorts)
+#   info   - dimensions in the info yt-dlp returned with the download
+#   probe  - ffprobe of the local file
+#   meta   - dimensions in meta.json, when indexing files found on disk
+#   folder - the folder the file is in, when nothing else says
+TYPE_SOURCES = ("flat", "tab", "info", "probe", "meta", "folder")
+
+# What a video's files are counted as in channel_storage
+STORAGE_KINDS = ("media", "comments", "thumbnails")
+
+# video_files name of a video's media file (there is only ever one)
+MEDIA_FILE = "media"
+
+# bm25 column weights: a title match counts more than a channel-name match
+FTS_WEIGHTS = (0.0, 10.0, 4.0)
+
+VIDEO_COLUMNS = (
+    "video_id", "channel_dir", "channel", "title", "type", "file_path", "comments_path",
+    "duration", "width", "height", "file_size", "upload_date", "comment_count",
+    "reply_count", "downloaded_at", "type_source",
+)
+
+
+def _fts5_available() -> bool:
+    try:
+        sqlite3.connect(":memory:").execute("CREATE VIRTUAL TABLE t USING fts5(x)")
+        return True
+    except sqlite3.OperationalError:
+        return False
+
+
+# Some SQLite builds ship without FTS5; search falls back to a substring scan there
+HAS_FTS5 = _fts5_available()
+
+
+def parse_video_id(filename: str) -> str:
+    """Extract video_id from a "Title [video_id].ext" filename"""
+    base_name = os.path.splitext(filename)[0]
+    if '[' in base_name and ']' in base_name:
+        return base_name.split('[')[-1].rstrip(']').strip()
+    return base_name
+
+
+def db_path(videos_dir: str) -> str:
+    return os.path.join(videos_dir, DB_FILENAME)
+
+
+def connect(videos_dir: str = "videos", check_same_thread: bool = True) -> sqlite3.Connection:
+    """Open the library database, creating it if needed
+
+    WAL lets the backend keep reading while the downloader writes.
+    """
+    os.makedirs(videos_dir, exist_ok=True)
+    conn = sqlite3.connect(db_path(videos_dir), timeout=30, check_same_thread=check_same_thread)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(SCHEMA)
+    _ensure_columns(conn)
+    conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('generation', '0')")
+    conn.commit()
+    if HAS_FTS5:
+        _ensure_search_index(conn)
+    _ensure_storage(conn)
+    return conn
+
+
+def _ensure_columns(conn: sqlite3.Connection):
+    existing = {}
+    for table, name, declaration in ADDED_COLUMNS:
+        if table not in existing:
+            existing[table] = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+        if name not in existing[table]:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {name} {declaration}")
+
+
+def _ensure_search_index(conn: sqlite3.Connection):
+    """Create the full-text index, filling it from the videos table on databases that predate it"""
+    conn.executescript(FTS_SCHEMA)
+    with conn:
+        if conn.execute("SELECT 1 FROM meta WHERE key = 'fts'").fetchone():
+            return
+        conn.execute("DELETE FROM videos_fts")
+        conn.execute("INSERT INTO videos_fts (rowid, video_id, title, channel) "
+                     "SELECT rowid, video_id, title, channel FROM videos")
+        conn.execute("INSERT INTO meta (key, value) VALUES ('fts', '1')")
+
+
+def _ensure_storage(conn: sqlite3.Connection):
+    """Fill storage accounting from the media sizes already indexed, on databases that predate it
+
+    Comment and thumbnail bytes of older videos are counted as they are next
+    written, or all at once by a rebuild.
+    """
+    with conn:
+        if conn.execute("SELECT 1 FROM meta WHERE key = 'storage'").fetchone():
+            return
+        conn.execute("DELETE FROM video_files")
+        conn.execute("INSERT INTO video_files (video_id, name, channel_dir, kind, size) "
+                     "SELECT video_id, ?, channel_dir, 'media', file_size FROM videos WHERE file_size IS NOT NULL",
+                     (MEDIA_FILE,))
+        _recount_storage(conn)
+        conn.execute("INSERT INTO meta (key, value) VALUES ('storage', '1')")
+
+
+def _recount_storage(conn: sqlite3.Connection):
+    """Recompute channel_storage from video_files; must be called inside a write transaction"""
+    conn.execute("DELETE FROM channel_storage")
+    conn.execute("INSERT INTO channel_storage (channel_dir, kind, bytes, files) "
+                 "SELECT channel_dir, kind, SUM(size), COUNT(*) FROM video_files GROUP BY channel_dir, kind")
+
+
+def _next_seq(conn: sqlite3.Connection) -> int:
+    """Bump the library generation; must be called inside a write transaction"""
+    conn.execute("UPDATE meta SET value = CAST(value AS INTEGER) + 1 WHERE key = 'generation'")
+    return int(conn.execute("SELECT value FROM meta WHERE key = 'generation'").fetchone()[0])
+
+
+def get_generation(conn: sqlite3.Connection) -> int:
+    row = conn.execute("SELECT value FROM meta WHERE key = 'generation'").fetchone()
+    return int(row[0]) if row else 0
+
+
+def _delete_search_row(conn: sqlite3.Connection, video_id: str):
+    row = conn.execute("SELECT rowid FROM videos WHERE video_id = ?", (video_id,)).fetchone()
+    if row:
+        conn.execute("DELETE FROM videos_fts WHERE rowid = ?", (row[0],))
+
+
+def _write_video(conn: sqlite3.Connection, record: Dict[str, Any], seq: int):
+    if HAS_FTS5:
+        _delete_search_row(conn, record["video_id"])
+    values = [record.get(col) for col in VIDEO_COLUMNS]
+    cursor = conn.execute(
+        f"INSERT OR REPLACE INTO videos ({', '.join(VIDEO_COLUMNS)}, seq) "
+        f"VALUES ({', '.join('?' for _ in VIDEO_COLUMNS)}, ?)",
+        values + [seq]
+    )
+    conn.execute("DELETE FROM deleted_videos WHERE video_id = ?", (record["video_id"],))
+    if record.get("file_size") is not None:
+        _track_file(conn, record["channel_dir"], record["video_id"], "media", MEDIA_FILE, record["file_size"])
+    if HAS_FTS5:
+        conn.execute("INSERT INTO videos_fts (rowid, video_id, title, channel) VALUES (?, ?, ?, ?)",
+                     (cursor.lastrowid, record["video_id"], record.get("title"), record.get("channel")))
+
+
+def _remove_video(conn: sqlite3.Connection, video_id: str, seq: int):
+    if HAS_FTS5:
+        _delete_search_row(conn, video_id)
+    conn.execute("DELETE FROM videos WHERE video_id = ?", (video_id,))
+    conn.execute("DELETE FROM video_access WHERE video_id = ?", (video_id,))
+    _forget_files(conn, video_id)
+    conn.execute("INSERT OR REPLACE INTO deleted_videos (video_id, seq) VALUES (?, ?)", (video_id, seq))
+
+
+def upsert_video(conn: sqlite3.Connection, record: Dict[str, Any]):
+    """Insert or replace one video row in its own transaction"""
+    with conn:
+        _write_video(conn, record, _next_seq(conn))
+
+
+def delete_video(conn: sqlite3.Connection, video_id: str):
+    with conn:
+        _remove_video(conn, video_id, _next_seq(conn))
+
+
+def update_comment_counts(conn: sqlite3.Connection, video_id: str, comment_count: int, reply_count: int):
+    with conn:
+        conn.execute(
+            "UPDATE videos SET comment_count = ?, reply_count = ?, seq = ? WHERE video_id = ?",
+            (comment_count, reply_count, _next_seq(conn), video_id)
+        )
+
+
+def reclassify_videos(conn: sqlite3.Connection, updates: List[Dict[str, Any]]):
+    """Apply new types in one transaction: dicts of video_id, type, file_path, type_source and optional width/height"""
+    if not updates:
+        return
+    with conn:
+        seq = _next_seq(conn)
+        conn.executemany(
+            "UPDATE videos SET type = :type, file_path = :file_path, type_source = :type_source, "
+            "width = COALESCE(:width, width), height = COALESCE(:height, height), seq = :seq WHERE video_id = :video_id",
+            [dict({"width": None, "height": None}, **update, seq=seq) for update in updates]
+        )
+
+
+def get_video(conn: sqlite3.Connection, video_id: str) -> Optional[Dict[str, Any]]:
+    row = conn.execute("SELECT * FROM videos WHERE video_id = ?", (video_id,)).fetchone()
+    return dict(row) if row else None
+
+
+def get_channel_video_ids(conn: sqlite3.Connection, channel_dir: str) -> set:
+    rows = conn.execute("SELECT video_id FROM videos WHERE channel_dir = ?", (channel_dir,))
+    return {row[0] for row in rows}
+
+
+def changes_since(conn: sqlite3.Connection, seq: int):
+    """Return (updated_rows, deleted_ids, generation) for everything written after seq"""
+    generation = get_generation(conn)
+    if generation <= seq:
+        return [], [], generation
+    updated = [dict(row) for row in conn.execute("SELECT * FROM videos WHERE seq > ?", (seq,))]
+    deleted = [row[0] for row in conn.execute("SELECT video_id FROM deleted_videos WHERE seq > ?", (seq,))]
+    return updated, deleted, generation
+
+
+def search_terms(query: str) -> List[str]:
+    """Lowercased word tokens of a search box query"""
+    return re.findall(r"\w+", query.lower())
+
+
+def search(conn: sqlite3.Connection, query: str, limit: int = 20, offset: int = 0) -> List[str]:
+    """video_ids matching every term of query, best BM25 match first
+
+    Every term is matched as a prefix so results show up while typing.
+    """
+    terms = search_terms(query)
+    if not terms:
+        return []
+    match = " AND ".join('"' + term.replace('"', '""') + '"*' for term in terms)
+    rows = conn.execute(
+        f"SELECT video_id FROM videos_fts WHERE videos_fts MATCH ? "
+        f"ORDER BY bm25(videos_fts, {', '.join(str(w) for w in FTS_WEIGHTS)}) LIMIT ? OFFSET ?",
+        (match, limit, offset)
+    )
+    return [row[0] for row in rows]
+
+
+def get_channel_signatures(conn: sqlite3.Connection) -> Dict[str, str]:
+    return {row[0]: row[1] for row in conn.execute("SELECT channel_dir, dir_signature FROM channels")}
+
+
+def set_channel_signature(conn: sqlite3.Connection, channel_dir: str, signature: Optional[str]):
+    with conn:
+        conn.execute(
+            "INSERT INTO channels (channel_dir, dir_signature, last_indexed) VALUES (?, ?, ?) "
+            "ON CONFLICT(channel_dir) DO UPDATE SET dir_signature = excluded.dir_signature, "
+            "last_indexed = excluded.last_indexed",
+            (channel_dir, signature, int(time.time()))
+        )
+
+
+def record_plays(conn: sqlite3.Connection, plays: Dict[str, Tuple[int, int]]):
+    """Add {video_id: (last_played, count)} to the access log in one transaction"""
+    with conn:
+        conn.executemany(
+            "INSERT INTO video_access (video_id, last_played, plays) VALUES (?, ?, ?) "
+            "ON CONFLICT(video_id) DO UPDATE SET last_played = MAX(last_played, excluded.last_played), "
+            "plays = plays + excluded.plays",
+            [(video_id, last_played, count) for video_id, (last_played, count) in plays.items()]
+        )
+
+
+def get_last_played(conn: sqlite3.Connection) -> Dict[str, int]:
+    return {row[0]: row[1] for row in conn.execute("SELECT video_id, last_played FROM video_access")}
+
+
+def journal_stage(conn: sqlite3.Connection, video_id: str, channel_dir: str, stage: str,
+                  entry: Optional[Dict[str, Any]] = None, media_file: Optional[str] = None):
+    """Record that a video's job has reached stage; entry and media_file are kept unless given"""
+    if stage not in JOB_STAGES:
+        raise ValueError(f"Unknown job stage {stage!r}, expected one of {', '.join(JOB_STAGES)}")
+    with conn:
+        conn.execute(
+            "INSERT INTO jobs (video_id, channel_dir, stage, entry, media_file, updated_at) VALUES (?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT(video_id) DO UPDATE SET stage = excluded.stage, "
+            "entry = COALESCE(excluded.entry, entry), media_file = COALESCE(excluded.media_file, media_file), "
+            "updated_at = excluded.updated_at",
+            (video_id, channel_dir, stage, json.dumps(entry) if entry is not None else None, media_file,
+             int(time.time()))
+        )
+
+
+def finish_job(conn: sqlite3.Connection, video_id: str):
+    with conn:
+        conn.execute("DELETE FROM jobs WHERE video_id = ?", (video_id,))
+
+
+def get_jobs(conn: sqlite3.Connection, channel_dir: str) -> List[Dict[str, Any]]:
+    """Unfinished jobs of a channel, oldest first, with entry decoded"""
+    jobs = []
+    for row in conn.execute("SELECT * FROM jobs WHERE channel_dir = ? ORDER BY updated_at", (channel_dir,)):
+        job = dict(row)
+        job["entry"] = json.loads(job["entry"]) if job["entry"] else None
+        jobs.append(job)
+    return jobs
+
+
+def _track_file(conn: sqlite3.Connection, channel_dir: str, video_id: str, kind: str, name: str,
+                size: Optional[int]):
+    """Set one file's size (None: it's gone) and apply the difference to its channel's total"""
+    row = conn.execute("SELECT size, channel_dir, kind FROM video_files WHERE video_id = ? AND name = ?",
+                       (video_id, name)).fetchone()
+    if row is not None:
+        _add_storage(conn, row[1], row[2], -row[0], -1)
+    if size is None:
+        conn.execute("DELETE FROM video_files WHERE video_id = ? AND name = ?", (video_id, name))
+        return
+    conn.execute("INSERT OR REPLACE INTO video_files (video_id, name, channel_dir, kind, size) VALUES (?, ?, ?, ?, ?)",
+                 (video_id, name, channel_dir, kind, size))
+    _add_storage(conn, channel_dir, kind, size, 1)
+
+
+def _add_storage(conn: sqlite3.Connection, channel_dir: str, kind: str, size: int, files: int):
+    conn.execute(
+        "INSERT INTO channel_storage (channel_dir, kind, bytes, files) VALUES (?, ?, ?, ?) "
+        "ON CONFLICT(channel_dir, kind) DO UPDATE SET bytes = bytes + excluded.bytes, files = files + excluded.files",
+        (channel_dir, kind, size, files)
+    )
+
+
+def _forget_files(conn: sqlite3.Connection, video_id: str):
+    """Drop every file of a video from the accounting"""
+    rows = conn.execute("SELECT channel_dir, kind, SUM(size), COUNT(*) FROM video_files WHERE video_id = ? "
+                        "GROUP BY channel_dir, kind", (video_id,)).fetchall()
+    for channel_dir, kind, size, files in rows:
+        _add_storage(conn, channel_dir, kind, -size, -files)
+    conn.execute("DELETE FROM video_files WHERE video_id = ?", (video_id,))
+
+
+def track_files(conn: sqlite3.Connection, channel_dir: str, video_id: str, kind: str,
+                sizes: Dict[str, Optional[int]]):
+    """Record the sizes of files just written ({name: bytes}) or deleted ({name: None}) in one transaction"""
+    with conn:
+        for name, size in sizes.items():
+            _track_file(conn, channel_dir, video_id, kind, name, size)
+
+
+def forget_files(conn: sqlite3.Connection, video_ids: Iterable[str]):
+    """Drop the accounting of videos whose files were deleted without an index row (e.g. orphan comments)"""
+    with conn:
+        for video_id in video_ids:
+            _forget_files(conn, video_id)
+
+
+def get_video_storage(conn: sqlite3.Connection, video_id: str) -> Dict[str, int]:
+    """Bytes per kind of one video's files"""
+    rows = conn.execute("SELECT kind, SUM(size) FROM video_files WHERE video_id = ? GROUP BY kind", (video_id,))
+    return {row[0]: row[1] for row in rows}
+
+
+def get_storage(conn: sqlite3.Connection) -> Dict[str, Dict[str, Dict[str, int]]]:
+    """{channel_dir: {kind: {"bytes", "files"}}} from the running totals; no files are touched"""
+    storage = {}
+    for channel_dir, kind, size, files in conn.execute(
+            "SELECT channel_dir, kind, bytes, files FROM channel_storage WHERE files > 0 ORDER BY channel_dir"):
+        storage.setdefault(channel_dir, {})[kind] = {"bytes": size, "files": files}
+    return storage
+
+
+def get_channel_sync(conn: sqlite3.Connection, channel_dir: str) -> Optional[Dict[str, Any]]:
+    row = conn.execute("SELECT * FROM channel_sync WHERE channel_dir = ?", (channel_dir,)).fetchone()
+    return dict(row) if row else None
+
+
+def save_channel_sync(conn: sqlite3.Connection, channel_dir: str, channel_id: Optional[str],
+                      newest_video_id: Optional[str], newest_upload_date: Optional[str],
+                      feed_signature: Optional[str], newest_short_id: Optional[str] = None,
+                      base_url: Optional[str] = None):
+    """Record a finished sync; not a library change, so the generation stays put
+
+    base_url is the form of the channel URL that listed it, tried first next time.
+    """
+    with conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO channel_sync (channel_dir, channel_id, newest_video_id, newest_upload_date, "
+            "feed_signature, last_synced, newest_short_id, base_url) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (channel_dir, channel_id, newest_video_id, newest_upload_date, feed_signature, int(time.time()),
+             newest_short_id, base_url)
+        )
+
+
+def video_record(channel_dir: str, content_type: str, video_file: str, meta: Dict[str, Any],
+                 file_size: Optional[int] = None, width: Optional[int] = None,
+                 height: Optional[int] = None, type_source: Optional[str] = None,
+                 folder: Optional[str] = None) -> Dict[str, Any]:
+    """Build a videos row from a media filename and its meta.json contents
+
+    The file is looked for in the folder of its type unless folder says otherwise.
+    """
+    video_id = meta.get("video_id") or parse_video_id(video_file)
+    folder = folder or ("shorts" if content_type == "shorts" else "videos")
+    return {
+        "video_id": video_id,
+        "channel_dir": channel_dir,
+        "channel": meta.get("channel") or channel_dir,
+        "title": meta.get("title") or os.path.splitext(video_file)[0],
+        "type": content_type,
+        "file_path": os.path.join(channel_dir, folder, video_file),
+        "comments_path": os.path.join(channel_dir, "comments", video_id),
+        "duration": meta.get("duration") or 0,
+        "width": width if width is not None else meta.get("width"),
+        "height": height if height is not None else meta.get("height"),
+        "file_size": file_size,
+        "upload_date": meta.get("upload_date"),
+        "comment_count": meta.get("comment_count", 0),
+        "reply_count": meta.get("reply_count", 0),
+        "downloaded_at": meta.get("downloaded_at"),
+        "type_source": type_source,
+    }
+
+
+def _read_comment_counts(comments_path: str) -> Dict[str, int]:
+    try:
+        with open(os.path.join(comments_path, "index.json"), 'r', encoding='utf-8') as f:
+            index = json.load(f)
+        return {
+            "comment_count": index.get("top_comments_downloaded", 0),
+            "reply_count": index.get("replies_downloaded", 0),
+        }
+    except (OSError, ValueError):
+        return {}
+
+
+def folder_file_sizes(path: str) -> Dict[str, int]:
+    """{name: bytes} of the files under path, subfolders (e.g. legacy top/ and replies/ comments) as relative paths"""
+    sizes = {}
+    for root, _, names in os.walk(path):
+        for name in names:
+            file_path = os.path.join(root, name)
+            try:
+                sizes[os.path.relpath(file_path, path)] = os.path.getsize(file_path)
+            except OSError:
+                continue
+    return sizes
+
+
+def thumbnail_file_sizes(videos_dir: str, video_ids: Iterable[str]) -> Dict[str, Dict[str, int]]:
+    """{video_id: {name: bytes}} of the stored thumbnails of video_ids: thumbnails/<video_id>.jpg and <video_id>_<width>.jpg
+
+    One scan of the thumbnails folder, however many videos are asked for.
+    """
+    wanted = set(video_ids)
+    sizes = {}
+    if not wanted:
+        return sizes
+    try:
+        entries = list(os.scandir(os.path.join(videos_dir, NON_CHANNEL_DIRS[0])))
+    except OSError:
+        return sizes
+    for entry in entries:
+        stem, ext = os.path.splitext(entry.name)
+        if ext != ".jpg":
+            continue
+        video_id = stem
+        if video_id not in wanted:
+            # IDs can contain "_" too, so only a known ID followed by a width counts
+            video_id, _, width = stem.rpartition("_")
+            if video_id not in wanted or not width.isdigit():
+                continue
+        try:
+            sizes.setdefault(video_id, {})[entry.name] = entry.stat().st_size
+        except OSError:
+            continue
+    return sizes
+
+
+def index_channel(conn: sqlite3.Connection, videos_dir: str, channel_dir: str,
+                  signature: Optional[str] = None) -> List[str]:
+    """Reconcile the rows of one channel with what is on disk
+
+    Only files that aren't indexed yet have their meta.json read, and rows
+    whose media file disappeared are removed. Returns the meta.json paths of
+    media files whose metadata hasn't been written yet.
+    """
+    channel_path = os.path.join(videos_dir, channel_dir)
+    known = get_channel_video_ids(conn, channel_dir)
+    on_disk = set()
+    new_records = []
+    comment_sizes = {}
+    pending = []
+
+    for folder, content_type in CONTENT_FOLDERS:
+        folder_path = os.path.join(channel_path, folder)
+        try:
+            files = sorted(os.listdir(folder_path))
+        except OSError:
+            continue
+
+        for video_file in files:
+            if not video_file.endswith(VIDEO_EXTENSIONS):
+                continue
+
+            video_id = parse_video_id(video_file)
+            on_disk.add(video_id)
+            if video_id in known:
+                continue
+
+            comments_path = os.path.join(channel_path, "comments", video_id)
+            meta_file = os.path.join(comments_path, "meta.json")
+            try:
+                with open(meta_file, 'r', encoding='utf-8') as f:
+                    meta = json.load(f)
+            except FileNotFoundError:
+                pending.append(meta_file)
+                continue
+            except (OSError, ValueError):
+                continue
+
+            meta.update(_read_comment_counts(comments_path))
+            try:
+                file_size = os.path.getsize(os.path.join(folder_path, video_file))
+            except OSError:
+                file_size = None
+            # meta.json's dimensions (from yt-dlp) beat the folder, which may be the wrong one
+            if meta.get("width") and meta.get("height"):
+                record_type, type_source = ("shorts" if meta["height"] > meta["width"] else "video"), "meta"
+            else:
+                record_type, type_source = content_type, "folder"
+            new_records.append(video_record(channel_dir, record_type, video_file, meta, file_size=file_size,
+                                            type_source=type_source, folder=folder))
+            comment_sizes[video_id] = folder_file_sizes(comments_path)
+
+    removed = known - on_disk
+    thumbnail_sizes = thumbnail_file_sizes(videos_dir, [record["video_id"] for record in new_records])
+    if new_records or removed:
+        with conn:
+            seq = _next_seq(conn)
+            for record in new_records:
+                _write_video(conn, record, seq)
+                for name, size in comment_sizes.get(record["video_id"], {}).items():
+                    _track_file(conn, channel_dir, record["video_id"], "comments", name, size)
+                for name, size in thumbnail_sizes.get(record["video_id"], {}).items():
+                    _track_file(conn, channel_dir, record["video_id"], "thumbnails", name, size)
+            for video_id in removed:
+                _remove_video(conn, video_id, seq)
+
+    if signature is not None:
+        set_channel_signature(conn, channel_dir, signature)
+
+    return pending
+
+
+def remove_channel(conn: sqlite3.Connection, channel_dir: str):
+    """Drop every row of a channel whose directory is gone"""
+    video_ids = get_channel_video_ids(conn, channel_dir)
+    with conn:
+        if video_ids:
+            seq = _next_seq(conn)
+            for video_id in video_ids:
+                _remove_video(conn, video_id, seq)
+        conn.execute("DELETE FROM channels WHERE channel_dir = ?", (channel_dir,))
+
+
+def list_channel_dirs(videos_dir: str) -> List[str]:
+    try:
+        names = os.listdir(videos_dir)
+    except OSError:
+        return []
+    return sorted(n for n in names if n not in NON_CHANNEL_DIRS and os.path.isdir(os.path.join(videos_dir, n)))
+
+
+def rebuild_index(videos_dir: str = "videos"):
+    """Reconstruct the database from an existing videos/<channel>/... tree"""
+    start = time.time()
+    conn = connect(videos_dir)
+
+    # Clear in place rather than deleting the file so a running backend keeps its connection
+    with conn:
+        seq = _next_seq(conn)
+        conn.execute("INSERT OR REPLACE INTO deleted_videos (video_id, seq) SELECT video_id, ? FROM videos", (seq,))
+        conn.execute("DELETE FROM videos")
+        conn.execute("DELETE FROM channels")
+        # Indexing sizes every file again, thumbnails included
+        conn.execute("DELETE FROM video_files")
+        _recount_storage(conn)
+        if HAS_FTS5:
+            conn.execute("DELETE FROM videos_fts")
+
+    try:
+        for channel_dir in list_channel_dirs(videos_dir):
+            pending = index_channel(conn, videos_dir, channel_dir)
+            count = len(get_channel_video_ids(conn, channel_dir))
+            print(f"Indexed {channel_dir}: {count} videos" +
+                  (f" ({len(pending)} without meta.json skipped)" if pending else ""))
+        with conn:
+            conn.execute("DELETE FROM video_files WHERE video_id NOT IN (SELECT video_id FROM videos)")
+            _recount_storage(conn)
+        total = conn.execute("SELECT COUNT(*) FROM videos").fetchone()[0]
+        print(f"Rebuilt index with {total} videos in {time.time() - start:.2f}s")
+    finally:
+        conn.close()
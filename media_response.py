@@ -0,0 +1,137 @@
+import os
+import stat
+from email.utils import parsedate_to_datetime
+from typing import List, Mapping, Optional
+
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, MalformedRangeHeader, RangeNotSatisfiable, Response
+
+# Container extension -> Content-Type; browsers pick a demuxer (or decoder) from this
+MEDIA_TYPES = {
+    '.mp4': 'video/mp4',
+    '.m4v': 'video/mp4',
+    '.mkv': 'video/x-matroska',
+    '.webm': 'video/webm',
+    '.mov': 'video/quicktime',
+    '.flv': 'video/x-flv',
+    '.m4a': 'audio/mp4',
+    # Thumbnails
+    '.jpg': 'image/jpeg',
+    '.jpeg': 'image/jpeg',
+    '.webp': 'image/webp',
+}
+
+# Read size when the server can't send the file itself; fewer, larger reads
+# mean fewer thread hops per seek than Starlette's 64 KiB default
+CHUNK_SIZE = 1024 * 1024
+
+ZEROCOPY_EXTENSION = "http.response.zerocopysend"
+
+
+def media_type_for(path: str) -> str:
+    return MEDIA_TYPES.get(os.path.splitext(path)[1].lower(), 'application/octet-stream')
+
+
+def file_etag(st: os.stat_result) -> str:
+    """Strong validator for a file that is only ever replaced by rename"""
+    return f'"{st.st_ino:x}-{st.st_mtime_ns:x}-{st.st_size:x}"'
+
+
+def parse_etags(header: str) -> List[str]:
+    return [tag.strip() for tag in header.split(",") if tag.strip()]
+
+
+def _opaque(tag: str) -> str:
+    return tag[2:] if tag.startswith("W/") else tag
+
+
+def etag_matches(header: Optional[str], etag: str) -> bool:
+    """Weak comparison, as If-None-Match uses"""
+    if not header:
+        return False
+    tags = parse_etags(header)
+    return "*" in tags or _opaque(etag) in [_opaque(tag) for tag in tags]
+
+
+def not_modified(headers: Mapping[str, str], etag: str, mtime: float) -> bool:
+    """True if a GET/HEAD can be answered with 304
+
+    If-None-Match wins over If-Modified-Since when both are sent (RFC 9110 13.2.2).
+    """
+    if_none_match = headers.get("if-none-match")
+    if if_none_match:
+        return etag_matches(if_none_match, etag)
+
+    if_modified_since = headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            since = parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError, IndexError):
+            return False
+        # HTTP dates have one-second resolution
+        return int(mtime) <= since
+    return False
+
+
+class MediaFileResponse(FileResponse):
+    """FileResponse with strong ETags, 304s and a zero-copy path
+
+    Range, multi-range and If-Range come from FileResponse. When the ASGI
+    server offers the zero-copy send extension, whole files and single ranges
+    are handed to it as (fd, offset, count) so bytes go kernel-to-socket with
+    sendfile(2); full responses also use pathsend where it is offered.
+    Otherwise the file is read in CHUNK_SIZE pieces.
+    """
+
+    chunk_size = CHUNK_SIZE
+
+    def __init__(self, path: str, stat_result: Optional[os.stat_result] = None, **kwargs):
+        if stat_result is None:
+            stat_result = os.stat(path)
+        kwargs.setdefault("media_type", media_type_for(path))
+        super().__init__(path, stat_result=stat_result, **kwargs)
+
+    def set_stat_headers(self, stat_result: os.stat_result):
+        # Strong, so If-Range (which needs a strong match) works across seeks
+        self.headers.setdefault("etag", file_etag(stat_result))
+        super().set_stat_headers(stat_result)
+
+    def _validator_headers(self) -> dict:
+        return {key: self.headers[key] for key in ("etag", "last-modified", "cache-control") if key in self.headers}
+
+    async def __call__(self, scope, receive, send):
+        request_headers = Headers(scope=scope)
+        if not_modified(request_headers, self.headers["etag"], self.stat_result.st_mtime):
+            return await Response(status_code=304, headers=self._validator_headers())(scope, receive, send)
+
+        file_size = self.stat_result.st_size
+        ranges = None
+        http_range = request_headers.get("range")
+        http_if_range = request_headers.get("if-range")
+        if http_range is not None and (http_if_range is None or self._should_use_range(http_if_range)):
+            try:
+                ranges = self._parse_range_header(http_range, file_size)
+            except RangeNotSatisfiable:
+                # Starlette's own 416 leaves the unit out of Content-Range
+                response = Response(status_code=416, headers={"content-range": f"bytes */{file_size}"})
+                return await response(scope, receive, send)
+            except MalformedRangeHeader:
+                # FileResponse answers these with 400
+                return await super().__call__(scope, receive, send)
+
+        zerocopy = ZEROCOPY_EXTENSION in scope.get("extensions", {})
+        if not zerocopy or scope["method"].upper() == "HEAD" or (ranges is not None and len(ranges) != 1):
+            return await super().__call__(scope, receive, send)
+
+        start, end, status = 0, file_size, self.status_code
+        if ranges is not None:
+            (start, end), status = ranges[0], 206
+            self.headers["content-range"] = f"bytes {start}-{end - 1}/{file_size}"
+            self.headers["content-length"] = str(end - start)
+
+        with open(self.path, "rb") as f:
+            if not stat.S_ISREG(os.fstat(f.fileno()).st_mode):
+                raise RuntimeError(f"File at path {self.path} is not a file.")
+            await send({"type": "http.response.start", "status": status, "headers": self.raw_headers})
+            await send({"type": ZEROCOPY_EXTENSION, "file": f, "offset": start, "count": end - start,
+                        "more_body": False})
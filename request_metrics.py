@@ -0,0 +1,262 @@
+import os
+import sys
+import time
+import bisect
+import functools
+import threading
+import contextvars
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from run_metrics import render_prometheus
+
+# Latency histogram bounds in seconds: Prometheus' defaults plus 1ms, where cache hits land
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# What a request's time is spent on, where it isn't waiting or in the event loop:
+#   scan      - filesystem lookups: stats, existence checks, opening files and reading their indexes
+#   parse     - reading and decoding stored JSON (comments)
+#   serialize - encoding response bodies
+PHASES = ("scan", "parse", "serialize")
+
+PREFIX = "backend"
+
+# Seconds between stack samples while a request is being profiled; the GIL switch interval is the real floor
+PROFILE_INTERVAL = 0.001
+
+# Leaf frames of threads with nothing to do: executor workers waiting for a job, the event loop in select,
+# watchers sleeping on an Event; left out of profiles
+IDLE_FRAMES = {("thread.py", "_worker"), ("selectors.py", "select"), ("threading.py", "wait"), ("queue.py", "get")}
+
+# Phase seconds of the request being served, shared with the executor threads it runs work on
+_request_phases = contextvars.ContextVar("request_phases", default=None)
+
+
+@contextmanager
+def phase(name: str):
+    """Count the enclosed block's time against phase name of the request being served, if any"""
+    phases = _request_phases.get()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if phases is not None:
+            phases[name] = phases.get(name, 0.0) + time.perf_counter() - start
+
+
+def route_name(scope: Dict[str, Any]) -> str:
+    """Route template a request was served by (/api/comments/{video_id}), so IDs don't make new series"""
+    route = scope.get("route")
+    if route is not None and getattr(route, "path", None):
+        return route.path
+    # Mounts (static files) set root_path to where they are mounted
+    return scope.get("root_path") or "unmatched"
+
+
+class Histogram:
+    """Counts of observations per latency bucket, cumulative when exported"""
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def samples(self, labels: Dict[str, str]) -> Iterable[Tuple[str, Dict[str, str], float]]:
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            cumulative += count
+            yield "_bucket", dict(labels, le="+Inf" if bound == float("inf") else repr(bound)), cumulative
+        yield "_sum", labels, self.sum
+        yield "_count", labels, cumulative
+
+
+class RequestMetrics:
+    """Per-route latency histograms, bytes served and phase time, plus cache hit/miss counts"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._latency = defaultdict(Histogram)  # route -> Histogram
+        self._requests = Counter()  # (route, method, status) -> requests
+        self._bytes = Counter()  # route -> body bytes sent
+        self._phases = Counter()  # (route, phase) -> seconds
+        self._lookups = Counter()  # (cache, result) -> lookups
+        self.in_flight = 0
+
+    def observe(self, route: str, method: str, status: int, seconds: float, body_bytes: int,
+                phases: Dict[str, float]):
+        with self._lock:
+            self._latency[route].observe(seconds)
+            self._requests[(route, method, str(status))] += 1
+            self._bytes[route] += body_bytes
+            for name, phase_seconds in phases.items():
+                self._phases[(route, name)] += phase_seconds
+
+    def count(self, cache: str, result: str):
+        """A lookup in cache (e.g. "catalog") that was a hit or a miss"""
+        with self._lock:
+            self._lookups[(cache, result)] += 1
+
+    def render(self, gauges: Iterable[Tuple[str, str, float]] = ()) -> str:
+        """Everything in Prometheus text format; gauges are (name, help, value) read at scrape time"""
+        with self._lock:
+            families = [
+                (f"{PREFIX}_requests_total", "counter", "Requests served",
+                 [({"route": route, "method": method, "status": status}, count)
+                  for (route, method, status), count in sorted(self._requests.items())]),
+                (f"{PREFIX}_request_duration_seconds", "histogram", "Time from request to the last byte sent",
+                 [sample for route, histogram in sorted(self._latency.items())
+                  for sample in histogram.samples({"route": route})]),
+                (f"{PREFIX}_response_bytes_total", "counter", "Response body bytes sent",
+                 [({"route": route}, count) for route, count in sorted(self._bytes.items())]),
+                (f"{PREFIX}_phase_seconds_total", "counter",
+                 "Request time spent on filesystem scans, JSON parsing and serialization",
+                 [({"route": route, "phase": name}, seconds) for (route, name), seconds in sorted(self._phases.items())]),
+                (f"{PREFIX}_cache_lookups_total", "counter", "Catalog and response cache lookups by result",
+                 [({"cache": cache, "result": result}, count) for (cache, result), count in sorted(self._lookups.items())]),
+                (f"{PREFIX}_requests_in_flight", "gauge", "Requests being served", [({}, self.in_flight)]),
+            ]
+        families.extend((f"{PREFIX}_{name}", "gauge", help_text, [({}, value)]) for name, help_text, value in gauges)
+        return render_prometheus(families)
+
+
+class MetricsMiddleware:
+    """ASGI middleware that times every HTTP request, from the request to the last byte sent
+
+    Plain ASGI rather than BaseHTTPMiddleware, so streamed responses (videos,
+    comment JSON Lines) pass through as they are; the body is only counted.
+    """
+
+    def __init__(self, app, metrics: RequestMetrics):
+        self.app = app
+        self.metrics = metrics
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = 500
+        sent = 0
+        declared = 0
+        phases = {}
+
+        async def counting_send(message):
+            nonlocal status, sent, declared
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                for name, value in message.get("headers", []):
+                    if name.lower() == b"content-length":
+                        declared = int(value)
+            elif message["type"] == "http.response.body":
+                sent += len(message.get("body", b""))
+            elif message.get("count") is not None:
+                sent += message["count"]  # zerocopysend of a range
+            else:
+                sent += declared  # Whole file by pathsend or zerocopysend
+            await send(message)
+
+        token = _request_phases.set(phases)
+        self.metrics.in_flight += 1
+        try:
+            await self.app(scope, receive, counting_send)
+        finally:
+            self.metrics.in_flight -= 1
+            _request_phases.reset(token)
+            self.metrics.observe(route_name(scope), scope["method"], status, time.perf_counter() - start,
+                                 sent, phases)
+
+
+def folded_stack(frame, thread_name: str) -> str:
+    """A thread's stack, root first, in the folded format of flamegraph.pl and speedscope"""
+    frames = []
+    while frame is not None:
+        code = frame.f_code
+        frames.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+        frame = frame.f_back
+    frames.append(thread_name)
+    return ";".join(reversed(frames))
+
+
+class StackSampler:
+    """Samples the stack of every busy thread (but its own) until stopped
+
+    Every thread is sampled because a request's work hops from the event loop
+    to executor threads; profile on an otherwise idle server.
+    """
+
+    def __init__(self, interval: float = PROFILE_INTERVAL):
+        self.interval = interval
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self) -> Counter:
+        self._stop.set()
+        self._thread.join()
+        return self.samples
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own:
+                    continue
+                if (os.path.basename(frame.f_code.co_filename), frame.f_code.co_name) in IDLE_FRAMES:
+                    continue
+                self.samples[folded_stack(frame, names.get(thread_id, str(thread_id)))] += 1
+
+
+class RequestProfiler:
+    """Opt-in sampling profiles of single requests
+
+    With a directory set, a request to a profiled endpoint with ?profile=1
+    writes a folded stack profile there (flamegraph.pl or speedscope read
+    it) and names the file in an X-Profile header. Without one, ?profile=1
+    is ignored, so a server on the LAN can't be made to profile itself.
+    """
+
+    def __init__(self, directory: Optional[str] = None, interval: float = PROFILE_INTERVAL):
+        self.directory = directory
+        self.interval = interval
+        self._count = 0
+
+    def requested(self, request) -> bool:
+        return bool(self.directory) and request.query_params.get("profile") == "1"
+
+    def profile(self, endpoint):
+        """Decorate an endpoint taking a `request` argument so that ?profile=1 profiles it"""
+        @functools.wraps(endpoint)
+        async def wrapper(*args, **kwargs):
+            request = kwargs.get("request")
+            if request is None or not self.requested(request):
+                return await endpoint(*args, **kwargs)
+            sampler = StackSampler(self.interval)
+            sampler.start()
+            try:
+                response = await endpoint(*args, **kwargs)
+            finally:
+                samples = sampler.stop()
+            path = self.dump(endpoint.__name__, samples)
+            response.headers["X-Profile"] = os.path.basename(path)
+            return response
+        return wrapper
+
+    def dump(self, name: str, samples: Counter) -> str:
+        os.makedirs(self.directory, exist_ok=True)
+        self._count += 1
+        path = os.path.join(self.directory, f"{time.strftime('%Y%m%d-%H%M%S')}-{self._count}-{name}.folded")
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in samples.most_common():
+                f.write(f"{stack} {count}\n")
+        print(f"Profiled {name}: {sum(samples.values())} samples in {path}")
+        return path
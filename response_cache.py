@@ -0,0 +1,147 @@
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Iterable, Optional, Tuple
+
+# diskcache keeps rendered responses across restarts when it is installed;
+# otherwise only the in-memory tier is used
+try:
+    import diskcache
+except ImportError:
+    diskcache = None
+
+import library_db
+
+CACHE_DIRNAME = library_db.NON_CHANNEL_DIRS[1]
+
+MAX_MEMORY_BYTES = 64 * 1024 * 1024
+MAX_DISK_BYTES = 512 * 1024 * 1024
+
+# Disk-tier key holding the newest library generation it has seen
+GENERATION_KEY = "generation"
+
+# (body, etag)
+Entry = Tuple[bytes, str]
+
+
+def make_key(generation: int, path: str, params: Iterable[Tuple[str, str]]) -> str:
+    """Cache key for a request: library generation, endpoint and its sorted query parameters"""
+    query = "&".join(f"{name}={value}" for name, value in sorted(params))
+    return f"{generation}:{path}?{query}"
+
+
+def key_generation(key: str) -> int:
+    return int(key.split(":", 1)[0])
+
+
+def encode(payload: Any) -> Entry:
+    """Serialize a JSON payload once; the ETag is a hash of the bytes, so equal bodies share it"""
+    body = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return body, f'"{hashlib.sha1(body).hexdigest()}"'
+
+
+class ResponseCache:
+    """Rendered JSON responses keyed on generation, endpoint and parameters
+
+    Every write to library.db bumps the generation, so when the downloader
+    finishes a channel or cleanup removes videos, new requests key on the new
+    generation and never see the old bodies. Those are dropped from memory
+    when the first newer entry is stored, and age out of the disk tier by its
+    size limit. Memory is an LRU bounded by total body bytes.
+    """
+
+    def __init__(self, max_bytes: int = MAX_MEMORY_BYTES, directory: Optional[str] = None,
+                 disk_bytes: int = MAX_DISK_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._generation = 0
+        self._lock = threading.Lock()
+        self.hits = self.misses = 0
+
+        self.disk = None
+        if directory and diskcache is not None:
+            self.disk = diskcache.Cache(directory, size_limit=disk_bytes)
+
+    def open(self, generation: int):
+        """Drop disk entries from a library index newer than the one being served (it was rebuilt)"""
+        self._generation = generation
+        if self.disk is not None:
+            if self.disk.get(GENERATION_KEY, 0) > generation:
+                self.disk.clear()
+            self.disk.set(GENERATION_KEY, generation)
+
+    def close(self):
+        if self.disk is not None:
+            self.disk.close()
+
+    def get(self, key: str) -> Optional[Entry]:
+        """Memory-tier lookup; cheap enough to run on the event loop"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+        return entry
+
+    def load(self, key: str) -> Optional[Entry]:
+        """Disk-tier lookup, promoting a hit to memory; blocking"""
+        entry = self.disk.get(key) if self.disk is not None else None
+        if entry is None:
+            with self._lock:
+                self.misses += 1
+            return None
+        self._remember(key, entry)
+        with self._lock:
+            self.hits += 1
+        return entry
+
+    def put(self, key: str, entry: Entry):
+        """Keep entry in memory; store() writes it through to disk"""
+        self._remember(key, entry)
+
+    def store(self, key: str, entry: Entry):
+        """Write entry to the disk tier; blocking"""
+        if self.disk is not None:
+            self.disk.set(key, entry)
+            generation = key_generation(key)
+            if generation > self.disk.get(GENERATION_KEY, 0):
+                self.disk.set(GENERATION_KEY, generation)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+        if self.disk is not None:
+            self.disk.clear()
+
+    def _remember(self, key: str, entry: Entry):
+        size = len(entry[0])
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            generation = key_generation(key)
+            if generation > self._generation:
+                # Bodies from older generations can't be requested again
+                self._generation = generation
+                for stale in [k for k in self._entries if key_generation(k) < generation]:
+                    self._bytes -= len(self._entries.pop(stale)[0])
+            elif generation < self._generation:
+                return
+
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= len(previous[0])
+            self._entries[key] = entry
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted[0])
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def size(self) -> int:
+        return self._bytes
@@ -0,0 +1,209 @@
+import os
+import time
+import shutil
+import logging
+import threading
+from collections import namedtuple
+from typing import Dict, Iterable, List, Optional
+
+import library_db
+import thumbnails
+
+# Files yt.py can leave in a channel's videos/ or shorts/ folder as a finished download
+MEDIA_EXTENSIONS = ('.mp4', '.mkv', '.webm', '.mov', '.flv', '.m4a')
+
+# Which videos go first once a limit is exceeded:
+#   age     - oldest file first (modification time)
+#   watched - least recently played first (the backend's access log; never
+#             played counts as played when downloaded)
+#   score   - highest eviction_score first: old, big and unwatched loses
+ORDERS = ("age", "watched", "score")
+
+# eviction_score weights: per day since download, per GB, per day since last played
+SCORE_WEIGHTS = (1.0, 2.0, 3.0)
+
+DAY = 86400
+
+MediaFile = namedtuple("MediaFile", "path video_id channel_dir size mtime last_access")
+
+
+def list_media(channel_path: str, channel_dir: str, last_played: Optional[Dict[str, int]] = None) -> List[MediaFile]:
+    """Media files in a channel's videos/ and shorts/ folders"""
+    last_played = last_played or {}
+    files = []
+    for folder, _ in library_db.CONTENT_FOLDERS:
+        try:
+            entries = list(os.scandir(os.path.join(channel_path, folder)))
+        except FileNotFoundError:
+            continue
+        for entry in entries:
+            if not entry.name.lower().endswith(MEDIA_EXTENSIONS):
+                continue
+            try:
+                st = entry.stat()
+            except FileNotFoundError:
+                continue
+            video_id = library_db.parse_video_id(entry.name)
+            files.append(MediaFile(entry.path, video_id, channel_dir, st.st_size, st.st_mtime,
+                                   max(st.st_mtime, last_played.get(video_id, 0))))
+    return files
+
+
+def list_library(videos_dir: str, last_played: Optional[Dict[str, int]] = None) -> List[MediaFile]:
+    files = []
+    for channel_dir in library_db.list_channel_dirs(videos_dir):
+        files.extend(list_media(os.path.join(videos_dir, channel_dir), channel_dir, last_played))
+    return files
+
+
+def eviction_score(f: MediaFile, now: float, weights=SCORE_WEIGHTS) -> float:
+    """Higher goes first: weighted days since download, GB on disk and days since last played"""
+    age_weight, size_weight, idle_weight = weights
+    return (age_weight * (now - f.mtime) / DAY + size_weight * f.size / 1e9
+            + idle_weight * (now - f.last_access) / DAY)
+
+
+def _sort_key(order: str):
+    if order not in ORDERS:
+        raise ValueError(f"Unknown retention order {order!r}, expected one of {', '.join(ORDERS)}")
+    if order == "score":
+        now = time.time()
+        return lambda f: -eviction_score(f, now)
+    return (lambda f: f.last_access) if order == "watched" else (lambda f: f.mtime)
+
+
+def select_evictions(files: Iterable[MediaFile], max_count: Optional[int] = None, max_bytes: Optional[int] = None,
+                     order: str = "age") -> List[MediaFile]:
+    """Files to remove, first-to-go first, so that at most max_count files and max_bytes remain
+
+    One sort and one pass, whatever the number of files removed.
+    """
+    files = sorted(files, key=_sort_key(order))
+    count = len(files)
+    total = sum(f.size for f in files)
+    evict = []
+    for f in files:
+        over_count = max_count is not None and count > max_count
+        over_bytes = max_bytes is not None and total > max_bytes
+        if not (over_count or over_bytes):
+            break
+        evict.append(f)
+        count -= 1
+        total -= f.size
+    return evict
+
+
+def remove_video(videos_dir: str, media: MediaFile, conn=None):
+    """Delete a video with its comments, thumbnails and index row, all found by video ID"""
+    os.remove(media.path)
+    comments_path = os.path.join(videos_dir, media.channel_dir, "comments", media.video_id)
+    shutil.rmtree(comments_path, ignore_errors=True)
+    thumbnails.remove_thumbnail(videos_dir, media.video_id)
+    if conn is not None:
+        library_db.delete_video(conn, media.video_id)
+
+
+def remove_videos(videos_dir: str, files: Iterable[MediaFile], conn=None) -> int:
+    """remove_video for each file, logging failures; returns how many were removed"""
+    removed = 0
+    for media in files:
+        try:
+            remove_video(videos_dir, media, conn)
+            removed += 1
+            print(f"Deleted old video: {os.path.basename(media.path)} ({media.size / 1e6:.1f} MB)")
+        except Exception as e:
+            error_msg = f"Failed to delete {media.path}: {e}"
+            print(error_msg)
+            logging.error(error_msg)
+    return removed
+
+
+def remove_orphan_comments(videos_dir: str, channel_dir: str, video_ids: Iterable[str], conn=None) -> List[str]:
+    """Delete comment folders of a channel whose video is gone (e.g. left behind by older cleanups)
+
+    Returns the video IDs whose folders were removed.
+    """
+    comments_dir = os.path.join(videos_dir, channel_dir, "comments")
+    keep = set(video_ids)
+    removed = []
+    try:
+        entries = list(os.scandir(comments_dir))
+    except FileNotFoundError:
+        return removed
+    for entry in entries:
+        if entry.is_dir() and entry.name not in keep:
+            shutil.rmtree(entry.path, ignore_errors=True)
+            removed.append(entry.name)
+    if removed and conn is not None:
+        library_db.forget_files(conn, removed)
+    return removed
+
+
+def enforce_disk_budget(videos_dir: str, budget_bytes: int, order: str = "age", conn=None) -> int:
+    """Evict across all channels until the library's media fits in budget_bytes; returns videos removed"""
+    files = list_library(videos_dir, library_db.get_last_played(conn) if conn is not None else None)
+    evict = select_evictions(files, max_bytes=budget_bytes, order=order)
+    if evict:
+        total = sum(f.size for f in files)
+        print(f"Library is {total / 1e9:.2f} GB, over the {budget_bytes / 1e9:.2f} GB budget; "
+              f"removing {len(evict)} videos")
+    return remove_videos(videos_dir, evict, conn)
+
+
+class StorageManager:
+    """Keeps the whole library under a byte budget while downloads are running
+
+    Downloads reserve their expected size first; when that wouldn't fit, the
+    videos on disk are evicted in order until it does. The candidates are
+    ranked once when the manager is created, so each eviction is a pop.
+    Videos downloaded during this run are never candidates.
+    """
+
+    def __init__(self, videos_dir: str, budget_bytes: int, order: str = "score", conn=None):
+        self.videos_dir = videos_dir
+        self.budget_bytes = budget_bytes
+        files = list_library(videos_dir, library_db.get_last_played(conn) if conn is not None else None)
+        self._sizes = {f.path: f.size for f in files}  # Everything counted in used
+        self.used = sum(self._sizes.values())
+        self.reserved = 0
+        self.evicted = 0
+        # Reversed so the first to go is popped from the end
+        self._candidates = sorted(files, key=_sort_key(order), reverse=True)
+        self._lock = threading.Lock()
+
+    def average_size(self) -> int:
+        with self._lock:
+            return self.used // len(self._sizes) if self._sizes else 0
+
+    def reserve(self, size: int, conn=None) -> bool:
+        """Make room for a download of about size bytes; False if even evicting everything wouldn't"""
+        with self._lock:
+            while self.used + self.reserved + size > self.budget_bytes and self._candidates:
+                media = self._candidates.pop()
+                if media.path not in self._sizes:
+                    continue
+                # Gone already (e.g. removed by hand) needs accounting, not deleting
+                if not os.path.exists(media.path) or remove_videos(self.videos_dir, [media], conn):
+                    self.used -= self._sizes.pop(media.path)
+                    self.evicted += 1
+            if self.used + self.reserved + size > self.budget_bytes:
+                return False
+            self.reserved += size
+            return True
+
+    def release(self, size: int, downloaded_file: Optional[str] = None):
+        """Swap a reservation for the real size of what landed, if anything"""
+        with self._lock:
+            self.reserved -= size
+            if downloaded_file and downloaded_file not in self._sizes:
+                try:
+                    self._sizes[downloaded_file] = os.path.getsize(downloaded_file)
+                    self.used += self._sizes[downloaded_file]
+                except OSError:
+                    pass
+
+    def forget(self, removed: Iterable[MediaFile]):
+        """Account for videos removed outside the manager (per-channel cleanup)"""
+        with self._lock:
+            for media in removed:
+                self.used -= self._sizes.pop(media.path, 0)
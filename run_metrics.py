@@ -0,0 +1,192 @@
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+# Stages a yt.py run spends its time in:
+#   feed      - reading a channel's uploads feed
+#   listing   - walking a channel's videos and shorts tabs
+#   media     - downloading a video (yt-dlp extracts its info in the same call)
+#   classify  - telling a short from a video after the download (ffprobe)
+#   thumbnail - storing a video's thumbnails
+#   comments  - fetching and writing a video's comments
+#   cleanup   - a channel's retention and the disk budget
+STAGES = ("feed", "listing", "media", "classify", "thumbnail", "comments", "cleanup")
+
+# Counters, each split by one label: (name, label name, help)
+COUNTERS = (
+    ("requests", "stage", "Requests made to YouTube"),
+    ("retries", "stage", "Requests tried again after a failure"),
+    ("http_403", "stage", "Requests YouTube answered with 403 Forbidden"),
+    ("bytes", "kind", "Bytes written to the library"),
+    ("downloads", "type", "Videos downloaded"),
+    ("skips", "reason", "Videos or comment fetches given up on"),
+)
+
+PREFIX = "yt"
+
+# (labels, value)
+Sample = Tuple[Dict[str, str], float]
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    value = float(value)
+    return str(int(value)) if value.is_integer() else repr(value)
+
+
+def render_prometheus(families: Iterable[Tuple[str, str, str, List[Sample]]]) -> str:
+    """Prometheus text exposition of (name, type, help, samples) metric families
+
+    A sample can also be (suffix, labels, value), for a histogram's _bucket,
+    _sum and _count series.
+    """
+    lines = []
+    for name, kind, help_text, samples in families:
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for sample in samples:
+            suffix, labels, value = sample if len(sample) == 3 else ("", *sample)
+            label_text = ",".join(f'{key}="{_escape(val)}"' for key, val in labels.items())
+            series = f"{name}{suffix}{{{label_text}}}" if label_text else f"{name}{suffix}"
+            lines.append(f"{series} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
+
+
+class RunMetrics:
+    """Time per stage and counters of one yt.py run, shared by every worker
+
+    Stage time is wall time per call summed over workers, so with several
+    workers it adds up to more than the run took. The part of it spent
+    waiting on the rate limiter (including 403 backoffs) is kept apart, so
+    the rest is what the stage itself cost.
+    """
+
+    def __init__(self, command: str = "download"):
+        self.command = command
+        self.started = time.time()
+        self.finished = None
+        self.duration = None
+        self._start = time.perf_counter()
+        self._calls = defaultdict(int)
+        self._seconds = defaultdict(float)
+        self._waited = defaultdict(float)
+        self._max = defaultdict(float)
+        self._counters = defaultdict(int)  # (name, label value) -> value
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name: str):
+        """Time the enclosed block as one call of stage name"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def observe(self, name: str, seconds: float):
+        with self._lock:
+            self._calls[name] += 1
+            self._seconds[name] += seconds
+            self._max[name] = max(self._max[name], seconds)
+
+    def waited(self, name: str, seconds: float):
+        """Time stage name spent blocked on the rate limiter or sleeping before a retry"""
+        if seconds:
+            with self._lock:
+                self._waited[name] += seconds
+
+    def count(self, name: str, label: str, value: float = 1):
+        with self._lock:
+            self._counters[(name, label)] += value
+
+    def finish(self):
+        self.finished = time.time()
+        self.duration = time.perf_counter() - self._start
+
+    def summary(self) -> Dict[str, Any]:
+        """The run as JSON: when, how long, each stage's calls and seconds, and the counters"""
+        with self._lock:
+            stages = {
+                name: {"calls": self._calls[name], "seconds": round(self._seconds[name], 3),
+                       "waited": round(self._waited[name], 3), "max": round(self._max[name], 3)}
+                for name in STAGES if self._calls[name] or self._waited[name]
+            }
+            counters = {}
+            for (name, label), value in sorted(self._counters.items()):
+                counters.setdefault(name, {})[label] = value
+        duration = self.duration if self.duration is not None else time.perf_counter() - self._start
+        return {"command": self.command, "started": int(self.started), "duration": round(duration, 3),
+                "stages": stages, "counters": counters}
+
+    def prometheus(self, summary: Optional[Dict[str, Any]] = None) -> str:
+        """The run in Prometheus text format, for node_exporter's textfile collector"""
+        summary = summary or self.summary()
+        stages = summary["stages"]
+        families = [
+            (f"{PREFIX}_run_start_timestamp_seconds", "gauge", "When the last run started",
+             [({"command": summary["command"]}, summary["started"])]),
+            (f"{PREFIX}_run_duration_seconds", "gauge", "How long the last run took",
+             [({"command": summary["command"]}, summary["duration"])]),
+            (f"{PREFIX}_stage_calls", "gauge", "Calls of each stage in the last run",
+             [({"stage": name}, stage["calls"]) for name, stage in stages.items()]),
+            (f"{PREFIX}_stage_seconds", "gauge", "Seconds spent in each stage, summed over workers",
+             [({"stage": name}, stage["seconds"]) for name, stage in stages.items()]),
+            (f"{PREFIX}_stage_wait_seconds", "gauge", "Seconds of stage time spent on rate limits and backoff",
+             [({"stage": name}, stage["waited"]) for name, stage in stages.items()]),
+            (f"{PREFIX}_stage_max_seconds", "gauge", "Longest single call of each stage",
+             [({"stage": name}, stage["max"]) for name, stage in stages.items()]),
+        ]
+        for name, label, help_text in COUNTERS:
+            values = summary["counters"].get(name, {})
+            families.append((f"{PREFIX}_{name}", "gauge", f"{help_text} in the last run",
+                             [({label: value_label}, value) for value_label, value in values.items()]))
+        return render_prometheus(families)
+
+    def write(self, prom_path: str, history_path: str) -> Optional[Dict[str, Any]]:
+        """Write the Prometheus file and append the summary to the run history; returns the previous run's summary"""
+        summary = self.summary()
+        previous = last_run(history_path, self.command)
+        tmp_path = prom_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(self.prometheus(summary))
+        os.replace(tmp_path, prom_path)
+        with open(history_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(summary, separators=(",", ":")) + "\n")
+        return previous
+
+
+def last_run(history_path: str, command: str) -> Optional[Dict[str, Any]]:
+    """Newest summary of command in the run history, if any"""
+    try:
+        with open(history_path, encoding="utf-8") as f:
+            lines = f.readlines()
+    except FileNotFoundError:
+        return None
+    for line in reversed(lines):
+        try:
+            summary = json.loads(line)
+        except ValueError:
+            continue
+        if summary.get("command") == command:
+            return summary
+    return None
+
+
+def format_summary(summary: Dict[str, Any], previous: Optional[Dict[str, Any]] = None) -> str:
+    """Per-stage table of a run, with the change in seconds since the previous one"""
+    lines = [f"{'stage':<10} {'calls':>6} {'seconds':>9} {'waited':>8} {'max':>7} {'vs last':>8}"]
+    before = (previous or {}).get("stages", {})
+    for name, stage in summary["stages"].items():
+        change = f"{stage['seconds'] - before[name]['seconds']:+.1f}" if name in before else ""
+        lines.append(f"{name:<10} {stage['calls']:>6} {stage['seconds']:>9.1f} {stage['waited']:>8.1f} "
+                     f"{stage['max']:>7.1f} {change:>8}")
+    for name, values in summary["counters"].items():
+        lines.append(f"{name}: " + ", ".join(f"{label} {value:g}" for label, value in values.items()))
+    return "\n".join(lines)
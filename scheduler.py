@@ -0,0 +1,240 @@
+import time
+import heapq
+import logging
+import itertools
+import threading
+from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor
+
+
+class TokenBucket:
+    """Token bucket shared by every worker talking to one host
+
+    rate tokens are added per second up to burst. backoff() halves the rate
+    and blocks the bucket for a cooldown, so one worker hitting a 403 slows
+    every worker down; the rate creeps back up after consecutive successes.
+    """
+
+    def __init__(self, rate: float, burst: int = 1, min_rate: float = None, recover_after: int = 5):
+        self.base_rate = rate
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.min_rate = min_rate if min_rate is not None else rate / 16
+        self.recover_after = recover_after
+
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.successes = 0
+        self.acquired = 0
+        self.waited = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        if now > self.updated:
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def acquire(self) -> float:
+        """Block until a token is available; returns the time spent waiting"""
+        start = time.monotonic()
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                if now < self.blocked_until:
+                    delay = self.blocked_until - now
+                else:
+                    self._refill(now)
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        self.acquired += 1
+                        waited = now - start
+                        self.waited += waited
+                        return waited
+                    delay = (1 - self.tokens) / self.rate
+            time.sleep(delay)
+
+    def backoff(self, cooldown: float = 0.0):
+        """Slow down after the host pushed back (403, timeouts)"""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self.rate = max(self.min_rate, self.rate / 2)
+            self.tokens = 0.0
+            self.blocked_until = max(self.blocked_until, now + cooldown)
+            self.successes = 0
+
+    def success(self):
+        """Record a request the host accepted; recovers the rate gradually"""
+        with self._lock:
+            self.successes += 1
+            if self.rate < self.base_rate and self.successes >= self.recover_after:
+                self.rate = min(self.base_rate, self.rate * 1.5)
+                self.successes = 0
+
+
+class RateLimiter:
+    """One TokenBucket per host, created on first use"""
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = burst
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def bucket(self, url: str) -> TokenBucket:
+        host = urlparse(url).netloc or url
+        with self._lock:
+            if host not in self._buckets:
+                self._buckets[host] = TokenBucket(self.rate, self.burst)
+            return self._buckets[host]
+
+    def acquire(self, url: str) -> float:
+        return self.bucket(url).acquire()
+
+    def backoff(self, url: str, cooldown: float = 0.0):
+        self.bucket(url).backoff(cooldown)
+
+    def success(self, url: str):
+        self.bucket(url).success()
+
+    def stats(self):
+        with self._lock:
+            return {
+                host: {"rate": b.rate, "acquired": b.acquired, "waited": round(b.waited, 3)}
+                for host, b in self._buckets.items()
+            }
+
+
+class JobScheduler:
+    """Bounded worker pool that tracks outstanding jobs per group
+
+    Jobs may submit follow-up jobs to the same group (a listing job queues
+    video jobs, a video job queues its comment job). When the last job of a
+    group finishes, the group's on_done callback runs.
+    """
+
+    def __init__(self, workers: int):
+        self.workers = max(1, workers)
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="yt-worker")
+        self._cond = threading.Condition()
+        self._outstanding = {}
+        self._on_done = {}
+        self._total = 0
+
+    def add_group(self, group, on_done=None):
+        with self._cond:
+            self._outstanding.setdefault(group, 0)
+            if on_done is not None:
+                self._on_done[group] = on_done
+
+    def submit(self, group, fn, *args, **kwargs):
+        with self._cond:
+            self._outstanding[group] = self._outstanding.get(group, 0) + 1
+            self._total += 1
+        self._executor.submit(self._run, group, fn, args, kwargs)
+
+    def _run(self, group, fn, args, kwargs):
+        try:
+            fn(*args, **kwargs)
+        except Exception as e:
+            logging.error(f"Job {getattr(fn, '__name__', fn)} for {group} failed: {e}")
+        finally:
+            self._finish(group)
+
+    def _finish(self, group):
+        with self._cond:
+            self._outstanding[group] -= 1
+            done = self._outstanding[group] == 0
+            on_done = self._on_done.pop(group, None) if done else None
+
+        if on_done is not None:
+            try:
+                on_done()
+            except Exception as e:
+                logging.error(f"Completion handler for {group} failed: {e}")
+
+        with self._cond:
+            self._total -= 1
+            self._cond.notify_all()
+
+    def wait(self):
+        """Block until every submitted job (and its follow-ups) has finished"""
+        with self._cond:
+            while self._total > 0:
+                self._cond.wait()
+
+    def shutdown(self):
+        self.wait()
+        self._executor.shutdown(wait=True)
+
+
+class PriorityJobQueue:
+    """Worker pool that always runs the most urgent queued job next
+
+    Lower priority values run first and ties run in submission order. Its
+    threads are separate from any JobScheduler's, so work queued here (comment
+    fetches) never takes a slot from, or waits behind, the jobs over there.
+    With paused=True nothing runs until start(), so a batch queued up front
+    is taken in priority order from its first job.
+    """
+
+    def __init__(self, workers: int, name: str = "queue", paused: bool = False):
+        self.workers = max(1, workers)
+        self._heap = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._pending = 0  # Queued or running
+        self._closed = False
+        self._threads = [threading.Thread(target=self._work, name=f"{name}-{i}", daemon=True)
+                         for i in range(self.workers)]
+        if not paused:
+            self.start()
+
+    def start(self):
+        for thread in self._threads:
+            if not thread.is_alive():
+                thread.start()
+
+    def submit(self, priority: float, fn, *args, **kwargs):
+        with self._cond:
+            heapq.heappush(self._heap, (priority, next(self._seq), fn, args, kwargs))
+            self._pending += 1
+            self._cond.notify_all()
+
+    def _work(self):
+        while True:
+            with self._cond:
+                while not self._heap and not self._closed:
+                    self._cond.wait()
+                if not self._heap:
+                    return
+                _, _, fn, args, kwargs = heapq.heappop(self._heap)
+            try:
+                fn(*args, **kwargs)
+            except Exception as e:
+                logging.error(f"Job {getattr(fn, '__name__', fn)} failed: {e}")
+            finally:
+                with self._cond:
+                    self._pending -= 1
+                    self._cond.notify_all()
+
+    def __len__(self):
+        """Jobs queued and not yet started"""
+        with self._cond:
+            return len(self._heap)
+
+    def wait(self):
+        """Block until every submitted job has finished"""
+        with self._cond:
+            while self._pending > 0:
+                self._cond.wait()
+
+    def shutdown(self):
+        self.start()
+        self.wait()
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        for thread in self._threads:
+            thread.join()
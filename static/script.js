@@ -5,10 +5,21 @@ let videosPage = 0;
 let shortsPage = 0;
 const VIDEOS_PER_PAGE = 20;
 const SHORTS_PER_PAGE = 10;
+const THUMBNAIL_WIDTH = 320;
 let isLoadingContent = false;
 let hasMoreVideos = true;
 let hasMoreShorts = true;
 
+// Per-session feed order: stable while paging and across reloads in this tab
+const FEED_SEED = (() => {
+    let seed = sessionStorage.getItem('feedSeed');
+    if (seed === null) {
+        seed = String(Math.floor(Math.random() * 2147483647));
+        sessionStorage.setItem('feedSeed', seed);
+    }
+    return seed;
+})();
+
 // Initialize
 document.addEventListener('DOMContentLoaded', () => {
     setupTabs();
@@ -55,7 +66,7 @@ async function openRandomShort() {
     if (allShortsLoaded.length === 0) {
         try {
             const response = await fetch(
-                `${API_BASE}/api/content?videos_skip=0&videos_limit=0&shorts_skip=0&shorts_limit=${SHORTS_PER_PAGE * 5}`
+                `${API_BASE}/api/content?videos_skip=0&videos_limit=0&shorts_skip=0&shorts_limit=${SHORTS_PER_PAGE * 5}&seed=${FEED_SEED}`
             );
             const data = await response.json();
             if (data.shorts && data.shorts.length > 0) {
@@ -90,7 +101,7 @@ async function loadContent() {
         const shortsSkip = shortsPage * SHORTS_PER_PAGE;
         
         const response = await fetch(
-            `${API_BASE}/api/content?videos_skip=${videosSkip}&videos_limit=${VIDEOS_PER_PAGE}&shorts_skip=${shortsSkip}&shorts_limit=${SHORTS_PER_PAGE}`
+            `${API_BASE}/api/content?videos_skip=${videosSkip}&videos_limit=${VIDEOS_PER_PAGE}&shorts_skip=${shortsSkip}&shorts_limit=${SHORTS_PER_PAGE}&seed=${FEED_SEED}`
         );
         
         if (!response.ok) {
@@ -155,7 +166,7 @@ async function loadMoreVideos() {
         console.log('Loading more videos:', { videosPage, videosSkip, VIDEOS_PER_PAGE });
         
         const response = await fetch(
-            `${API_BASE}/api/content?videos_skip=${videosSkip}&videos_limit=${VIDEOS_PER_PAGE}&shorts_skip=0&shorts_limit=0`
+            `${API_BASE}/api/content?videos_skip=${videosSkip}&videos_limit=${VIDEOS_PER_PAGE}&shorts_skip=0&shorts_limit=0&seed=${FEED_SEED}`
         );
         
         if (!response.ok) {
@@ -211,7 +222,7 @@ async function loadMoreShorts() {
         const shortsSkip = shortsPage * SHORTS_PER_PAGE;
         
         const response = await fetch(
-            `${API_BASE}/api/content?videos_skip=0&videos_limit=0&shorts_skip=${shortsSkip}&shorts_limit=${SHORTS_PER_PAGE}`
+            `${API_BASE}/api/content?videos_skip=0&videos_limit=0&shorts_skip=${shortsSkip}&shorts_limit=${SHORTS_PER_PAGE}&seed=${FEED_SEED}`
         );
         
         if (!response.ok) {
@@ -240,7 +251,7 @@ function renderVideos(videos) {
         card.className = 'video-card';
         card.innerHTML = `
             <div class="video-thumbnail">
-                <img src="${API_BASE}/api/thumbnail/${video.video_id}" alt="${escapeHtml(video.title)}" loading="lazy" />
+                <img data-thumbnail-id="${escapeHtml(video.video_id)}" alt="${escapeHtml(video.title)}" />
                 <div class="play-icon">▶</div>
                 <div class="duration">${formatDuration(video.duration)}</div>
             </div>
@@ -253,6 +264,30 @@ function renderVideos(videos) {
         card.addEventListener('click', () => openVideoModal(video));
         container.appendChild(card);
     });
+
+    loadThumbnails(videos.map(v => v.video_id), container);
+}
+
+// One request for every thumbnail of a page instead of one per card
+async function loadThumbnails(videoIds, container) {
+    if (videoIds.length === 0) return;
+
+    let thumbnails = {};
+    try {
+        const ids = videoIds.map(encodeURIComponent).join(',');
+        const response = await fetch(`${API_BASE}/api/thumbnails?ids=${ids}&width=${THUMBNAIL_WIDTH}`);
+        if (response.ok) {
+            thumbnails = (await response.json()).thumbnails;
+        }
+    } catch (error) {
+        console.error('Error loading thumbnails:', error);
+    }
+
+    container.querySelectorAll('img[data-thumbnail-id]:not([src])').forEach(img => {
+        const videoId = img.dataset.thumbnailId;
+        // Missing ones fall back to the single-thumbnail endpoint, which serves a placeholder
+        img.src = thumbnails[videoId] || `${API_BASE}/api/thumbnail/${encodeURIComponent(videoId)}`;
+    });
 }
 
 function renderShorts(shorts) {
@@ -269,11 +304,10 @@ async function openVideoModal(video) {
     document.getElementById('modal-channel').textContent = video.channel;
     document.getElementById('modal-duration').textContent = formatDuration(video.duration);
 
-    // Load comments
+    // Load the first page of comments
     try {
-        const response = await fetch(`${API_BASE}/api/comments/${video.video_id}`);
-        const data = await response.json();
-        renderComments(data.comments, false);
+        const data = await fetchComments(video.video_id);
+        renderComments(data, video.video_id, false);
     } catch (error) {
         console.error('Error loading comments:', error);
         document.getElementById('comments-list').innerHTML = '<div class="no-content">No comments available</div>';
@@ -317,12 +351,11 @@ async function openShortsModal(short, fromArray = false) {
     player.loop = true;
     player.currentTime = 0;
 
-    // Load comments
+    // Load the first page of comments
     try {
-        const response = await fetch(`${API_BASE}/api/comments/${currentShort.video_id}`);
-        const data = await response.json();
-        document.getElementById('shorts-comment-count').textContent = data.comments.length;
-        renderShortsComments(data.comments);
+        const data = await fetchComments(currentShort.video_id);
+        document.getElementById('shorts-comment-count').textContent = data.total;
+        renderShortsComments(data, currentShort.video_id);
     } catch (error) {
         console.error('Error loading comments:', error);
         document.getElementById('shorts-comments-list').innerHTML = '<div class="no-content">No comments available</div>';
@@ -459,39 +492,60 @@ function closeShortsModal() {
     switchTab('videos');
 }
 
-function renderComments(comments, isShorts = false) {
+const COMMENTS_PER_PAGE = 20;
+const REPLIES_PER_PAGE = 20;
+
+async function fetchComments(videoId, cursor = null) {
+    const params = new URLSearchParams({ limit: COMMENTS_PER_PAGE });
+    if (cursor) params.set('cursor', cursor);
+    const response = await fetch(`${API_BASE}/api/comments/${videoId}?${params}`);
+    if (!response.ok) {
+        throw new Error(`HTTP ${response.status}`);
+    }
+    return response.json();
+}
+
+async function fetchReplies(videoId, commentId, cursor = null) {
+    const params = new URLSearchParams({ limit: REPLIES_PER_PAGE });
+    if (cursor) params.set('cursor', cursor);
+    const response = await fetch(
+        `${API_BASE}/api/comments/${videoId}/${encodeURIComponent(commentId)}/replies?${params}`
+    );
+    if (!response.ok) {
+        throw new Error(`HTTP ${response.status}`);
+    }
+    return response.json();
+}
+
+// Render one page of comments; later pages are appended via the "Load more comments" button
+function renderComments(data, videoId, isShorts = false, append = false) {
     const container = isShorts ? document.getElementById('shorts-comments-list') : document.getElementById('comments-list');
+    const comments = data.comments || [];
     
-    if (!comments || comments.length === 0) {
+    if (!append && comments.length === 0) {
         container.innerHTML = '<div class="no-content">No comments available</div>';
         return;
     }
 
-    container.innerHTML = '';
+    if (!append) {
+        container.innerHTML = '';
+    }
+    const oldButton = container.querySelector('.comments-load-more');
+    if (oldButton) oldButton.remove();
 
-    comments.slice(0, 50).forEach(comment => {
+    comments.forEach(comment => {
         const commentEl = document.createElement('div');
         commentEl.className = 'comment';
         const avatar = (comment.author || 'U').charAt(0).toUpperCase();
         
         let repliesHtml = '';
-        if (comment.replies && comment.replies.length > 0) {
+        if (comment.reply_count > 0) {
             const replyId = `replies-${Math.random().toString(36).substr(2, 9)}`;
             repliesHtml = `
-                <div class="replies-toggle" onclick="toggleReplies('${replyId}')">
-                    👁️ ${comment.replies.length} replies
-                </div>
-                <div id="${replyId}" style="display: none;">
-                    ${comment.replies.slice(0, 5).map(reply => `
-                        <div class="reply">
-                            <div class="comment-author">${escapeHtml(reply.author || 'Anonymous')}</div>
-                            <div class="comment-text">${escapeHtml(reply.text || '')}</div>
-                            <div class="comment-meta">
-                                <span>${formatDate(reply.timestamp)}</span>
-                            </div>
-                        </div>
-                    `).join('')}
+                <div class="replies-toggle" data-replies="${replyId}">
+                    👁️ ${comment.reply_count} replies
                 </div>
+                <div id="${replyId}" style="display: none;"></div>
             `;
         }
 
@@ -507,18 +561,87 @@ function renderComments(comments, isShorts = false) {
                 ${repliesHtml}
             </div>
         `;
+        
+        const toggle = commentEl.querySelector('.replies-toggle');
+        if (toggle) {
+            toggle.addEventListener('click', () => toggleReplies(toggle.dataset.replies, videoId, comment.id));
+        }
         container.appendChild(commentEl);
     });
+    
+    if (data.next_cursor) {
+        const button = document.createElement('button');
+        button.className = 'load-more-btn comments-load-more';
+        button.textContent = 'Load more comments';
+        button.addEventListener('click', async () => {
+            button.disabled = true;
+            try {
+                const next = await fetchComments(videoId, data.next_cursor);
+                renderComments(next, videoId, isShorts, true);
+            } catch (error) {
+                console.error('Error loading more comments:', error);
+                button.disabled = false;
+            }
+        });
+        container.appendChild(button);
+    }
 }
 
-function renderShortsComments(comments) {
-    renderComments(comments, true);
+function renderShortsComments(data, videoId) {
+    renderComments(data, videoId, true);
 }
 
-function toggleReplies(id) {
+function renderReplies(container, replies) {
+    replies.forEach(reply => {
+        const replyEl = document.createElement('div');
+        replyEl.className = 'reply';
+        replyEl.innerHTML = `
+            <div class="comment-author">${escapeHtml(reply.author || 'Anonymous')}</div>
+            <div class="comment-text">${escapeHtml(reply.text || '')}</div>
+            <div class="comment-meta">
+                <span>${formatDate(reply.timestamp)}</span>
+            </div>
+        `;
+        container.appendChild(replyEl);
+    });
+}
+
+// Replies are only fetched the first time a thread is opened
+async function loadReplies(el, videoId, commentId, cursor = null) {
+    const oldButton = el.querySelector('.replies-load-more');
+    if (oldButton) oldButton.remove();
+    
+    const data = await fetchReplies(videoId, commentId, cursor);
+    renderReplies(el, data.replies);
+    el.dataset.loaded = 'true';
+    
+    if (data.next_cursor) {
+        const more = document.createElement('div');
+        more.className = 'replies-toggle replies-load-more';
+        more.textContent = 'Show more replies';
+        more.addEventListener('click', () => {
+            loadReplies(el, videoId, commentId, data.next_cursor)
+                .catch(error => console.error('Error loading replies:', error));
+        });
+        el.appendChild(more);
+    }
+}
+
+async function toggleReplies(id, videoId, commentId) {
     const el = document.getElementById(id);
-    if (el) {
-        el.style.display = el.style.display === 'none' ? 'block' : 'none';
+    if (!el) return;
+    
+    if (el.style.display === 'none') {
+        el.style.display = 'block';
+        if (!el.dataset.loaded) {
+            try {
+                await loadReplies(el, videoId, commentId);
+            } catch (error) {
+                console.error('Error loading replies:', error);
+            }
+        }
+    } else {
+        el.style.display = 'none';
     }
 }
 
@@ -594,7 +717,7 @@ async function loadSearchResults() {
     try {
         const skip = searchPage * SEARCH_RESULTS_PER_PAGE;
         const response = await fetch(
-            `${API_BASE}/api/videos/search?query=${encodeURIComponent(currentSearchQuery)}&skip=${skip}&limit=${SEARCH_RESULTS_PER_PAGE}`
+            `${API_BASE}/api/videos/search?query=${encodeURIComponent(currentSearchQuery)}&skip=${skip}&limit=${SEARCH_RESULTS_PER_PAGE}&seed=${FEED_SEED}`
         );
         
         if (!response.ok) {
@@ -643,7 +766,7 @@ function renderSearchResults(results) {
         card.className = 'search-result-item';
         card.innerHTML = `
             <div class="search-result-thumbnail">
-                <video muted playsinline></video>
+                <img data-thumbnail-id="${escapeHtml(item.video_id)}" alt="${escapeHtml(item.title)}" />
             </div>
             <div class="search-result-info">
                 <div class="search-result-title">${escapeHtml(item.title)}</div>
@@ -652,9 +775,6 @@ function renderSearchResults(results) {
             </div>
         `;
 
-        const videoElement = card.querySelector('video');
-        videoElement.src = `${API_BASE}/api/video/${item.video_id}`;
-
         card.addEventListener('click', () => {
             if (item.type === 'video') {
                 openVideoModal(item);
@@ -670,6 +790,8 @@ function renderSearchResults(results) {
 
         resultsContainer.appendChild(card);
     });
+
+    loadThumbnails(results.map(item => item.video_id), resultsContainer);
 }
 
 // Update switchTab to reset search when switching away
@@ -0,0 +1,205 @@
+import os
+import asyncio
+from email.utils import formatdate
+
+import pytest
+from starlette.applications import Starlette
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+from media_response import ZEROCOPY_EXTENSION, MediaFileResponse, file_etag, media_type_for
+
+CONTENT = bytes(range(256)) * 40  # 10240 bytes
+
+
+@pytest.fixture
+def video(tmp_path):
+    path = tmp_path / "clip [abc].mp4"
+    path.write_bytes(CONTENT)
+    return str(path)
+
+
+@pytest.fixture
+def client(video):
+    async def endpoint(request):
+        return MediaFileResponse(video)
+    app = Starlette(routes=[Route("/video", endpoint, methods=["GET", "HEAD"])])
+    return TestClient(app)
+
+
+def serve_zerocopy(response, method="GET", headers=()):
+    """Messages a response sends to a server offering the zero-copy send extension"""
+    scope = {"type": "http", "method": method, "path": "/video",
+             "headers": [(name.lower().encode(), value.encode()) for name, value in headers],
+             "extensions": {ZEROCOPY_EXTENSION: {}}}
+    messages = []
+
+    async def receive():
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == ZEROCOPY_EXTENSION:
+            message = dict(message, body=os.pread(message["file"].fileno(), message["count"], message["offset"]))
+        messages.append(message)
+
+    asyncio.run(response(scope, receive, send))
+    return messages
+
+
+def test_full_response(client, video):
+    response = client.get("/video")
+    assert response.status_code == 200
+    assert response.content == CONTENT
+    assert response.headers["content-type"] == "video/mp4"
+    assert response.headers["etag"] == file_etag(os.stat(video))
+    assert response.headers["accept-ranges"] == "bytes"
+
+
+def test_single_range(client):
+    response = client.get("/video", headers={"Range": "bytes=100-199"})
+    assert response.status_code == 206
+    assert response.content == CONTENT[100:200]
+    assert response.headers["content-range"] == f"bytes 100-199/{len(CONTENT)}"
+
+
+def test_suffix_range(client):
+    response = client.get("/video", headers={"Range": "bytes=-100"})
+    assert response.status_code == 206
+    assert response.content == CONTENT[-100:]
+
+
+@pytest.mark.parametrize("header", ["bytes=20000-20100", "bytes=10240-"])
+def test_unsatisfiable_range(client, header):
+    response = client.get("/video", headers={"Range": header})
+    assert response.status_code == 416
+    assert response.headers["content-range"] == f"bytes */{len(CONTENT)}"
+
+
+def test_if_range_current_etag_gives_range(client, video):
+    response = client.get("/video", headers={"Range": "bytes=0-9", "If-Range": file_etag(os.stat(video))})
+    assert response.status_code == 206
+    assert response.content == CONTENT[:10]
+
+
+def test_stale_if_range_gives_full_response(client):
+    response = client.get("/video", headers={"Range": "bytes=0-9", "If-Range": '"stale"'})
+    assert response.status_code == 200
+    assert response.content == CONTENT
+
+
+@pytest.mark.parametrize("header", ["{etag}", "W/{etag}", '"other", {etag}', '"other",W/{etag}', "*"])
+def test_if_none_match(client, video, header):
+    etag = file_etag(os.stat(video))
+    response = client.get("/video", headers={"If-None-Match": header.format(etag=etag)})
+    assert response.status_code == 304
+    assert response.content == b""
+    assert response.headers["etag"] == etag
+
+
+def test_if_none_match_other_etag(client):
+    response = client.get("/video", headers={"If-None-Match": '"other", W/"another"'})
+    assert response.status_code == 200
+    assert response.content == CONTENT
+
+
+def test_if_modified_since(client, video):
+    mtime = os.stat(video).st_mtime
+    response = client.get("/video", headers={"If-Modified-Since": formatdate(mtime + 1, usegmt=True)})
+    assert response.status_code == 304
+    response = client.get("/video", headers={"If-Modified-Since": formatdate(mtime - 3600, usegmt=True)})
+    assert response.status_code == 200
+
+
+def test_if_none_match_wins_over_if_modified_since(client, video):
+    mtime = os.stat(video).st_mtime
+    response = client.get("/video", headers={"If-None-Match": '"other"',
+                                             "If-Modified-Since": formatdate(mtime + 1, usegmt=True)})
+    assert response.status_code == 200
+
+
+def test_head(client):
+    response = client.head("/video")
+    assert response.status_code == 200
+    assert response.content == b""
+    assert response.headers["content-length"] == str(len(CONTENT))
+    assert response.headers["content-type"] == "video/mp4"
+
+
+def test_head_range(client):
+    response = client.head("/video", headers={"Range": "bytes=0-9"})
+    assert response.status_code == 206
+    assert response.content == b""
+    assert response.headers["content-length"] == "10"
+
+
+@pytest.mark.parametrize("name, media_type", [
+    ("a.mp4", "video/mp4"),
+    ("a.webm", "video/webm"),
+    ("a.WEBM", "video/webm"),
+    ("a.mkv", "video/x-matroska"),
+    ("a.jpg", "image/jpeg"),
+    ("a.unknown", "application/octet-stream"),
+])
+def test_media_type_for(name, media_type):
+    assert media_type_for(name) == media_type
+
+
+@pytest.mark.parametrize("name, media_type", [("a.webm", "video/webm"), ("a.jpg", "image/jpeg")])
+def test_content_type_header(tmp_path, name, media_type):
+    path = tmp_path / name
+    path.write_bytes(b"x")
+    messages = serve_zerocopy(MediaFileResponse(str(path)), method="HEAD")
+    assert dict(messages[0]["headers"])[b"content-type"].decode().startswith(media_type)
+
+
+@pytest.mark.parametrize("range_header, offset, count", [
+    (None, 0, len(CONTENT)),
+    ("bytes=100-199", 100, 100),
+    ("bytes=10000-", 10000, 240),
+    ("bytes=-100", len(CONTENT) - 100, 100),
+])
+def test_zerocopy(video, range_header, offset, count):
+    headers = [("Range", range_header)] if range_header else []
+    start, body = serve_zerocopy(MediaFileResponse(video), headers=headers)
+    assert start["status"] == (206 if range_header else 200)
+    assert body["type"] == ZEROCOPY_EXTENSION
+    assert (body["offset"], body["count"]) == (offset, count)
+    assert body["body"] == CONTENT[offset:offset + count]
+    assert dict(start["headers"])[b"content-length"] == str(count).encode()
+    if range_header:
+        assert dict(start["headers"])[b"content-range"] == f"bytes {offset}-{offset + count - 1}/{len(CONTENT)}".encode()
+
+
+def test_zerocopy_stale_if_range_sends_whole_file(video):
+    start, body = serve_zerocopy(MediaFileResponse(video), headers=[("Range", "bytes=0-9"), ("If-Range", '"stale"')])
+    assert start["status"] == 200
+    assert (body["offset"], body["count"]) == (0, len(CONTENT))
+
+
+def test_zerocopy_unsatisfiable_range(video):
+    messages = serve_zerocopy(MediaFileResponse(video), headers=[("Range", "bytes=20000-")])
+    assert messages[0]["status"] == 416
+    assert all(message["type"] != ZEROCOPY_EXTENSION for message in messages)
+
+
+def test_zerocopy_not_modified(video):
+    messages = serve_zerocopy(MediaFileResponse(video), headers=[("If-None-Match", file_etag(os.stat(video)))])
+    assert messages[0]["status"] == 304
+    assert all(message["type"] != ZEROCOPY_EXTENSION for message in messages)
+
+
+def test_zerocopy_head_sends_no_file(video):
+    messages = serve_zerocopy(MediaFileResponse(video), method="HEAD")
+    assert messages[0]["status"] == 200
+    assert all(message["type"] != ZEROCOPY_EXTENSION for message in messages)
+
+
+def test_zerocopy_multi_range_falls_back(video):
+    messages = serve_zerocopy(MediaFileResponse(video), headers=[("Range", "bytes=0-9,100-109")])
+    assert messages[0]["status"] == 206
+    assert all(message["type"] != ZEROCOPY_EXTENSION for message in messages)
+
+
+def test_malformed_range(client):
+    response = client.get("/video", headers={"Range": "bytes=abc"})
+    assert response.status_code == 400
@@ -0,0 +1,204 @@
+import os
+import time
+import asyncio
+import subprocess
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, List, Optional, Tuple
+
+import library_db
+
+# Thumbnails live next to the channel directories: videos/thumbnails/<video_id>.jpg
+THUMBNAILS_DIR = library_db.NON_CHANNEL_DIRS[0]
+THUMBNAIL_WIDTHS = (160, 320, 640)  # Every thumbnail is stored at each of these widths
+THUMBNAIL_WIDTH = 320  # Served when no width is asked for; stored as <video_id>.jpg
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp')
+THUMBNAIL_SEEK = 1  # Seconds into the video to grab the frame from
+FFMPEG = os.environ.get("FFMPEG", "ffmpeg")  # Point at a stub binary to run without ffmpeg
+FFMPEG_TIMEOUT = 30
+WORKERS = os.cpu_count() or 2
+
+
+def thumbnails_dir(videos_dir: str) -> str:
+    return os.path.join(videos_dir, THUMBNAILS_DIR)
+
+
+def thumbnail_path(videos_dir: str, video_id: str, width: int = THUMBNAIL_WIDTH) -> str:
+    name = f"{video_id}.jpg" if width == THUMBNAIL_WIDTH else f"{video_id}_{width}.jpg"
+    return os.path.join(thumbnails_dir(videos_dir), name)
+
+
+def closest_width(width: int) -> int:
+    """Smallest stored width that is at least width, or the largest one"""
+    for stored in sorted(THUMBNAIL_WIDTHS):
+        if stored >= width:
+            return stored
+    return max(THUMBNAIL_WIDTHS)
+
+
+def find_thumbnail(videos_dir: str, video_id: str, width: int = THUMBNAIL_WIDTH) -> Optional[str]:
+    """Path of the stored thumbnail closest to width, falling back to the default width"""
+    for candidate in (closest_width(width), THUMBNAIL_WIDTH):
+        path = thumbnail_path(videos_dir, video_id, candidate)
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def is_up_to_date(videos_dir: str, video_id: str, video_file: str) -> bool:
+    """True if every width exists and is newer than the media file"""
+    try:
+        video_mtime = os.path.getmtime(video_file)
+        return all(os.path.getmtime(thumbnail_path(videos_dir, video_id, w)) >= video_mtime
+                   for w in THUMBNAIL_WIDTHS)
+    except OSError:
+        return False
+
+
+def _render_plan(input_args: List[str], videos_dir: str, video_id: str, ffmpeg: Optional[str]):
+    """ffmpeg command writing every width to temp files, and the (temp, final) path pairs"""
+    os.makedirs(thumbnails_dir(videos_dir), exist_ok=True)
+    command = [ffmpeg or FFMPEG] + input_args
+    renames = []
+    for width in THUMBNAIL_WIDTHS:
+        path = thumbnail_path(videos_dir, video_id, width)
+        tmp_path = path[:-len(".jpg")] + ".tmp.jpg"
+        command += ['-vframes', '1', '-vf', f'scale={width}:-1', '-y', tmp_path]
+        renames.append((tmp_path, path))
+    return command, renames
+
+
+def _finish_render(renames, succeeded: bool) -> bool:
+    """Move the outputs into place only if all of them were written"""
+    try:
+        if succeeded and all(os.path.exists(tmp) and os.path.getsize(tmp) > 0 for tmp, _ in renames):
+            for tmp_path, path in renames:
+                os.replace(tmp_path, path)
+            return True
+        return False
+    finally:
+        for tmp_path, _ in renames:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+
+def _render(input_args: List[str], videos_dir: str, video_id: str, ffmpeg: Optional[str],
+            timeout: float) -> bool:
+    """Write every width in one ffmpeg run; files only appear once they are all complete"""
+    command, renames = _render_plan(input_args, videos_dir, video_id, ffmpeg)
+    try:
+        subprocess.run(command, check=True, capture_output=True, timeout=timeout)
+        succeeded = True
+    except (subprocess.CalledProcessError, subprocess.TimeoutExpired, OSError):
+        succeeded = False
+    return _finish_render(renames, succeeded)
+
+
+def generate_thumbnail(videos_dir: str, video_id: str, video_file: str, ffmpeg: Optional[str] = None,
+                       timeout: float = FFMPEG_TIMEOUT) -> bool:
+    """Grab one frame of the video with ffmpeg, for videos without a source thumbnail"""
+    return _render(['-ss', str(THUMBNAIL_SEEK), '-i', video_file], videos_dir, video_id, ffmpeg, timeout)
+
+
+async def generate_thumbnail_async(videos_dir: str, video_id: str, video_file: str, ffmpeg: Optional[str] = None,
+                                   timeout: float = FFMPEG_TIMEOUT) -> bool:
+    """generate_thumbnail for an event loop: ffmpeg runs without holding a thread"""
+    command, renames = _render_plan(['-ss', str(THUMBNAIL_SEEK), '-i', video_file], videos_dir, video_id, ffmpeg)
+    succeeded = False
+    try:
+        process = await asyncio.create_subprocess_exec(
+            *command, stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.DEVNULL)
+        try:
+            succeeded = await asyncio.wait_for(process.wait(), timeout) == 0
+        except asyncio.TimeoutError:
+            process.kill()
+            await process.wait()
+    except OSError:
+        pass
+    return _finish_render(renames, succeeded)
+
+
+def resize_source_thumbnail(videos_dir: str, video_id: str, source_file: str, ffmpeg: Optional[str] = None,
+                            timeout: float = FFMPEG_TIMEOUT) -> bool:
+    """Scale the thumbnail yt-dlp downloaded (webp/jpg) to every stored width; no video decode"""
+    return _render(['-i', source_file], videos_dir, video_id, ffmpeg, timeout)
+
+
+def remove_thumbnail(videos_dir: str, video_id: str):
+    for width in THUMBNAIL_WIDTHS:
+        try:
+            os.remove(thumbnail_path(videos_dir, video_id, width))
+        except FileNotFoundError:
+            pass
+
+
+def thumbnail_sizes(videos_dir: str, video_id: str) -> Dict[str, Optional[int]]:
+    """{file name: bytes} of a video's stored thumbnails, None for widths that are missing"""
+    sizes = {}
+    for width in THUMBNAIL_WIDTHS:
+        path = thumbnail_path(videos_dir, video_id, width)
+        try:
+            sizes[os.path.basename(path)] = os.path.getsize(path)
+        except OSError:
+            sizes[os.path.basename(path)] = None
+    return sizes
+
+
+def stale_thumbnails(videos_dir: str, force: bool = False) -> List[Tuple[str, str]]:
+    """(video_id, media file) for every indexed video missing up-to-date thumbnails"""
+    conn = library_db.connect(videos_dir)
+    try:
+        rows = conn.execute("SELECT video_id, file_path FROM videos ORDER BY downloaded_at DESC").fetchall()
+    finally:
+        conn.close()
+
+    jobs = []
+    for video_id, file_path in rows:
+        video_file = os.path.join(videos_dir, file_path)
+        if not os.path.exists(video_file):
+            continue
+        if force or not is_up_to_date(videos_dir, video_id, video_file):
+            jobs.append((video_id, video_file))
+    return jobs
+
+
+def generate_thumbnails(videos_dir: str = "videos", workers: Optional[int] = None, force: bool = False):
+    """Generate missing or outdated thumbnails for the whole library on a bounded process pool"""
+    start = time.time()
+    jobs = stale_thumbnails(videos_dir, force)
+    if not jobs:
+        print("All thumbnails are up to date")
+        return
+
+    workers = workers or WORKERS
+    print(f"Generating {len(jobs)} thumbnails with {workers} workers")
+    generated = failed = 0
+    done = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(generate_thumbnail, videos_dir, video_id, video_file): video_id
+            for video_id, video_file in jobs
+        }
+        for future in as_completed(futures):
+            if future.result():
+                generated += 1
+                done.append(futures[future])
+            else:
+                failed += 1
+                print(f"Could not generate thumbnail for {futures[future]}")
+    track_thumbnails(videos_dir, done)
+    print(f"Generated {generated} thumbnails ({failed} failed) in {time.time() - start:.2f}s")
+
+
+def track_thumbnails(videos_dir: str, video_ids: List[str]):
+    """Record the sizes of freshly generated thumbnails in the library's disk usage"""
+    if not video_ids:
+        return
+    conn = library_db.connect(videos_dir)
+    try:
+        channels = dict(conn.execute("SELECT video_id, channel_dir FROM videos").fetchall())
+        for video_id in video_ids:
+            if video_id in channels:
+                library_db.track_files(conn, channels[video_id], video_id, "thumbnails",
+                                       thumbnail_sizes(videos_dir, video_id))
+    finally:
+        conn.close()
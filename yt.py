@@ -2,14 +2,27 @@ from yt_dlp import YoutubeDL
 from yt_dlp.utils import DownloadError, ExtractorError
 import json
 import os
+import re
 import glob
+import hashlib
 import time
-import shutil
 import socket
-import random
 import logging
+import argparse
+import itertools
+import threading
+import urllib.request
 from datetime import datetime
 
+import library_db
+import classify
+import comment_store
+import thumbnails
+import retention
+import run_metrics
+from scheduler import JobScheduler, PriorityJobQueue, RateLimiter
+from ydl_pool import YoutubeDLPool
+
 # Set socket timeout to handle network timeouts better
 socket.setdefaulttimeout(30)
 
@@ -28,82 +41,185 @@ DOWNLOAD_COMMENTS = True
 MAX_COMMENTS = 50
 MAX_REPLIES = 120
 QUALITY = "720"  # Options: "720", "480", "360"
+VIDEOS_DIR = "videos"
+WORKERS = 4  # Concurrent jobs (listing, media, comments) across all channels
+REQUESTS_PER_SECOND = 0.5  # Shared request budget per host, backs off on 403s/timeouts
+RATE_BURST = 3
+COMMENT_WORKERS = 2  # Comment fetches run on their own workers, never in a download slot
+COMMENT_REQUESTS_PER_SECOND = 0.25  # Comment budget, separate from (and on top of) REQUESTS_PER_SECOND
+COMMENT_RATE_BURST = 2
+COMMENTS_MAX_AGE = 7 * 86400  # Stored comments older than this are fetched again
+RETENTION_ORDER = "age"  # Which videos a channel's cleanup removes first: "age", "watched" or "score"
+DISK_BUDGET_GB = None  # Cap on all channels' media together, kept during each sync (or --disk-budget)
+DISK_BUDGET_ORDER = "score"  # Weighs age, size and last play (see retention.SCORE_WEIGHTS)
+ESTIMATED_BYTES_PER_SECOND = 250_000  # ~2 Mbit/s, for sizing a download whose filesize isn't known
+METRICS_FILE = "yt.prom"  # Stage times and counters of the last run, for Prometheus' textfile collector
+RUN_HISTORY_FILE = "yt_runs.jsonl"  # One JSON summary per run, to compare runs
+
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
+
+# A channel's uploads feed lists its latest uploads; when its video IDs are the
+# same as at the last settled sync, the playlist isn't walked at all
+FEED_URL = "https://www.youtube.com/feeds/videos.xml?channel_id={channel_id}"
+FEED_VIDEO_ID = re.compile(r"<yt:videoId>([^<]+)</yt:videoId>")
+# Playlist entries walked per wanted video before giving up, to get past skipped/failed ones
+LISTING_FACTOR = 10
+
+# yt-dlp option profiles; each worker thread keeps one reusable YoutubeDL per profile
+YDL_PROFILES = {
+    # Extract playlist info first (without downloading)
+    "listing": {
+        "quiet": True,  # Suppress debug output during extraction
+        "no_warnings": True,
+        "extract_flat": "in_playlist",  # Extract playlist without fetching each video info
+        "skip_unavailable_videos": True,  # Try to skip unavailable videos
+        "ignoreerrors": True,  # Ignore individual video errors and continue
+        "http_headers": {
+            "User-Agent": USER_AGENT
+        },
+        "extractor_args": {
+            "youtube": {
+                "player_client": ["android", "web"],
+            }
+        },
+    },
+    # Media download; the output directory is passed per call as paths={"home": ...}
+    "download": {
+        "format": f"best[height<={QUALITY}]",  # Fallback to best available format
+        "outtmpl": "%(title)s [%(id)s].%(ext)s",
+        "continuedl": True,  # A killed run's .part file (and .ytdl fragment state) is picked up, not restarted
+        "writethumbnail": True,  # Source thumbnail, resized into videos/thumbnails/ after the download
+        "socket_timeout": 30,
+        "fragment_retries": 10,
+        "skip_unavailable_fragments": True,
+        "http_headers": {
+            "User-Agent": USER_AGENT
+        },
+        "quiet": False,  # Show output for debugging
+        "no_warnings": False,
+        "retries": 10,  # Retry failed requests
+        "extractor_args": {
+            "youtube": {
+                "player_client": ["android", "web"],
+            }
+        },
+    },
+    # Get comments using yt-dlp's YouTube extractor
+    # Note: Use max-comments (with hyphen) to fetch all reply pages
+    # Format: max-comments,max-parents,max-replies,max-replies-per-thread
+    # Comments have 'parent' field that indicates if they're replies (parent != 'root')
+    # Use comment_sort: top to fetch most liked comments (not newest)
+    # In Python dict API, use underscores not hyphens for parameter names
+    "comments": {
+        "skip_download": True,
+        "quiet": True,
+        "no_warnings": True,
+        "getcomments": True,
+        "extractor_args": {
+            "youtube": {
+                "max-comments": f"{MAX_COMMENTS},all,{MAX_REPLIES},10",
+                "comment-sort": "top"  # Use hyphen in extractor args key
+            }
+        }
+    },
+}
+
+# Flat entry fields kept in the compact records the listing hands to downloads (and the journal keeps):
+# enough to classify, size and download a video without asking YouTube about it first
+RECORD_FIELDS = ("id", "url", "title", "duration", "width", "height", "live_status", "is_live", "tab")
+
+# Channel URL forms, newer @ form first; the one that lists a channel is remembered in library_db
+CHANNEL_URL_FORMS = ("https://www.youtube.com/@{channel}", "https://www.youtube.com/c/{channel}")
+# Channel tabs listed on each sync, with the channel_sync column holding each one's cursor
+CHANNEL_TABS = (("videos", "newest_video_id"), ("shorts", "newest_short_id"))
+
+# Looked up at call time so the YoutubeDL class can be swapped for a stub
+ydl_pool = YoutubeDLPool(YDL_PROFILES, lambda opts: YoutubeDL(opts))
+
+# Replaced at the start of each download or comments run
+metrics = run_metrics.RunMetrics()
 
 def get_downloaded_videos(videos_dir, shorts_dir):
     """Get list of already downloaded video files with timestamps"""
     downloaded = {}
     for pattern in [f"{videos_dir}/*", f"{shorts_dir}/*"]:
         for file in glob.glob(pattern):
-            if os.path.isfile(file):
+            # .part files are unfinished downloads, not videos we have
+            if os.path.isfile(file) and file.lower().endswith(retention.MEDIA_EXTENSIONS):
                 # Store filename without extension and its modification time
                 filename = os.path.splitext(os.path.basename(file))[0]
                 mtime = os.path.getmtime(file)
                 downloaded[filename] = (mtime, file)
     return downloaded
 
-def cleanup_old_videos(videos_dir, shorts_dir, video_count, comments_dir):
-    """Remove oldest videos if count exceeds video_count"""
-    # Get all files with their modification times
-    all_files = []
-    for pattern in [f"{videos_dir}/*", f"{shorts_dir}/*"]:
-        for file in glob.glob(pattern):
-            if os.path.isfile(file):
-                mtime = os.path.getmtime(file)
-                all_files.append((mtime, file))
-    
-    # Sort by modification time (oldest first)
-    all_files.sort()
+def get_known_video_ids(downloaded):
+    """IDs we already own, parsed from the "Title [id]" filenames on disk
     
-    # Remove oldest files if we exceed video_count
-    total_files = len(all_files)
-    print(f"Total files in videos/shorts: {total_files}, video_count: {video_count}")
+    Files are the source of truth here: a video deleted by hand should be
+    fetched again even if the library index still lists it.
+    """
+    return {library_db.parse_video_id(filename) for filename in downloaded}
+
+def compact_entry(entry, tab=None):
+    """Compact record of a flat playlist entry: ID, duration, dimensions, live status and the tab it's on"""
+    if not isinstance(entry, dict):
+        return {"id": str(entry)}
+    record = {key: entry[key] for key in RECORD_FIELDS if entry.get(key) is not None}
+    if "id" not in record and entry_video_id(entry):
+        record["id"] = entry_video_id(entry)
+    if tab:
+        record["tab"] = tab
+    return record
+
+def entry_video_id(entry):
+    """Video ID of a flat or full playlist entry"""
+    if isinstance(entry, dict) and entry.get("id"):
+        return entry["id"]
+    if isinstance(entry, dict) and "webpage_url" in entry:
+        return entry["webpage_url"].split("v=")[-1]
+    # If it's a string (just video ID)
+    return str(entry) if entry else None
+
+def cleanup_old_videos(channel_name, video_count, conn=None, max_bytes=None, order=RETENTION_ORDER):
+    """Remove a channel's first-to-go videos beyond video_count (and max_bytes) with their comments and thumbnails"""
+    # "watched" and "score" rank by the backend's play log
+    last_played = library_db.get_last_played(conn) if conn is not None else None
+    files = retention.list_media(os.path.join(VIDEOS_DIR, channel_name), channel_name, last_played)
+    total_size = sum(f.size for f in files)
+    print(f"Total files in videos/shorts: {len(files)} ({total_size / 1e9:.2f} GB), video_count: {video_count}")
     
-    if total_files > video_count:
-        files_to_remove = total_files - video_count
-        print(f"Removing {files_to_remove} old videos")
-        
-        # Load all comment folders with their metadata to track which video they belong to
-        video_id_to_meta = {}
-        for video_id_folder in glob.glob(f"{comments_dir}/*"):
-            if os.path.isdir(video_id_folder):
-                meta_file = os.path.join(video_id_folder, "meta.json")
-                if os.path.exists(meta_file):
-                    try:
-                        with open(meta_file, 'r', encoding='utf-8') as f:
-                            meta = json.load(f)
-                            video_id_to_meta[meta.get('video_id')] = video_id_folder
-                    except:
-                        pass
-        
-        for i in range(files_to_remove):
-            try:
-                video_file = all_files[i][1]
-                filename = os.path.splitext(os.path.basename(video_file))[0]
-                
-                # Try to find corresponding comment folder and delete it
-                for video_id, comment_folder in video_id_to_meta.items():
-                    meta_file = os.path.join(comment_folder, "meta.json")
-                    if os.path.exists(meta_file):
-                        try:
-                            with open(meta_file, 'r', encoding='utf-8') as f:
-                                meta = json.load(f)
-                                # If the title matches, this is the right comment folder
-                                if meta.get('title') == filename:
-                                    shutil.rmtree(comment_folder)
-                                    print(f"Deleted comments for: {filename}")
-                                    break
-                        except:
-                            pass
-                
-                os.remove(video_file)
-                print(f"Deleted old video: {os.path.basename(video_file)}")
-                
-            except Exception as e:
-                error_msg = f"Failed to delete {all_files[i][1]}: {e}"
-                print(error_msg)
-                logging.error(error_msg)
+    evict = retention.select_evictions(files, video_count, max_bytes, order)
+    if evict:
+        print(f"Removing {len(evict)} old videos")
+        retention.remove_videos(VIDEOS_DIR, evict, conn)
     else:
         print(f"No cleanup needed")
+    
+    # Comment folders are named by video ID, so ones without a video are leftovers
+    kept = {f.video_id for f in files} - {f.video_id for f in evict}
+    orphans = retention.remove_orphan_comments(VIDEOS_DIR, channel_name, kept, conn)
+    if orphans:
+        print(f"Deleted {len(orphans)} comment folders without a video")
+    return evict
+
+def write_json_atomic(path, data):
+    """Write JSON to a temp file and rename it over path, so a crash never leaves a partial file; returns its size"""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2, ensure_ascii=False)
+        size = f.tell()
+    os.replace(tmp_path, path)
+    return size
+
+def track_comment_files(comments_dir, sizes):
+    """Record the sizes of files just written ({name: bytes}) or deleted ({name: None}) in a video's comments folder
+    
+    The folder is videos/<channel>/comments/<id>.
+    """
+    video_id = os.path.basename(comments_dir)
+    channel_name = os.path.basename(os.path.dirname(os.path.dirname(comments_dir)))
+    library_db.track_files(get_conn(), channel_name, video_id, "comments", sizes)
+    metrics.count("bytes", "comments", sum(size for size in sizes.values() if size))
 
 def save_meta_json(comments_dir, video_info):
     """Save meta.json with basic video information"""
@@ -113,15 +229,34 @@ def save_meta_json(comments_dir, video_info):
         "channel": video_info.get('channel'),
         "upload_date": video_info.get('upload_date'),
         "duration": video_info.get('duration'),
+        "width": video_info.get('width'),
+        "height": video_info.get('height'),
         "comment_count_estimated": video_info.get('comments'),
         "downloaded_at": int(time.time())
     }
     
-    meta_path = os.path.join(comments_dir, "meta.json")
-    with open(meta_path, 'w', encoding='utf-8') as f:
-        json.dump(meta, f, indent=2, ensure_ascii=False)
+    size = write_json_atomic(os.path.join(comments_dir, "meta.json"), meta)
+    track_comment_files(comments_dir, {"meta.json": size})
     print(f"Saved meta.json for video {video_info.get('id')}")
 
+def load_meta_info(comments_dir):
+    """Minimal video_info rebuilt from a saved meta.json, or None"""
+    meta_file = os.path.join(comments_dir, "meta.json")
+    if not os.path.exists(meta_file):
+        return None
+    with open(meta_file, 'r', encoding='utf-8') as f:
+        meta = json.load(f)
+    return {
+        'id': meta.get('video_id'),
+        'title': meta.get('title'),
+        'channel': meta.get('channel'),
+        'upload_date': meta.get('upload_date'),
+        'duration': meta.get('duration'),
+        'width': meta.get('width'),
+        'height': meta.get('height'),
+        'comments': meta.get('comment_count_estimated')
+    }
+
 def load_index_json(comments_dir):
     """Load existing index.json if it exists"""
     index_path = os.path.join(comments_dir, "index.json")
@@ -148,77 +283,118 @@ def save_index_json(comments_dir, index_data):
     """Save index.json with download progress"""
     index_path = os.path.join(comments_dir, "index.json")
     
-    # Calculate folder size
-    total_size = 0
-    for dirpath, dirnames, filenames in os.walk(comments_dir):
-        for filename in filenames:
-            filepath = os.path.join(dirpath, filename)
-            if os.path.exists(filepath):
-                total_size += os.path.getsize(filepath)
-    
-    index_data["size_bytes"] = total_size
+    # Folder size as tracked while its files were written (including the previous index.json)
+    video_id = os.path.basename(comments_dir)
+    index_data["size_bytes"] = library_db.get_video_storage(get_conn(), video_id).get("comments", 0)
     index_data["last_updated"] = int(time.time())
-    
-    with open(index_path, 'w', encoding='utf-8') as f:
-        json.dump(index_data, f, indent=2, ensure_ascii=False)
+    size = write_json_atomic(index_path, index_data)
+    track_comment_files(comments_dir, {"index.json": size})
 
-def create_comment_structure(comments_dir):
-    """Create directory structure for comments"""
-    os.makedirs(os.path.join(comments_dir, "top"), exist_ok=True)
-    os.makedirs(os.path.join(comments_dir, "replies"), exist_ok=True)
+def save_comments(comments_dir, threads):
+    """Save every (comment, replies) thread of a video to its packed comments file"""
+    size = comment_store.write_comments(comments_dir, threads)
+    # A refresh of comments kept in the legacy per-comment layout replaces them
+    sizes = dict.fromkeys(comment_store.remove_legacy_dirs(comments_dir))
+    sizes[comment_store.COMMENTS_FILE] = size
+    track_comment_files(comments_dir, sizes)
+    print(f"Saved {len(threads)} comment threads ({size} bytes) to {comment_store.COMMENTS_FILE}")
+    return size
 
-def save_comment(comments_dir, comment_index, comment_data):
-    """Save a top-level comment"""
-    top_dir = os.path.join(comments_dir, "top")
-    comment_file = os.path.join(top_dir, f"c_{comment_index:05d}.json")
-    
-    with open(comment_file, 'w', encoding='utf-8') as f:
-        json.dump(comment_data, f, indent=2, ensure_ascii=False)
+def find_source_thumbnail(video_info, output_dir, video_id):
+    """Path of the thumbnail yt-dlp wrote next to the media file, if any"""
+    for thumb in video_info.get('thumbnails') or []:
+        if thumb.get('filepath') and os.path.exists(thumb['filepath']):
+            return thumb['filepath']
+    for file in os.listdir(output_dir):
+        if video_id in file and file.lower().endswith(thumbnails.IMAGE_EXTENSIONS):
+            return os.path.join(output_dir, file)
+    return None
 
-def save_reply(comments_dir, comment_index, reply_index, reply_data):
-    """Save a reply to a comment"""
-    replies_dir = os.path.join(comments_dir, "replies", f"c_{comment_index:05d}")
-    os.makedirs(replies_dir, exist_ok=True)
-    
-    reply_file = os.path.join(replies_dir, f"r_{reply_index:05d}.json")
-    
-    with open(reply_file, 'w', encoding='utf-8') as f:
-        json.dump(reply_data, f, indent=2, ensure_ascii=False)
+def save_thumbnails(video_info, output_dir, video_id, downloaded_file):
+    """Store the source thumbnail at every width, grabbing a frame only if there is none"""
+    source = find_source_thumbnail(video_info, output_dir, video_id)
+    if source:
+        resized = thumbnails.resize_source_thumbnail(VIDEOS_DIR, video_id, source)
+        # The videos/shorts folders should only hold media files
+        os.remove(source)
+        if resized:
+            return True
+    return thumbnails.generate_thumbnail(VIDEOS_DIR, video_id, downloaded_file)
 
-def download_comments(video_url, video_info, comments_dir, channel_name):
-    """Download comments for a video using yt-dlp"""
-    if not DOWNLOAD_COMMENTS:
-        return
+def record_download(conn, channel_name, video_info, downloaded_file, is_short, index_data=None, type_source=None):
+    """Write a finished download to the library index in a single transaction"""
+    meta = {
+        "video_id": video_info.get('id'),
+        "title": video_info.get('title'),
+        "channel": video_info.get('channel'),
+        "upload_date": video_info.get('upload_date'),
+        "duration": video_info.get('duration'),
+        "downloaded_at": int(time.time())
+    }
+    if index_data:
+        meta["comment_count"] = index_data.get("top_comments_downloaded", 0)
+        meta["reply_count"] = index_data.get("replies_downloaded", 0)
     
-    # Check if comments already exist and are recent (less than 7 days old)
-    top_dir = os.path.join(comments_dir, "top")
+    record = library_db.video_record(
+        channel_name,
+        "shorts" if is_short else "video",
+        os.path.basename(downloaded_file),
+        meta,
+        file_size=os.path.getsize(downloaded_file),
+        width=video_info.get('width'),
+        height=video_info.get('height'),
+        type_source=type_source,
+        folder=os.path.basename(os.path.dirname(downloaded_file))
+    )
+    library_db.upsert_video(conn, record)
+
+def is_throttle_error(error):
+    """True for the errors YouTube uses to push back: 403s, timeouts and dropped connections"""
+    error_str = str(error).lower()
+    return "403" in error_str or "forbidden" in error_str or "timeout" in error_str or "connection" in error_str or "read timed out" in error_str
+
+def is_forbidden(error):
+    error_str = str(error).lower()
+    return "403" in error_str or "forbidden" in error_str
+
+def acquire(limiter, url, stage):
+    """Take a request slot from limiter, counting the request and the wait against stage"""
+    metrics.count("requests", stage)
+    metrics.waited(stage, limiter.acquire(url))
+
+def comments_age(comments_dir):
+    """Seconds since a video's comments were fetched, or None if it has none yet"""
     meta_file = os.path.join(comments_dir, "meta.json")
+    if not comment_store.has_comments(comments_dir) or not os.path.exists(meta_file):
+        return None
+    with open(meta_file, 'r', encoding='utf-8') as f:
+        meta = json.load(f)
+    return int(time.time()) - meta.get('downloaded_at', 0)
+
+def download_comments(video_url, video_info, comments_dir, channel_name, limiter=None):
+    """Download comments for a video using yt-dlp
     
-    # Check if we should update comments
-    should_update = True
-    if os.path.exists(top_dir) and len(os.listdir(top_dir)) > 0 and os.path.exists(meta_file):
-        try:
-            with open(meta_file, 'r', encoding='utf-8') as f:
-                meta = json.load(f)
-                downloaded_at = meta.get('downloaded_at', 0)
-                # Update if comments are older than 7 days (604800 seconds)
-                age = int(time.time()) - downloaded_at
-                if age < 604800:  # 7 days
-                    print(f"Comments are recent ({age // 86400} days old), skipping: {video_info.get('title')}")
-                    should_update = False
-                else:
-                    print(f"Comments are old ({age // 86400} days old), updating: {video_info.get('title')}")
-                    # Delete old comments to fetch new ones
-                    shutil.rmtree(comments_dir)
-        except Exception as e:
-            logging.error(f"Error checking comment age: {e}")
+    Returns the saved index data, or None if nothing was downloaded.
+    """
+    if not DOWNLOAD_COMMENTS:
+        return None
     
-    if not should_update:
-        return
+    # Check if comments already exist and are recent
+    try:
+        age = comments_age(comments_dir)
+    except Exception as e:
+        logging.error(f"Error checking comment age: {e}")
+        age = None
+    if age is not None:
+        if age < COMMENTS_MAX_AGE:
+            print(f"Comments are recent ({age // 86400} days old), skipping: {video_info.get('title')}")
+            return None
+        # The new comments replace the old ones file by file, each by rename
+        print(f"Comments are old ({age // 86400} days old), updating: {video_info.get('title')}")
     
     print(f"Downloading comments for: {video_info.get('title')}")
     
-    create_comment_structure(comments_dir)
+    os.makedirs(comments_dir, exist_ok=True)
     save_meta_json(comments_dir, video_info)
     
     index_data = load_index_json(comments_dir)
@@ -229,34 +405,20 @@ def download_comments(video_url, video_info, comments_dir, channel_name):
     try:
         while retry_count < max_retries:
             try:
-                # Get comments using yt-dlp's YouTube extractor
-                # Note: Use max-comments (with hyphen) to fetch all reply pages
-                # Format: max-comments,max-parents,max-replies,max-replies-per-thread
-                # Comments have 'parent' field that indicates if they're replies (parent != 'root')
-                # Use comment_sort: top to fetch most liked comments (not newest)
-                # In Python dict API, use underscores not hyphens for parameter names
-                ydl_opts_comments = {
-                    "skip_download": True,
-                    "quiet": True,
-                    "no_warnings": True,
-                    "getcomments": True,
-                    "extractor_args": {
-                        "youtube": {
-                            "max-comments": f"{MAX_COMMENTS},all,{MAX_REPLIES},10",
-                            "comment-sort": "top"  # Use hyphen in extractor args key
-                        }
-                    }
-                }
+                if limiter is not None:
+                    acquire(limiter, video_url, "comments")
                 
-                with YoutubeDL(ydl_opts_comments) as ydl:
+                with ydl_pool.use("comments") as ydl:
                     video_info_with_comments = ydl.extract_info(video_url, download=False)
+                    if limiter is not None:
+                        limiter.success(video_url)
                     
                     comments = video_info_with_comments.get('comments', [])
                     
                     if not comments:
                         print(f"No comments available for: {video_info.get('title')}")
                         save_index_json(comments_dir, index_data)
-                        return
+                        return index_data
                     
                     # Separate top-level comments from replies using 'parent' field
                     # Top-level: parent == 'root' or parent is None
@@ -279,8 +441,10 @@ def download_comments(video_url, video_info, comments_dir, channel_name):
                     # Limit top-level comments to MAX_COMMENTS
                     top_level_comments = top_level_comments[:MAX_COMMENTS]
                     
-                    comment_index = index_data.get("top_comments_downloaded", 0)
-                    replies_downloaded = index_data.get("replies_downloaded", 0)
+                    # Every fetch rewrites the whole comments file, so counts start over
+                    comment_index = 0
+                    replies_downloaded = 0
+                    threads = []
                     
                     for comment in top_level_comments:
                         # Save top-level comment
@@ -292,13 +456,12 @@ def download_comments(video_url, video_info, comments_dir, channel_name):
                             "likes": comment.get('like_count', 0)
                         }
                         
-                        save_comment(comments_dir, comment_index + 1, comment_data)
-                        
                         # Get replies for this comment (limited to MAX_REPLIES)
                         comment_id = comment.get('id')
                         replies = replies_by_parent.get(comment_id, [])[:MAX_REPLIES]
                         
-                        for reply_index, reply in enumerate(replies):
+                        reply_data_list = []
+                        for reply in replies:
                             reply_data = {
                                 "id": reply.get('id'),
                                 "author": reply.get('author'),
@@ -306,12 +469,15 @@ def download_comments(video_url, video_info, comments_dir, channel_name):
                                 "text": reply.get('text'),
                                 "likes": reply.get('like_count', 0)
                             }
-                            
-                            save_reply(comments_dir, comment_index + 1, reply_index + 1, reply_data)
+                            reply_data_list.append(reply_data)
                             replies_downloaded += 1
                         
+                        threads.append((comment_data, reply_data_list))
                         comment_index += 1
                     
+                    # Everything goes to disk in one buffered write
+                    save_comments(comments_dir, threads)
+                    
                     # Update index data
                     index_data["top_comments_downloaded"] = comment_index
                     index_data["replies_downloaded"] = replies_downloaded
@@ -319,324 +485,814 @@ def download_comments(video_url, video_info, comments_dir, channel_name):
                     
                     save_index_json(comments_dir, index_data)
                     print(f"Downloaded {comment_index} top-level comments with {replies_downloaded} replies")
-                    return
+                    return index_data
                 
             except Exception as e:
                 retry_count += 1
                 error_msg = f"Failed to download comments (attempt {retry_count}/{max_retries}): {e}"
                 print(error_msg)
                 logging.error(error_msg)
+                if is_forbidden(e):
+                    metrics.count("http_403", "comments")
                 if retry_count < max_retries:
+                    metrics.count("retries", "comments")
+                if limiter is not None:
+                    # The shared bucket paces the retry; only slow everyone down if YouTube pushed back
+                    if is_throttle_error(e):
+                        limiter.backoff(video_url)
+                elif retry_count < max_retries:
                     time.sleep(1)  # Wait before retry
+                    metrics.waited("comments", 1)
                 continue
         
         error_msg = f"Skipping comments after {max_retries} failed attempts"
         print(error_msg)
         logging.error(error_msg)
+        metrics.count("skips", "comments_failed")
     
     except Exception as e:
         error_msg = f"Error downloading comments: {e}"
         print(error_msg)
         logging.error(error_msg)
         print(f"Skipping comments for this video")
+    
+    return None
 
-def download_videos():
+_thread_state = threading.local()
+_connections = []
+_connections_lock = threading.Lock()
 
-    with open("channels.json", "r") as f:
-        channels = json.load(f)
+def get_conn():
+    """Library index connection for the current worker thread"""
+    conn = getattr(_thread_state, "conn", None)
+    if conn is None:
+        # Only used by this thread; closed from the main thread once the pool has shut down
+        conn = library_db.connect(VIDEOS_DIR, check_same_thread=False)
+        _thread_state.conn = conn
+        with _connections_lock:
+            _connections.append(conn)
+    return conn
 
-    for channel in channels:
-        channel_name = channel["channel_name"]
-        video_count = channel["video_count"]
+def close_connections():
+    with _connections_lock:
+        for conn in _connections:
+            conn.close()
+        _connections.clear()
+    _thread_state.conn = None
+
+class ChannelRun:
+    """State shared by the concurrent jobs of one channel"""
+    
+    def __init__(self, channel, order=RETENTION_ORDER):
+        self.channel_name = channel["channel_name"]
+        self.video_count = channel["video_count"]
+        # Optional per-channel size cap, on top of video_count
+        self.max_bytes = int(channel["max_size_gb"] * 1e9) if channel.get("max_size_gb") else None
+        self.order = channel.get("order") or order
+        self.storage = None  # Shared retention.StorageManager when there is a disk budget
+        self.comments = None  # Shared CommentQueue
+        self.videos_dir = f"{VIDEOS_DIR}/{self.channel_name}/videos"
+        self.shorts_dir = f"{VIDEOS_DIR}/{self.channel_name}/shorts"
+        self.comments_dir = f"{VIDEOS_DIR}/{self.channel_name}/comments"
+        self.downloaded = {}
+        self.known_ids = set()
+        self.entries = iter([])
+        self.downloaded_count = 0
+        self.known_count = 0
+        self.in_flight = 0
+        self.failed_count = 0
+        self.lock = threading.Lock()
         
-        # Try both URL formats - newer @ format and older /c/ format as fallback
-        urls_to_try = [
-            f"https://www.youtube.com/@{channel_name}/videos",
-            f"https://www.youtube.com/c/{channel_name}/videos",
-        ]
+        # Sync cursor: where the last run got to, and what this run saw
+        self.sync = None
+        self.channel_id = None
+        self.feed_signature = None
+        self.base_url = None  # URL form the channel was listed with
+        self.newest_entries = {}  # Tab -> newest entry listed on it
+        self.walk_complete = False  # Walk of every tab reached known content or the end of the tab
+        self.resumed_ids = set()  # Unfinished jobs picked up from the journal
+        self.short_ids = None  # IDs on the channel's shorts tab, when it was listed
+    
+    def claim_entries(self):
+        """Take playlist entries for every free download slot of this channel
         
-        # Create directory structure
-        videos_dir = f"videos/{channel_name}/videos"
-        shorts_dir = f"videos/{channel_name}/shorts"
-        comments_dir = f"videos/{channel_name}/comments"
-        os.makedirs(videos_dir, exist_ok=True)
-        os.makedirs(shorts_dir, exist_ok=True)
-        os.makedirs(comments_dir, exist_ok=True)
-
-        # Get already downloaded videos
-        downloaded = get_downloaded_videos(videos_dir, shorts_dir)
-        print(f"Already downloaded for {channel_name}: {len(downloaded)} videos")
+        Entries we already own fill their slot without any network call, so
+        a re-run on an up-to-date channel queues no per-video work at all.
+        """
+        claimed = []
+        with self.lock:
+            while self.downloaded_count + self.known_count + self.in_flight < self.video_count:
+                entry = next(self.entries, None)
+                if entry is None:
+                    break
+                video_id = entry_video_id(entry)
+                if not video_id:
+                    print(f"Skipping entry without video ID: {entry}")
+                    continue
+                if video_id in self.known_ids:
+                    print(f"Already downloaded: [{video_id}]")
+                    self.known_count += 1
+                    continue
+                self.known_ids.add(video_id)
+                self.in_flight += 1
+                library_db.journal_stage(get_conn(), video_id, self.channel_name, "queued", compact_entry(entry))
+                claimed.append(entry)
+        return claimed
+    
+    def finish_entry(self, success):
+        with self.lock:
+            self.in_flight -= 1
+            if success:
+                self.downloaded_count += 1
+            else:
+                self.failed_count += 1
+            return self.downloaded_count
+    
+    def is_settled(self):
+        """True if a re-run with an unchanged feed would have nothing to do"""
+        if self.downloaded_count + self.known_count >= self.video_count:
+            return True
+        return self.walk_complete and self.failed_count == 0
+
+class CommentQueue:
+    """Comment fetches for every channel, on their own workers and request budget
+    
+    Downloads only queue their comments here, so a slow or throttled comment
+    extraction never holds up media. The most out of date comments go first,
+    and a new download (which has none) before any refresh.
+    """
+    
+    def __init__(self, workers=COMMENT_WORKERS, paused=False):
+        self.jobs = PriorityJobQueue(workers, "comments", paused)
+        self.limiter = RateLimiter(COMMENT_REQUESTS_PER_SECOND, COMMENT_RATE_BURST)
+        self.workers = self.jobs.workers
+    
+    def submit(self, run, video_id, video_info, age=None):
+        """Queue a video's comments; age is how old its stored comments are, None if there are none"""
+        video_url = f"https://www.youtube.com/watch?v={video_id}"
+        video_comments_dir = os.path.join(run.comments_dir, video_id)
+        priority = -age if age is not None else float("-inf")
+        self.jobs.submit(priority, comments_job, self.limiter, run, video_id, video_url, video_info, video_comments_dir)
+    
+    def queue_stale(self, run, max_age=COMMENTS_MAX_AGE):
+        """Queue every downloaded video of a channel whose comments are older than max_age; returns how many"""
+        queued = 0
+        for video_filename in run.downloaded:
+            video_id = library_db.parse_video_id(video_filename)
+            if video_id in run.resumed_ids:
+                continue
+            video_comments_dir = os.path.join(run.comments_dir, video_id)
+            try:
+                age = comments_age(video_comments_dir)
+                video_info = load_meta_info(video_comments_dir)
+            except Exception as e:
+                logging.error(f"Error checking comments of {video_filename}: {e}")
+                continue
+            # Videos without meta.json can't be fetched for; they were never recorded as downloads
+            if video_info is None or (age is not None and age < max_age):
+                continue
+            self.submit(run, video_id, video_info, age)
+            queued += 1
+        return queued
+    
+    def start(self):
+        self.jobs.start()
+    
+    def wait(self):
+        self.jobs.wait()
+    
+    def shutdown(self):
+        self.jobs.shutdown()
+
+def start_metrics(command):
+    """Fresh metrics for a run of command"""
+    global metrics
+    metrics = run_metrics.RunMetrics(command)
+
+def write_metrics():
+    """Export the run's metrics and print where its time went, next to the previous run of the same command"""
+    metrics.finish()
+    try:
+        previous = metrics.write(METRICS_FILE, RUN_HISTORY_FILE)
+    except OSError as e:
+        logging.error(f"Could not write run metrics: {e}")
+        previous = None
+    print(run_metrics.format_summary(metrics.summary(), previous))
+
+def download_videos(workers=WORKERS, disk_budget_gb=DISK_BUDGET_GB, order=None, comment_workers=COMMENT_WORKERS):
+    """Run every channel in channels.json through a shared worker pool and rate limiter"""
+    with open("channels.json", "r") as f:
+        channels = json.load(f)
+    
+    limiter = RateLimiter(REQUESTS_PER_SECOND, RATE_BURST)
+    scheduler = JobScheduler(workers)
+    comments = CommentQueue(comment_workers)
+    start_metrics("download")
+    start = time.time()
+    print(f"Syncing {len(channels)} channels with {scheduler.workers} workers "
+          f"({comments.workers} more for comments)")
+    
+    storage = None
+    if disk_budget_gb:
+        # Consulted before every download, evicting by score to stay under the budget
+        storage = retention.StorageManager(VIDEOS_DIR, int(disk_budget_gb * 1e9), order or DISK_BUDGET_ORDER,
+                                           get_conn())
+        print(f"Disk budget: {storage.used / 1e9:.2f} of {disk_budget_gb:.2f} GB used")
+    
+    try:
+        for channel in channels:
+            run = ChannelRun(channel, order or RETENTION_ORDER)
+            run.storage = storage
+            run.comments = comments
+            scheduler.add_group(run.channel_name, on_done=lambda run=run: finish_channel(run))
+            scheduler.submit(run.channel_name, list_channel, scheduler, limiter, run)
+        scheduler.wait()
+        # Only channel jobs queue comments, so once they are done this queue can only shrink
+        comments.wait()
+        if disk_budget_gb:
+            # Downloads can come out bigger than estimated
+            with metrics.stage("cleanup"):
+                retention.enforce_disk_budget(VIDEOS_DIR, int(disk_budget_gb * 1e9), order or DISK_BUDGET_ORDER,
+                                              get_conn())
+            print(f"Evicted {storage.evicted} videos to stay under the disk budget")
+    finally:
+        scheduler.shutdown()
+        comments.shutdown()
+        ydl_pool.close()
+        close_connections()
+    
+    print(f"Finished sync in {time.time() - start:.1f}s, rate limiter: {limiter.stats()}, "
+          f"comments: {comments.limiter.stats()}")
+    write_metrics()
+
+def refresh_comments(comment_workers=COMMENT_WORKERS, max_age_days=COMMENTS_MAX_AGE / 86400):
+    """Fetch comments again for every downloaded video whose comments are older than max_age_days; no downloads"""
+    with open("channels.json", "r") as f:
+        channels = json.load(f)
+    
+    # Every channel is queued before the first fetch, so the stalest comments library-wide go first
+    comments = CommentQueue(comment_workers, paused=True)
+    start_metrics("comments")
+    start = time.time()
+    queued = 0
+    try:
+        for channel in channels:
+            run = ChannelRun(channel)
+            run.downloaded = get_downloaded_videos(run.videos_dir, run.shorts_dir)
+            queued += comments.queue_stale(run, max_age_days * 86400)
+        print(f"Refreshing comments of {queued} videos with {comments.workers} workers")
+        comments.start()
+        comments.wait()
+    finally:
+        comments.shutdown()
+        ydl_pool.close()
+        close_connections()
+    
+    print(f"Finished comment refresh in {time.time() - start:.1f}s, rate limiter: {comments.limiter.stats()}")
+    write_metrics()
+
+def cleanup_library(disk_budget_gb=DISK_BUDGET_GB, order=None):
+    """Apply every channel's limits, then the disk budget, without downloading anything"""
+    with open("channels.json", "r") as f:
+        channels = json.load(f)
+    try:
+        for channel in channels:
+            run = ChannelRun(channel, order or RETENTION_ORDER)
+            cleanup_old_videos(run.channel_name, run.video_count, get_conn(), run.max_bytes, run.order)
+        if disk_budget_gb:
+            retention.enforce_disk_budget(VIDEOS_DIR, int(disk_budget_gb * 1e9), order or DISK_BUDGET_ORDER,
+                                          get_conn())
+    finally:
+        close_connections()
+
+def finish_channel(run):
+    """Runs once every job of a channel has finished"""
+    # Clean up old videos to maintain deque behavior
+    with metrics.stage("cleanup"):
+        removed = cleanup_old_videos(run.channel_name, run.video_count, get_conn(), run.max_bytes, run.order)
+    if run.storage is not None:
+        run.storage.forget(removed)
+    # Every job of the channel is done, so apart from comments still queued a journal row belongs to nothing
+    conn = get_conn()
+    for job in library_db.get_jobs(conn, run.channel_name):
+        if job["stage"] != "comments":
+            library_db.finish_job(conn, job["video_id"])
+    save_sync_state(run)
+    print(f"Completed {run.channel_name}: Downloaded {run.downloaded_count}/{run.video_count} videos")
+
+def save_sync_state(run):
+    """Move the channel's cursor to the newest upload seen; keep the feed signature only if nothing is left to do"""
+    conn = get_conn()
+    sync = run.sync or {}
+    newest_id = sync.get("newest_video_id")
+    newest_date = sync.get("newest_upload_date")
+    newest = run.newest_entries.get("videos")
+    if newest is not None:
+        newest_id = entry_video_id(newest)
+        newest_date = newest.get("upload_date") if isinstance(newest, dict) else None
+        if not newest_date:
+            video = library_db.get_video(conn, newest_id)
+            newest_date = video["upload_date"] if video else None
+    newest_short = run.newest_entries.get("shorts")
+    newest_short_id = entry_video_id(newest_short) if newest_short is not None else sync.get("newest_short_id")
+    feed_signature = None
+    if run.feed_signature and run.is_settled():
+        # Counted after cleanup, as the next run will see it
+        owned = len(get_downloaded_videos(run.videos_dir, run.shorts_dir))
+        feed_signature = sync_signature(run.feed_signature, run.video_count, owned)
+    library_db.save_channel_sync(conn, run.channel_name, run.channel_id, newest_id, newest_date, feed_signature,
+                                 newest_short_id, run.base_url or sync.get("base_url"))
+
+def fetch_feed(channel_id):
+    """Raw uploads feed XML of a channel"""
+    request = urllib.request.Request(FEED_URL.format(channel_id=channel_id), headers={"User-Agent": USER_AGENT})
+    with urllib.request.urlopen(request, timeout=30) as response:
+        return response.read().decode("utf-8", errors="replace")
+
+def sync_signature(feed_signature, video_count, owned):
+    """What a settled sync depends on: the uploads feed, video_count and how many of its videos are on disk
+    
+    Raising video_count or deleting videos by hand changes it, so the next
+    run walks the channel even though its feed is the same.
+    """
+    return f"{feed_signature}:{video_count}:{min(owned, video_count)}"
+
+def get_feed_signature(channel_id, limiter):
+    """Hash of the video IDs in a channel's uploads feed, or None if it couldn't be read"""
+    feed_url = FEED_URL.format(channel_id=channel_id)
+    try:
+        with metrics.stage("feed"):
+            acquire(limiter, feed_url, "feed")
+            video_ids = FEED_VIDEO_ID.findall(fetch_feed(channel_id))
+        limiter.success(feed_url)
+    except Exception as e:
+        logging.error(f"Could not read uploads feed {feed_url}: {e}")
+        return None
+    if not video_ids:
+        return None
+    return hashlib.sha1("\n".join(video_ids).encode()).hexdigest()
+
+def walk_playlist(entries, run, limit, tab="videos", new_count=0):
+    """Take newest-first flat entries of a channel tab, as compact records, up to content we already have
+    
+    Once the channel has its video_count, everything past the first video we
+    own (or past the newest one the last sync saw on this tab) is older than
+    what cleanup keeps, so the walk stops there and later pages are never
+    fetched. Otherwise it goes on for up to limit entries, like a first sync.
+    new_count carries the new uploads earlier tabs found; returns
+    (records, new_count, complete).
+    """
+    cursor = run.sync or {}
+    cursor_id = cursor.get(dict(CHANNEL_TABS)[tab])
+    # Only the videos tab's cursor has a date; shorts tab entries never carry one
+    cursor_date = cursor.get("newest_upload_date") if tab == "videos" else None
+    taken = []
+    for entry in entries:
+        video_id = entry_video_id(entry)
+        if not video_id:
+            continue
+        if tab not in run.newest_entries:
+            run.newest_entries[tab] = entry
+        upload_date = entry.get("upload_date") if isinstance(entry, dict) else None
+        known = video_id in run.known_ids or video_id == cursor_id
+        older = bool(upload_date and cursor_date and upload_date < cursor_date)
+        if (known or older) and len(run.downloaded) + new_count >= run.video_count:
+            print(f"Reached known content on the {tab} tab at [{video_id}] after {len(taken)} new entries")
+            return taken, new_count, True
+        taken.append(compact_entry(entry, tab))
+        if not known:
+            new_count += 1
+        if len(taken) >= limit:
+            return taken, new_count, False
+    return taken, new_count, True
+
+def channel_base_urls(run):
+    """URL forms to try for a channel, the one that listed it last time first"""
+    urls = [form.format(channel=run.channel_name) for form in CHANNEL_URL_FORMS]
+    cached = run.sync and run.sync.get("base_url")
+    if cached:
+        urls = [cached] + [url for url in urls if url != cached]
+    return urls
+
+def open_tab(ydl, url):
+    """Unprocessed listing of a channel tab: (info, entries), entries fetching playlist pages as it's read"""
+    info = ydl.extract_info(url, download=False, process=False)
+    if info and info.get("_type") in ("url", "url_transparent"):
+        info = ydl.extract_info(info["url"], download=False, process=False)
+    if not info:
+        # ignoreerrors turns a missing tab into None
+        return {}, iter([])
+    # Filter out None entries that might be from skipped/unavailable videos
+    return info, (e for e in info.get("entries") or [] if e is not None)
+
+def interleave(*tabs):
+    """Alternate the records of newest-first tabs, so neither crowds the other out of video_count"""
+    return [record for group in itertools.zip_longest(*tabs) for record in group if record is not None]
+
+def list_channel_tabs(run, limiter):
+    """Listing stage: walk the videos and shorts tabs in one pass; returns compact records, tabs interleaved
+    
+    Both tabs are read with one pooled YoutubeDL from the URL form that listed
+    the channel last time, so an up-to-date channel costs a page per tab and
+    the fallback form costs requests only when it's needed. A form is taken if
+    either tab lists anything, so shorts-only channels are found too. The
+    records carry what the listing knows (duration, dimensions, tab), which is
+    enough to queue, size and classify each download without asking YouTube
+    about it first.
+    """
+    channel_name = run.channel_name
+    urls_to_try = channel_base_urls(run)
+    # Walk more than video_count to account for skipped/failed videos
+    limit = run.video_count * LISTING_FACTOR
+    
+    for base_url in urls_to_try:
+        # Each tab is listed on its own: shorts-only channels have an empty (or no) videos tab
+        tabs = {}
+        new_count = 0
+        with ydl_pool.use("listing") as ydl:
+            for tab, _ in CHANNEL_TABS:
+                tab_url = f"{base_url}/{tab}"
+                try:
+                    acquire(limiter, tab_url, "listing")
+                    info, entries = open_tab(ydl, tab_url)
+                    records, new_count, complete = walk_playlist(entries, run, limit, tab, new_count)
+                except (DownloadError, ExtractorError) as e:
+                    # yt-dlp's way of saying a channel never posted to this tab; anything else may list next time
+                    missing = "does not have a" in str(e)
+                    print(f"No {tab} listed for {channel_name} at {tab_url}: {e}")
+                    if not missing:
+                        logging.error(f"DownloadError/ExtractorError trying {tab_url}: {e}")
+                    records, complete = [], missing
+                except Exception as e:
+                    logging.error(f"Error trying {tab_url}: {e}")
+                    records, complete = [], False
+                else:
+                    limiter.success(tab_url)
+                    run.channel_id = info.get("channel_id") or run.channel_id
+                tabs[tab] = (records, complete)
         
-        # Check for existing videos and update their comments if needed
-        if downloaded:
-            print(f"Checking for comment updates on {len(downloaded)} existing videos...")
-            for video_filename, (mtime, filepath) in downloaded.items():
-                # Extract video_id from filename: "Title [video_id]"
-                if '[' in video_filename and ']' in video_filename:
-                    video_id = video_filename.split('[')[-1].rstrip(']').strip()
-                    video_comments_dir = os.path.join(comments_dir, video_id)
-                    
-                    # Check if meta.json exists to get video info
-                    meta_file = os.path.join(video_comments_dir, "meta.json")
-                    if os.path.exists(meta_file):
-                        try:
-                            with open(meta_file, 'r', encoding='utf-8') as f:
-                                meta = json.load(f)
-                                # Construct video URL from video_id
-                                video_url = f"https://www.youtube.com/watch?v={video_id}"
-                                # Create a minimal video_info dict from meta
-                                video_info = {
-                                    'id': meta.get('video_id'),
-                                    'title': meta.get('title'),
-                                    'channel': meta.get('channel'),
-                                    'upload_date': meta.get('upload_date'),
-                                    'duration': meta.get('duration'),
-                                    'comments': meta.get('comment_count_estimated')
-                                }
-                                # Try to update comments (will skip if recent)
-                                download_comments(video_url, video_info, video_comments_dir, channel_name)
-                        except Exception as e:
-                            logging.error(f"Error updating comments for {video_filename}: {e}")
+        # A form that listed nothing on either tab is the wrong one (or a private channel)
+        if not any(records for records, _ in tabs.values()) and not any(tab in run.newest_entries for tab in tabs):
+            continue
         
-        # Skip this channel if we already have enough videos
-        if len(downloaded) >= video_count:
-            print(f"Already have {len(downloaded)} videos (requested: {video_count}). Skipping {channel_name}.")
+        videos, videos_complete = tabs["videos"]
+        shorts, shorts_complete = tabs["shorts"]
+        run.base_url = base_url
+        run.walk_complete = videos_complete and shorts_complete
+        run.short_ids = {record["id"] for record in shorts}
+        print(f"Found {len(videos)} videos and {len(shorts)} shorts new or unclaimed using {base_url}")
+        return interleave(videos, shorts)
+    
+    # If still no entries found, show warning and skip
+    error_msg = f"Warning: No videos found in {channel_name}. Could not fetch from any URL format. Tried: {', '.join(urls_to_try)}"
+    print(error_msg)
+    logging.error(error_msg)
+    print(f"Skipping {channel_name} - Please check if the channel is public or if the channel name is correct.")
+    return []
+
+def list_channel(scheduler, limiter, run):
+    """First job of a channel: queue comment refreshes, list the playlist and queue downloads"""
+    channel_name = run.channel_name
+    
+    # Create directory structure
+    os.makedirs(run.videos_dir, exist_ok=True)
+    os.makedirs(run.shorts_dir, exist_ok=True)
+    os.makedirs(run.comments_dir, exist_ok=True)
+
+    # Get already downloaded videos
+    run.downloaded = get_downloaded_videos(run.videos_dir, run.shorts_dir)
+    run.known_ids = get_known_video_ids(run.downloaded)
+    print(f"Already downloaded for {channel_name}: {len(run.downloaded)} videos")
+    
+    # Finish whatever a killed run left half done before anything new
+    resumed = resume_jobs(scheduler, limiter, run)
+    
+    # Stale comments of existing videos go to the comment queue, most out of date first
+    if run.downloaded and DOWNLOAD_COMMENTS:
+        queued = run.comments.queue_stale(run)
+        print(f"Queued comment updates for {queued} of {len(run.downloaded)} existing videos")
+    
+    # Skip the walk if neither the channel's uploads feed nor what we want of it changed since the last settled sync
+    entries = None
+    run.sync = library_db.get_channel_sync(get_conn(), channel_name)
+    run.channel_id = run.sync and run.sync["channel_id"]
+    if run.channel_id:
+        run.feed_signature = get_feed_signature(run.channel_id, limiter)
+        if run.feed_signature and (sync_signature(run.feed_signature, run.video_count, len(run.downloaded))
+                                   == run.sync["feed_signature"]):
+            print(f"No new uploads on {channel_name} since the last sync. Skipping {channel_name}.")
+            run.walk_complete = True
+            entries = []
+    
+    if entries is None:
+        with metrics.stage("listing"):
+            entries = list_channel_tabs(run, limiter)
+    # Resumed downloads go first; the walk may list them again
+    entries = resumed + [entry for entry in entries if entry_video_id(entry) not in run.resumed_ids]
+    run.entries = iter(entries)
+    for entry in run.claim_entries():
+        scheduler.submit(channel_name, entry_job, scheduler, limiter, run, entry)
+
+def comments_job(limiter, run, video_id, video_url, video_info, video_comments_dir):
+    """Fetch comments for one video and record the counts in the library index"""
+    # The queue runs behind the channel, whose cleanup may have removed the video meanwhile
+    if not os.path.isdir(video_comments_dir):
+        library_db.finish_job(get_conn(), video_id)
+        return
+    with metrics.stage("comments"):
+        index_data = download_comments(video_url, video_info, video_comments_dir, run.channel_name, limiter)
+    if index_data:
+        library_db.update_comment_counts(
+            get_conn(), video_id,
+            index_data.get("top_comments_downloaded", 0),
+            index_data.get("replies_downloaded", 0)
+        )
+    # Last stage of a download (a no-op for refreshes, which aren't journaled)
+    library_db.finish_job(get_conn(), video_id)
+
+def thumbnail_job(scheduler, limiter, run, video_id, video_info, downloaded_file):
+    """Store a downloaded video's thumbnails, then queue its comments"""
+    # Thumbnails are made here so the backend never has to decode video for a card
+    with metrics.stage("thumbnail"):
+        if not save_thumbnails(video_info, os.path.dirname(downloaded_file), video_id, downloaded_file):
+            logging.error(f"Could not save thumbnail for {video_info.get('title')} [{video_id}]")
+    sizes = thumbnails.thumbnail_sizes(VIDEOS_DIR, video_id)
+    library_db.track_files(get_conn(), run.channel_name, video_id, "thumbnails", sizes)
+    metrics.count("bytes", "thumbnails", sum(sizes.values()))
+    
+    # Comments go to their own queue so this worker can move on to the next download
+    library_db.journal_stage(get_conn(), video_id, run.channel_name, "comments")
+    run.comments.submit(run, video_id, video_info)
+
+def resume_jobs(scheduler, limiter, run):
+    """Pick up the channel's jobs a killed run left in the journal; returns entries that still need media
+    
+    Jobs past the media stage continue with their thumbnail or comments.
+    Earlier ones go back through the normal download path with the journal's
+    entry, where yt-dlp continues the .part file.
+    """
+    entries = []
+    conn = get_conn()
+    on_disk = {library_db.parse_video_id(filename): filepath for filename, (mtime, filepath) in run.downloaded.items()}
+    for job in library_db.get_jobs(conn, run.channel_name):
+        video_id = job["video_id"]
+        stage = job["stage"]
+        media_file = job["media_file"]
+        if stage == "media" and job["entry"] and video_id in on_disk:
+            # Killed between the media landing and its record; the journal's entry stands in for full info
+            media_file = on_disk[video_id]
+            video_info = job["entry"]
+            video_comments_dir = os.path.join(run.comments_dir, video_id)
+            os.makedirs(video_comments_dir, exist_ok=True)
+            save_meta_json(video_comments_dir, video_info)
+            is_short = os.path.dirname(media_file) == os.path.normpath(run.shorts_dir)
+            record_download(conn, run.channel_name, video_info, media_file, is_short, type_source="folder")
+            library_db.journal_stage(conn, video_id, run.channel_name, "thumbnail", media_file=media_file)
+            stage = "thumbnail"
+        if stage in ("thumbnail", "comments") and media_file and os.path.exists(media_file):
+            video_comments_dir = os.path.join(run.comments_dir, video_id)
+            video_info = load_meta_info(video_comments_dir) or {"id": video_id}
+            print(f"Resuming [{video_id}] at {stage}")
+            if stage == "thumbnail":
+                scheduler.submit(run.channel_name, thumbnail_job, scheduler, limiter, run, video_id, video_info,
+                                 media_file)
+            else:
+                run.comments.submit(run, video_id, video_info)
+        elif stage in ("queued", "media") and job["entry"]:
+            print(f"Resuming [{video_id}] at {stage}")
+            entries.append(job["entry"])
+        else:
+            library_db.finish_job(conn, video_id)
             continue
+        run.resumed_ids.add(video_id)
+    return entries
 
-        # Extract playlist info first (without downloading)
-        # Fetch more than video_count to account for skipped/failed videos
-        ydl_opts_extract = {
-            "playlistend": video_count * 10,  # Fetch 10x to handle failures and skip private videos
-            "quiet": True,  # Suppress debug output during extraction
-            "no_warnings": True,
-            "extract_flat": "in_playlist",  # Extract playlist without fetching each video info
-            "skip_unavailable_videos": True,  # Try to skip unavailable videos
-            "ignoreerrors": True,  # Ignore individual video errors and continue
-            "http_headers": {
-                "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
-            },
-            "extractor_args": {
-                "youtube": {
-                    "player_client": ["android", "web"],
-                }
-            },
-        }
+def entry_job(scheduler, limiter, run, entry):
+    """Download one playlist entry, then refill the channel's free slot if it didn't count"""
+    success = False
+    try:
+        success = download_entry(scheduler, limiter, run, entry)
+    finally:
+        if not success:
+            # Failed or skipped; the next sync's playlist walk decides whether to try again
+            library_db.finish_job(get_conn(), entry_video_id(entry))
+        run.finish_entry(success)
+        for next_entry in run.claim_entries():
+            scheduler.submit(run.channel_name, entry_job, scheduler, limiter, run, next_entry)
+
+def estimate_download_size(info, storage):
+    """Expected bytes of a download, for reserving room under the disk budget"""
+    size = None
+    if isinstance(info, dict):
+        size = info.get("filesize") or info.get("filesize_approx")
+        if not size and info.get("duration"):
+            size = info["duration"] * ESTIMATED_BYTES_PER_SECOND
+    return int(size or storage.average_size())
+
+def download_entry(scheduler, limiter, run, entry):
+    """Download a single entry into videos/ or shorts/; returns True if a new file landed"""
+    # Some entries might be None if unavailable
+    if not entry:
+        return False
+
+    reservation = 0
+    downloaded_file = None
+    try:
+        video_id = entry_video_id(entry)
         
-        downloaded_count = 0
-        entries = []
-        url = None
+        # Construct the full URL if needed
+        video_url = f"https://www.youtube.com/watch?v={video_id}"
+        title = entry.get("title") if isinstance(entry, dict) else None
         
-        # Try each URL format until we get entries
-        for try_url in urls_to_try:
-            try:
-                with YoutubeDL(ydl_opts_extract) as ydl:
-                    info = ydl.extract_info(try_url, download=False)
-                    entries = info.get("entries", [])
-                    # Filter out None entries that might be from skipped/unavailable videos
-                    entries = [e for e in entries if e is not None]
-                    if entries:
-                        url = try_url
-                        print(f"Found {len(entries)} videos in playlist using {try_url}")
-                        break
-            except (DownloadError, ExtractorError) as e:
-                logging.error(f"DownloadError/ExtractorError trying {try_url}: {e}")
-                continue
-            except Exception as e:
-                logging.error(f"Error trying {try_url}: {e}")
-                continue
+        # The listing usually tells shorts apart already; if it can't, the download's own info or the file will
+        is_short, type_source = classify.classify(entry, run.short_ids)
+        library_db.journal_stage(get_conn(), video_id, run.channel_name, "media")
+
+        # Skip live videos
+        live_info = entry if isinstance(entry, dict) else {}
+        if live_info.get("is_live") or live_info.get("live_status") in ("is_live", "upcoming"):
+            print(f"Skipping live video: {title} [{video_id}]")
+            metrics.count("skips", "live")
+            return False
         
-        # If still no entries found, show warning and skip
-        if not entries:
-            error_msg = f"Warning: No videos found in {channel_name}. Could not fetch from any URL format. Tried: {', '.join(urls_to_try)}"
-            print(error_msg)
-            logging.error(error_msg)
-            print(f"Skipping {channel_name} - Please check if the channel is public or if the channel name is correct.")
-            continue  # Skip to next channel
+        if is_short:
+            print(f"ITS A SHORTS: {title} [{video_id}]")
+            output_dir = run.shorts_dir
+        else:
+            output_dir = run.videos_dir
         
-        # Process each entry separately with error handling
-        for entry in entries:
-            # Stop if we've downloaded enough videos
-            if downloaded_count >= video_count:
-                break
-            
-            # Some entries might be None if unavailable
-            if not entry:
-                continue
+        # Make room under the disk budget before fetching anything
+        if run.storage is not None:
+            size = estimate_download_size(entry if isinstance(entry, dict) else {}, run.storage)
+            if not run.storage.reserve(size, get_conn()):
+                print(f"Skipping {title} [{video_id}]: it doesn't fit in the disk budget")
+                metrics.count("skips", "disk_budget")
+                return False
+            reservation = size
 
+        # Try downloading with retries for network timeouts and 403 errors
+        download_attempts = 0
+        max_download_attempts = 5
+        download_success = False
+        
+        while download_attempts < max_download_attempts and not download_success:
             try:
-                # Handle both flat and full entry formats
-                video_id = None
-                if isinstance(entry, dict) and "id" in entry:
-                    video_id = entry["id"]
-                elif isinstance(entry, dict) and "webpage_url" in entry:
-                    video_id = entry["webpage_url"].split("v=")[-1]
-                else:
-                    # If it's a string (just video ID)
-                    video_id = str(entry)
-                
-                if not video_id:
-                    print(f"Skipping entry without video ID: {entry}")
-                    continue
-                
-                # Create a fresh YoutubeDL instance for each video to avoid context issues
-                ydl_opts_info = {
-                    "quiet": True,
-                    "no_warnings": True,
-                    "http_headers": {
-                        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
-                    },
-                    "extractor_args": {
-                        "youtube": {
-                            "player_client": ["android", "web"],
-                        }
-                    },
-                }
-                
-                # Construct the full URL if needed
-                video_url = f"https://www.youtube.com/watch?v={video_id}"
-                
-                with YoutubeDL(ydl_opts_info) as ydl:
-                    # Extract full info for each video to get dimensions
-                    video_info = ydl.extract_info(video_url, download=False)
-                    w = video_info.get('width')
-                    h = video_info.get('height')
-                    title = video_info.get('title')
-                    video_id = video_info.get('id')
-
-                    print(f"{title} [{video_id}] Dimensions: {w} x {h}")
-
-                    # Skip if already downloaded
-                    if title in downloaded:
-                        print(f"Already downloaded: {title} [{video_id}]")
-                        continue
-
-                    # Skip live videos
-                    if video_info.get("is_live") or video_info.get("live_status") in ("is_live", "upcoming"):
-                        print(f"Skipping live video: {title} [{video_id}]")
-                        continue
-
-                    # Determine if it's a short based on aspect ratio
-                    is_short = w and h and h > w
-                    
-                    if is_short:
-                        print(f"ITS A SHORTS: {title} [{video_id}]")
-                        output_dir = shorts_dir
+                with metrics.stage("media"):
+                    acquire(limiter, video_url, "media")
+                    # Download the video to the appropriate folder
+                    with ydl_pool.use("download", paths={"home": output_dir}) as ydl_download:
+                        # The download extracts full info anyway, so there is no separate info request
+                        downloaded_info = ydl_download.extract_info(video_url, download=True)
+                video_info = ydl_download.sanitize_info(downloaded_info)
+                title = video_info.get('title')
+                video_id = video_info.get('id') or video_id
+                download_success = True
+                limiter.success(video_url)
+            except Exception as download_error:
+                download_attempts += 1
+                if is_forbidden(download_error):
+                    metrics.count("http_403", "media")
+                if is_throttle_error(download_error):
+                    if download_attempts < max_download_attempts:
+                        metrics.count("retries", "media")
+                        cooldown = 10 + (download_attempts * 5)  # Progressive backoff: 15, 20, 25, 30, 35 seconds
+                        print(f"Rate limited (403 Forbidden). Backing off all workers for {cooldown}s before retry... (attempt {download_attempts}/{max_download_attempts})")
+                        limiter.backoff(video_url, cooldown)
                     else:
-                        output_dir = videos_dir
-
-                    # Download the video to the appropriate folder with retry logic for network timeouts
-                    ytdl_opts_download = {
-                        "format": f"best[height<={QUALITY}]",  # Fallback to best available format
-                        "outtmpl": f"{output_dir}/%(title)s [%(id)s].%(ext)s",
-                        "socket_timeout": 30,
-                        "fragment_retries": 10,
-                        "skip_unavailable_fragments": True,
-                        "http_headers": {
-                            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
-                        },
-                        "quiet": False,  # Show output for debugging
-                        "no_warnings": False,
-                        "retries": 10,  # Retry failed requests
-                        "extractor_args": {
-                            "youtube": {
-                                "player_client": ["android", "web"],
-                            }
-                        },
-                    }
-                    
-                    # Try downloading with retries for network timeouts and 403 errors
-                    download_attempts = 0
-                    max_download_attempts = 5
-                    download_success = False
-                    
-                    while download_attempts < max_download_attempts and not download_success:
-                        try:
-                            with YoutubeDL(ytdl_opts_download) as ydl_download:
-                                ydl_download.download([video_info["webpage_url"]])
-                            download_success = True
-                        except Exception as download_error:
-                            download_attempts += 1
-                            error_str = str(download_error).lower()
-                            if "403" in error_str or "forbidden" in error_str or "timeout" in error_str or "connection" in error_str or "read timed out" in error_str:
-                                if download_attempts < max_download_attempts:
-                                    wait_time = 10 + (download_attempts * 5)  # Progressive backoff: 15, 20, 25, 30, 35 seconds
-                                    print(f"Rate limited (403 Forbidden). Waiting {wait_time}s before retry... (attempt {download_attempts}/{max_download_attempts})")
-                                    time.sleep(wait_time)
-                                else:
-                                    error_msg = f"Max retries reached for: {title}"
-                                    print(error_msg)
-                                    logging.error(error_msg)
-                                    raise download_error
-                            else:
-                                logging.error(f"Download error for {title}: {download_error}")
-                                raise download_error
-                    
-                    # Verify download was successful by checking if file exists
-                    # Use video_id in search since title might have encoding issues
-                    downloaded_file = None
-                    try:
-                        for file in os.listdir(output_dir):
-                            if video_id in file and any(file.endswith(ext) for ext in ['.mp4', '.mkv', '.webm', '.mov', '.flv', '.m4a']):
-                                downloaded_file = os.path.join(output_dir, file)
-                                break
-                    except Exception as e:
-                        error_msg = f"Warning: Error checking for downloaded file: {str(e)[:100]}"
-                        print(error_msg)
-                        logging.error(error_msg)
-                        continue
-                    
-                    if not downloaded_file:
-                        error_msg = f"Warning: Download completed but file not found for: {title} [{video_id}]"
-                        print(error_msg)
-                        logging.error(error_msg)
-                        continue
-                    
-                    # Verify file is not empty
-                    if os.path.getsize(downloaded_file) == 0:
-                        error_msg = f"Warning: Downloaded file is empty for: {title}"
+                        error_msg = f"Max retries reached for: {title}"
                         print(error_msg)
                         logging.error(error_msg)
-                        os.remove(downloaded_file)
-                        continue
-                    
-                    downloaded_count += 1
-                    print(f"Downloaded {downloaded_count}/{video_count}: {title} [{video_id}]")
-                    
-                    # Download comments for this video
-                    video_comments_dir = os.path.join(comments_dir, video_id)
-                    download_comments(video_info["webpage_url"], video_info, video_comments_dir, channel_name)
-                    
-                    # Add delay between downloads to avoid rate limiting
-                    if downloaded_count < video_count:
-                        sleep_time = random.uniform(10, 20)
-                        print(f"Waiting {sleep_time:.1f} seconds before next download to prevent rate limiting...")
-                        time.sleep(sleep_time)
-                    
-            except (DownloadError, ExtractorError) as e:
-                error_msg = str(e).lower()
-                if "private" in error_msg or "unavailable" in error_msg or "sign in" in error_msg or "empty" in error_msg:
-                    log_msg = f"Skipping private/unavailable/empty video: {str(e)[:100]}"
-                    print(f"Skipping private/unavailable/empty video")
-                    logging.error(log_msg)
+                        raise download_error
                 else:
-                    log_msg = f"Skipping video due to DownloadError/ExtractorError: {str(e)[:100]}"
-                    print(log_msg)
-                    logging.error(log_msg)
-                # Continue to next video on any error
-                continue
-            except Exception as e:
-                log_msg = f"Skipping video due to unexpected error: {str(e)[:100]}"
-                print(log_msg)
-                logging.error(log_msg)
-                # Continue to next video on any error
-                continue
+                    logging.error(f"Download error for {title}: {download_error}")
+                    raise download_error
         
-        # Clean up old videos to maintain deque behavior
-        cleanup_old_videos(videos_dir, shorts_dir, video_count, comments_dir)
-        print(f"Completed {channel_name}: Downloaded {downloaded_count}/{video_count} videos")
+        # Verify download was successful by checking if file exists
+        # Use video_id in search since title might have encoding issues
+        downloaded_file = None
+        try:
+            for file in os.listdir(output_dir):
+                if video_id in file and any(file.endswith(ext) for ext in ['.mp4', '.mkv', '.webm', '.mov', '.flv', '.m4a']):
+                    downloaded_file = os.path.join(output_dir, file)
+                    break
+        except Exception as e:
+            error_msg = f"Warning: Error checking for downloaded file: {str(e)[:100]}"
+            print(error_msg)
+            logging.error(error_msg)
+            metrics.count("skips", "missing_file")
+            return False
+        
+        if not downloaded_file:
+            error_msg = f"Warning: Download completed but file not found for: {title} [{video_id}]"
+            print(error_msg)
+            logging.error(error_msg)
+            metrics.count("skips", "missing_file")
+            return False
+        
+        # Verify file is not empty
+        media_size = os.path.getsize(downloaded_file)
+        if media_size == 0:
+            error_msg = f"Warning: Downloaded file is empty for: {title}"
+            print(error_msg)
+            logging.error(error_msg)
+            os.remove(downloaded_file)
+            metrics.count("skips", "empty_file")
+            return False
+        
+        print(f"Downloaded: {title} [{video_id}] ({run.channel_name})")
+        metrics.count("bytes", "media", media_size)
+        
+        if is_short is None:
+            # Classification stage: the dimensions that came with the download, else ffprobe of the file
+            with metrics.stage("classify"):
+                is_short, type_source = classify.classify(entry, run.short_ids, video_info, downloaded_file)
+            if is_short:
+                print(f"ITS A SHORTS: {title} [{video_id}]")
+                shorts_file = os.path.join(run.shorts_dir, os.path.basename(downloaded_file))
+                os.replace(downloaded_file, shorts_file)
+                downloaded_file = shorts_file
+            elif is_short is None:
+                print(f"Could not tell whether {title} [{video_id}] is a short; keeping it with the videos")
+                is_short, type_source = False, "folder"
+        
+        # Record the finished download in the library index; comment counts follow in their own job
+        video_comments_dir = os.path.join(run.comments_dir, video_id)
+        os.makedirs(video_comments_dir, exist_ok=True)
+        save_meta_json(video_comments_dir, video_info)
+        record_download(get_conn(), run.channel_name, video_info, downloaded_file, is_short, type_source=type_source)
+        metrics.count("downloads", "shorts" if is_short else "video")
+        library_db.journal_stage(get_conn(), video_id, run.channel_name, "thumbnail", media_file=downloaded_file)
+        
+        thumbnail_job(scheduler, limiter, run, video_id, video_info, downloaded_file)
+        return True
+            
+    except (DownloadError, ExtractorError) as e:
+        error_msg = str(e).lower()
+        if "private" in error_msg or "unavailable" in error_msg or "sign in" in error_msg or "empty" in error_msg:
+            log_msg = f"Skipping private/unavailable/empty video: {str(e)[:100]}"
+            print(f"Skipping private/unavailable/empty video")
+            logging.error(log_msg)
+            metrics.count("skips", "unavailable")
+        else:
+            log_msg = f"Skipping video due to DownloadError/ExtractorError: {str(e)[:100]}"
+            print(log_msg)
+            logging.error(log_msg)
+            metrics.count("skips", "download_error")
+        return False
+    except Exception as e:
+        log_msg = f"Skipping video due to unexpected error: {str(e)[:100]}"
+        print(log_msg)
+        logging.error(log_msg)
+        metrics.count("skips", "error")
+        return False
+    finally:
+        if reservation:
+            run.storage.release(reservation, downloaded_file)
 
 def main():
-    download_videos()
+    parser = argparse.ArgumentParser(description="Download videos from the channels in channels.json")
+    parser.add_argument("--workers", type=int, default=WORKERS, help=f"Concurrent download jobs (default: {WORKERS})")
+    parser.add_argument("--disk-budget", type=float, default=DISK_BUDGET_GB, metavar="GB",
+                        help="Remove videos across all channels until their media fits in GB")
+    parser.add_argument("--comment-workers", type=int, default=COMMENT_WORKERS,
+                        help=f"Concurrent comment fetches, separate from --workers (default: {COMMENT_WORKERS})")
+    parser.add_argument("--order", choices=retention.ORDERS,
+                        help=f"Which videos are removed first (default: {RETENTION_ORDER} per channel, "
+                             f"{DISK_BUDGET_ORDER} for the disk budget)")
+    subparsers = parser.add_subparsers(dest="command")
+    subparsers.add_parser("download", help="Download new videos (default)")
+    subparsers.add_parser("rebuild-index", help=f"Rebuild {VIDEOS_DIR}/{library_db.DB_FILENAME} from the existing {VIDEOS_DIR}/ tree")
+    subparsers.add_parser("migrate-comments", help=f"Pack per-comment JSON files into one {comment_store.COMMENTS_FILE} per video")
+    subparsers.add_parser("cleanup", help="Apply video_count, max_size_gb and --disk-budget without downloading")
+    reclassify_parser = subparsers.add_parser("reclassify", help="Fix videos filed as the wrong type (short or video), offline")
+    reclassify_parser.add_argument("--processes", type=int, default=classify.WORKERS,
+                                   help=f"ffprobe processes to run at once (default: {classify.WORKERS})")
+    reclassify_parser.add_argument("--probe", action="store_true",
+                                   help="Probe every file instead of trusting the dimensions in the index")
+    reclassify_parser.add_argument("--dry-run", action="store_true", help="Only list what would change")
+    comments_parser = subparsers.add_parser("comments", help="Refresh stale comments of every channel without downloading")
+    comments_parser.add_argument("--max-age", type=float, default=COMMENTS_MAX_AGE / 86400, metavar="DAYS",
+                                 help=f"Refresh comments older than this (default: {COMMENTS_MAX_AGE // 86400})")
+    thumbs_parser = subparsers.add_parser("generate-thumbnails", help="Generate missing or outdated thumbnails with ffmpeg")
+    thumbs_parser.add_argument("--processes", type=int, default=thumbnails.WORKERS,
+                               help=f"ffmpeg processes to run at once (default: {thumbnails.WORKERS})")
+    thumbs_parser.add_argument("--force", action="store_true", help="Regenerate thumbnails that are already up to date")
+    args = parser.parse_args()
+    
+    if args.command == "rebuild-index":
+        library_db.rebuild_index(VIDEOS_DIR)
+    elif args.command == "migrate-comments":
+        comment_store.migrate_library(VIDEOS_DIR)
+    elif args.command == "generate-thumbnails":
+        thumbnails.generate_thumbnails(VIDEOS_DIR, args.processes, args.force)
+    elif args.command == "cleanup":
+        cleanup_library(args.disk_budget, args.order)
+    elif args.command == "reclassify":
+        classify.reclassify_library(VIDEOS_DIR, args.processes, args.probe, args.dry_run)
+    elif args.command == "comments":
+        refresh_comments(args.comment_workers, args.max_age)
+    else:
+        download_videos(args.workers, args.disk_budget, args.order, args.comment_workers)
 
 if __name__ == "__main__":
     main()